@@ -38,10 +38,20 @@ __credits__ = '''Contributors:
 
 
 import os
+import json
+import hashlib
+import logging
 import tarfile
 import tempfile
+import threading
+from pathlib import Path
 
-from auditorium_scripts.frontend import FrontendBase
+from auditorium_scripts.frontend import FrontendBase, UPLOAD_CHUNK_SIZE
+
+
+LOG = logging.getLogger(__name__)
+DIGESTS_CACHE = Path.home() / '.cache' / 'openbach' / 'jobs_digests.json'
+_DIGESTS_LOCK = threading.Lock()
 
 
 class AddJob(FrontendBase):
@@ -58,12 +68,17 @@ class AddJob(FrontendBase):
         job_options.add_argument(
                 '-t', '--tarball', help='path to a .tar.gz file containing '
                 'the install and uninstall playbooks of the job')
+        self.parser.add_argument(
+                '-F', '--force', action='store_true',
+                help='upload the job even if the controller already holds '
+                'the same version of the files or tarball')
 
     def execute(self, show_response_content=True):
         job_name = self.args.job_name
         path = self.args.path
         files = self.args.files
         tarball = self.args.tarball
+        self.uploaded = True
 
         if path is not None:
             return self.request(
@@ -71,19 +86,127 @@ class AddJob(FrontendBase):
                     show_response_content=show_response_content)
 
         if files is not None:
-            os.chdir(os.path.expanduser(files))
-            with tempfile.NamedTemporaryFile(suffix='.tar.gz') as tar_path:
-                tarball = tar_path.name
-            with tarfile.open(tarball, mode='w:gz') as tar:
-                for filename in os.listdir('.'):
-                    tar.add(filename)
-
-        if tarball is not None:
-            with open(os.path.expanduser(tarball), 'rb') as tarball_file:
-                return self.request(
-                        'POST', 'job', name=job_name,
-                        files={'file': tarball_file},
-                        show_response_content=show_response_content)
+            folder = Path(files).expanduser()
+            digest = job_digest(folder)
+        else:
+            tarball = Path(tarball).expanduser()
+            digest = file_digest(tarball)
+
+        if not getattr(self.args, 'force', False):
+            response = self._unchanged_job(job_name, digest)
+            if response is not None:
+                LOG.info('Job %s is unchanged on the controller, skipping upload', job_name)
+                self.uploaded = False
+                return response
+
+        filename = '{}.tar.gz'.format(job_name)
+        with (package_job(folder) if files is not None else tarball.open('rb')) as content:
+            response = self.upload(
+                    'job', content, filename, name=job_name,
+                    show_response_content=show_response_content)
+        if response.ok:
+            description = self._job_description(job_name)
+            if description is not None:
+                self._store_digest(job_name, digest, description)
+        return response
+
+    def _job_description(self, job_name):
+        """Return the response holding the description of the job on
+        the controller and a digest of it; None if it does not exist.
+        """
+        response = self.request(
+                'GET', 'job/{}/'.format(job_name), type='json',
+                show_response_content=False, check_status=False)
+        if response.ok:
+            try:
+                content = response.json()
+            except ValueError:
+                return None
+            content = json.dumps(content, sort_keys=True).encode()
+            return response, hashlib.sha256(content).hexdigest()
+
+    def _unchanged_job(self, job_name, digest):
+        """Return the description of the job on the controller if it
+        was last uploaded from the same content, None otherwise.
+
+        The local cache only tells which content was last uploaded by
+        this machine: the job on the controller must also be described
+        the same way than right after this upload, so a job deleted or
+        modified since by other clients is uploaded again.
+        """
+        with _DIGESTS_LOCK:
+            digests = _read_digests()
+        cached = digests.get(self.base_url, {}).get(job_name)
+        if not isinstance(cached, dict) or cached.get('content') != digest:
+            return None
+
+        description = self._job_description(job_name)
+        if description is not None:
+            response, controller_digest = description
+            if controller_digest == cached.get('controller'):
+                return response
+
+    def _store_digest(self, job_name, digest, description):
+        _, controller_digest = description
+        with _DIGESTS_LOCK:
+            digests = _read_digests()
+            digests.setdefault(self.base_url, {})[job_name] = {
+                    'content': digest,
+                    'controller': controller_digest,
+            }
+            try:
+                DIGESTS_CACHE.parent.mkdir(parents=True, exist_ok=True)
+                with DIGESTS_CACHE.open('w') as cache:
+                    json.dump(digests, cache)
+            except OSError as error:
+                LOG.warning('Cannot store digest of job %s: %s', job_name, error)
+
+
+def job_digest(folder):
+    """Compute a digest of the content of a job folder: names,
+    permissions and content of every file it contains.
+    """
+    folder = Path(folder)
+    digest = hashlib.sha256()
+    for path in sorted(folder.rglob('*')):
+        if path.is_file():
+            digest.update(os.fsencode(path.relative_to(folder).as_posix()))
+            digest.update(b'\0%o\0' % (path.stat().st_mode & 0o777))
+            digest.update(path.read_bytes())
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """Compute the digest of the content of a file, chunk by chunk"""
+    digest = hashlib.sha256()
+    with Path(path).open('rb') as stream:
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def package_job(folder):
+    """Build the .tar.gz archive of the content of a job folder, as
+    expected by the controller, into a temporary file.
+
+    Return the file, rewound, ready to be uploaded.
+    """
+    folder = Path(folder)
+    archive = tempfile.TemporaryFile()
+    with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+        for path in sorted(folder.iterdir()):
+            tar.add(str(path), arcname=path.name)
+    archive.seek(0)
+    return archive
+
+
+def _read_digests():
+    try:
+        with DIGESTS_CACHE.open() as cache:
+            return json.load(cache)
+    except (OSError, ValueError):
+        return {}
 
 
 if __name__ == '__main__':
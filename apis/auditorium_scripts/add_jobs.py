@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them. It is
+# composed of an Auditorium (HMIs), a Controller, a Collector and multiple
+# Agents (one for each network entity that wants to be tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY, without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""Call the openbach-function add_job for every job of a folder tree"""
+
+
+__author__ = 'Viveris Technologies'
+__credits__ = '''Contributors:
+ * Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>
+'''
+
+
+import sys
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from auditorium_scripts.frontend import FrontendBase, ActionFailedError
+from auditorium_scripts.add_job import AddJob
+
+
+class AddJobs(FrontendBase):
+    def __init__(self):
+        super().__init__('OpenBACH — Add every Job of a folder tree on the Controller')
+        self.parser.add_argument(
+                'jobs_tree', nargs='+', type=Path,
+                help='path to a folder (on the local machine) to search '
+                'recursively for jobs (folders containing install and '
+                'uninstall playbooks and a files/<job_name>.yml description)')
+        self.parser.add_argument(
+                '-j', '--jobs', '--concurrency', type=int, default=4,
+                help='amount of jobs uploaded at the same time')
+        self.parser.add_argument(
+                '-F', '--force', action='store_true',
+                help='upload the jobs even if the controller already '
+                'holds the same version of their files')
+
+    def execute(self, show_response_content=True):
+        jobs = {}
+        for tree in self.args.jobs_tree:
+            for job_name, path in find_jobs(tree):
+                jobs.setdefault(job_name, path)
+
+        with ThreadPoolExecutor(max_workers=max(1, self.args.jobs)) as executor:
+            uploads = {
+                    job_name: executor.submit(self._add_job, job_name, path)
+                    for job_name, path in sorted(jobs.items())
+            }
+            results = {job_name: upload.result() for job_name, upload in uploads.items()}
+
+        uploaded = [name for name, (_, added, _) in results.items() if added]
+        failed = {name: response for name, (response, _, _) in results.items() if not response.ok}
+        if show_response_content:
+            print('{} jobs found: {} uploaded, {} unchanged, {} failed'.format(
+                len(results), len(uploaded) - len(failed),
+                len(results) - len(uploaded), len(failed)))
+            for name in uploaded:
+                if name not in failed:
+                    print('  added', name)
+        for name, response in failed.items():
+            print('Failed to add job {}: {}'.format(name, response.text), file=sys.stderr)
+        if failed:
+            raise ActionFailedError('{} job(s) could not be added'.format(len(failed)), None)
+
+        return [response for response, _, _ in results.values()]
+
+    def _add_job(self, job_name, path):
+        adder = self.share_state(AddJob)
+        adder.args.job_name = job_name
+        adder.args.path = None
+        adder.args.tarball = None
+        adder.args.files = str(path)
+        adder.args.force = self.args.force
+        response = adder.execute(False)
+        return response, adder.uploaded, path
+
+
+def find_jobs(tree):
+    """Generate the name and folder of each job found in the given tree"""
+    for install in sorted(Path(tree).glob('**/install_*.yml')):
+        job_name = install.stem[len('install_'):]
+        folder = install.parent
+        has_uninstall = Path(folder, 'uninstall_{}.yml'.format(job_name)).exists()
+        has_description = Path(folder, 'files', '{}.yml'.format(job_name)).exists()
+        if has_uninstall and has_description:
+            yield job_name, folder
+
+
+if __name__ == '__main__':
+    AddJobs.autorun()
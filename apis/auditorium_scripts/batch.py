@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them. It is
+# composed of an Auditorium (HMIs), a Controller, a Collector and multiple
+# Agents (one for each network entity that wants to be tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY, without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""Run many auditorium scripts in a single process and session"""
+
+
+__author__ = 'Viveris Technologies'
+__credits__ = '''Contributors:
+ * Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>
+'''
+
+
+import sys
+from argparse import FileType
+
+import requests
+
+from auditorium_scripts.frontend import FrontendBase
+
+
+class Batch(FrontendBase):
+    def __init__(self):
+        super().__init__('OpenBACH — Run auditorium scripts read from a file or stdin')
+        self.parser.add_argument(
+                'commands', nargs='?', type=FileType('r'), default='-',
+                help='file containing one script name followed by its '
+                'arguments per line; read from stdin if not provided')
+        self.parser.add_argument(
+                '-s', '--stop-on-error', action='store_true',
+                help='stop processing commands after the first failure')
+
+    def execute(self, show_response_content=True):
+        with self.args.commands as commands:
+            return self.run_batch(commands, stop_on_error=self.args.stop_on_error)
+
+    @classmethod
+    def autorun(cls):
+        # Results are JSON lines on stdout, so no success message here
+        self = cls()
+        try:
+            self.parse()
+            failures = self.execute()
+        except requests.RequestException as error:
+            sys.exit(str(error))
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    Batch.autorun()
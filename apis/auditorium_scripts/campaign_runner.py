@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them. It is
+# composed of an Auditorium (HMIs), a Controller, a Collector and multiple
+# Agents (one for each network entity that wants to be tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY, without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+
+
+"""Run the scenarios built by an executor for many sets of arguments concurrently"""
+
+
+__author__ = 'Viveris Technologies'
+__credits__ = '''Contributors:
+ * Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>
+'''
+
+import json
+import shlex
+import argparse
+import itertools
+import threading
+import importlib.util
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from auditorium_scripts.frontend import FrontendBase, ActionFailedError
+from auditorium_scripts.scenario_observer import ScenarioObserver, ScenarioInstancesPoller, DataProcessor
+
+
+class _ScenarioCaptured(Exception):
+    def __init__(self, observer, builder):
+        super().__init__()
+        self.observer = observer
+        self.builder = builder
+
+
+class _CapturingObserver(ScenarioObserver):
+    """Scenario observer that hands over the scenario it is asked to
+    launch instead of running it.
+    """
+
+    def _launch_and_wait(self, builder=None):
+        raise _ScenarioCaptured(self, builder)
+
+
+def load_executor(path, observer_class=None):
+    """Import the executor at the given path and return its `main` function.
+
+    If `observer_class` is given, the executor uses it instead of
+    `ScenarioObserver`; only this copy of the executor is affected.
+    """
+    path = Path(path).resolve()
+    module_name = path.stem.replace('-', '_')
+    spec = importlib.util.spec_from_file_location(module_name, path.as_posix())
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if observer_class is not None:
+        module.ScenarioObserver = observer_class
+    return module.main
+
+
+class CampaignRun:
+    """State of the run of a single scenario of a campaign"""
+
+    def __init__(self, arguments, observer, builder):
+        self.arguments = arguments
+        self.observer = observer
+        self.builder = builder
+        self.entities = builder.entities
+        self.attempts = 0
+        self.scenario_instance_id = None
+        self.status = None
+        self.error = None
+        self.results = None
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    @property
+    def json(self):
+        """Build a JSON representation of this run"""
+        return {
+            'arguments': self.arguments,
+            'scenario_name': str(self.builder),
+            'entities': sorted(self.entities),
+            'scenario_instance_id': self.scenario_instance_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+        }
+
+
+class CampaignRunner(FrontendBase):
+    """Run the scenario of an executor once per set of arguments.
+
+    Scenarios are launched concurrently as long as they do not use a
+    common entity, failed runs are retried, and the data of each run
+    can be post-processed through a `DataProcessor`: provide a function
+    accepting the `DataProcessor` and the scenario builder of the run
+    that registers the desired callbacks; their results are stored in
+    the `results` attribute of each run.
+
+    Executors are expected to import `ScenarioObserver` at module level,
+    which lets the runner swap it for an observer capturing scenarios.
+    Only the first scenario launched by the executor is considered and
+    logs are not retrieved after each run as they would mix between
+    concurrent scenarios.
+    """
+
+    def __init__(self, post_processing=None):
+        super().__init__('OpenBACH — Run a Campaign of Scenarios from an Executor')
+        self.parser.add_argument(
+                'executor', type=Path,
+                help='path to the executor building the scenarios to run')
+        self.parser.add_argument(
+                'executor_arguments', nargs=argparse.REMAINDER,
+                help='arguments common to every run of the executor; '
+                'anything after the executor path is passed to it')
+        self.parser.add_argument(
+                '-m', '--matrix', type=argparse.FileType('r'),
+                help='file containing the arguments of a run of the '
+                'executor per line, appended to the common ones')
+        self.parser.add_argument(
+                '-v', '--vary', action='append', nargs='+', default=[],
+                metavar=('OPTION', 'VALUE'),
+                help='run the executor once per given value of the option (given '
+                'without its leading dashes), for each line of the matrix. May be '
+                'specified several times to run every combination of values.')
+        self.parser.add_argument(
+                '-j', '--jobs', '--concurrency', type=int, metavar='N',
+                help='maximum amount of scenarios running at once; '
+                'defaults to as many as entities allow')
+        self.parser.add_argument(
+                '-r', '--retries', type=int, default=1,
+                help='amount of times a failed run is started again')
+        self.parser.add_argument(
+                '--poll-waiting-time', type=float, default=self.WAITING_TIME_BETWEEN_STATES_POLL,
+                help='Maximal waiting time in seconds between states poll when '
+                'monitoring scenarios completion.')
+        self.post_processing = post_processing
+        self._launch_lock = threading.Lock()
+
+    def execute(self, show_response_content=True):
+        runs = self._capture_runs()
+        self._poller = ScenarioInstancesPoller(self, self.args.poll_waiting_time)
+        self._schedule(runs)
+
+        if show_response_content:
+            for run in runs:
+                print(json.dumps(run.json))
+
+        failed = sum(run.failed for run in runs)
+        if failed:
+            raise ActionFailedError('{} out of {} runs failed'.format(failed, len(runs)), None)
+        return runs
+
+    def _arguments_matrix(self):
+        lines = [[]]
+        if self.args.matrix is not None:
+            with self.args.matrix as matrix:
+                lines = [
+                        shlex.split(line) for line in matrix
+                        if line.strip() and not line.lstrip().startswith('#')
+                ]
+
+        options = [
+                [('--' + option, value) for value in values]
+                for option, *values in self.args.vary
+        ]
+        for line in lines:
+            for combination in itertools.product(*options):
+                # Varying options come first so they are handled by the
+                # scenario parser even if the line selects the 'run' action
+                arguments = [item for option in combination for item in option]
+                yield arguments + self.args.executor_arguments + line
+
+    def _capture_runs(self):
+        executor = load_executor(self.args.executor, _CapturingObserver)
+        runs = []
+        for arguments in self._arguments_matrix():
+            try:
+                executor(['--controller', self.args.controller] + arguments)
+            except _ScenarioCaptured as captured:
+                if captured.builder is None:
+                    self.parser.error('executor did not build a scenario with arguments {}'.format(arguments))
+                captured.observer.session = self.session
+                runs.append(CampaignRun(arguments, captured.observer, captured.builder))
+            else:
+                self.parser.error('executor did not launch a scenario with arguments {}'.format(arguments))
+        return runs
+
+    def _schedule(self, runs):
+        pending = list(runs)
+        busy_entities = set()
+        running = 0
+        max_running = self.args.jobs or len(runs) or 1
+        condition = threading.Condition()
+
+        def run_done(run, future):
+            nonlocal running
+            error = future.exception()
+            if error is not None:
+                run.error = str(error) or repr(error)
+            with condition:
+                busy_entities.difference_update(run.entities)
+                running -= 1
+                if run.failed and run.attempts <= self.args.retries:
+                    pending.append(run)
+                condition.notify()
+
+        with ThreadPoolExecutor(max_workers=max_running) as executor:
+            while True:
+                with condition:
+                    if not pending and not running:
+                        break
+                    run = None
+                    if running < max_running:
+                        run = next((r for r in pending if busy_entities.isdisjoint(r.entities)), None)
+                    if run is None:
+                        condition.wait()
+                        continue
+                    pending.remove(run)
+                    busy_entities.update(run.entities)
+                    running += 1
+                executor.submit(self._run, run).add_done_callback(partial(run_done, run))
+
+    def _run(self, run):
+        observer = run.observer
+        run.attempts += 1
+        run.error = None
+        try:
+            observer._prepare_run_arguments()
+            with self._launch_lock:
+                # Scenarios may share a name: upload and start them
+                # one at a time to avoid starting another definition
+                observer._send_scenario_to_controller(run.builder)
+                run.scenario_instance_id = observer._start_scenario_instance()
+            response = self._poller.watch(run.scenario_instance_id).result()
+            run.status = response.get('status')
+            observer._last_instance = response
+            observer._fetch_scenario_instance_data(run.scenario_instance_id)
+            if self.post_processing is not None:
+                processor = DataProcessor(observer, response)
+                self.post_processing(processor, run.builder)
+                run.results = processor.post_processing()
+        except ActionFailedError as error:
+            run.error = error.message
+        except (requests.RequestException, SystemExit) as error:
+            run.error = str(error)
+
+
+if __name__ == '__main__':
+    CampaignRunner.autorun()
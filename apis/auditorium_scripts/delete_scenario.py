@@ -37,25 +37,46 @@ __credits__ = '''Contributors:
 '''
 
 
-from auditorium_scripts.frontend import FrontendBase
+from auditorium_scripts.frontend import (
+        FrontendBase, MAX_CONCURRENT_REQUESTS,
+        check_responses, pretty_print,
+)
 
 
 class DeleteScenario(FrontendBase):
     def __init__(self):
-        super().__init__('OpenBACH — Delete a Scenario')
+        super().__init__('OpenBACH — Delete Scenarios')
         self.parser.add_argument(
-                'scenario_name',
-                help='name of the scenario to delete')
+                'scenario_name', nargs='+',
+                help='name of the scenarios to delete')
         self.parser.add_argument(
                 'project_name',
-                help='name of the project the scenario is associated with')
+                help='name of the project the scenarios are associated with')
+        self.parser.add_argument(
+                '-j', '--jobs', '--concurrency', type=int, default=MAX_CONCURRENT_REQUESTS,
+                help='amount of deletion requests sent at the same time')
 
     def execute(self, show_response_content=True):
-        scenario = self.args.scenario_name
+        scenarios = self.args.scenario_name
         project = self.args.project_name
 
-        route = 'project/{}/scenario/{}/'.format(project, scenario)
-        return self.request('DELETE', route, show_response_content=show_response_content)
+        if isinstance(scenarios, str):
+            route = 'project/{}/scenario/{}/'.format(project, scenarios)
+            return self.request('DELETE', route, show_response_content=show_response_content)
+
+        if len(scenarios) == 1:
+            route = 'project/{}/scenario/{}/'.format(project, scenarios[0])
+            return [self.request('DELETE', route, show_response_content=show_response_content)]
+
+        responses = self.request_all(
+                'DELETE', ('project/{}/scenario/{}/'.format(project, scenario) for scenario in scenarios),
+                max_workers=getattr(self.args, 'jobs', MAX_CONCURRENT_REQUESTS))
+        if show_response_content:
+            for response in responses:
+                if not isinstance(response, Exception):
+                    pretty_print(response, check_status=False)
+        check_responses(responses, ('scenario {}'.format(scenario) for scenario in scenarios))
+        return responses
 
 
 if __name__ == '__main__':
@@ -36,35 +36,142 @@ __credits__ = '''Contributors:
 '''
 
 
-import pprint
+import re
+import sys
+import datetime
+from contextlib import suppress
 
-from auditorium_scripts.frontend import FrontendBase
+from auditorium_scripts.frontend import (
+        FrontendBase, DEFAULT_DATE_FORMAT,
+        MAX_CONCURRENT_REQUESTS, check_responses, pretty_print,
+)
+
+
+AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
 
 
 class DeleteScenarioInstances(FrontendBase):
     def __init__(self):
-        super().__init__('OpenBACH — Delete a Scenario Instance')
+        super().__init__('OpenBACH — Delete Scenario Instances')
         self.parser.add_argument(
-                'scenario_instance_id', nargs='+', type=int,
+                'scenario_instance_id', nargs='*', type=int,
                 help='scenario instance ID to delete')
+        group = self.parser.add_argument_group('selection')
+        group.add_argument(
+                '-p', '--project', '--project-name', dest='select_project', metavar='PROJECT_NAME',
+                help='delete the instances of this project (in addition '
+                'to the provided IDs) matching the other filters')
+        group.add_argument(
+                '-s', '--scenario', '--scenario-name', dest='select_scenario', metavar='SCENARIO_NAME',
+                help='only select instances of this scenario (requires --project)')
+        group.add_argument(
+                '-o', '--older-than', type=_parse_age, metavar='AGE',
+                help='only select instances started more than AGE ago '
+                '(a number of seconds, or suffixed by one of s, m, h, d or w)')
+        group.add_argument(
+                '--status', action='append',
+                help='only select instances whose status is STATUS '
+                '(e.g. "Finished OK"); may be specified several times')
+        self.parser.add_argument(
+                '-j', '--jobs', '--concurrency', type=int, default=MAX_CONCURRENT_REQUESTS,
+                help='amount of deletion requests sent at the same time')
+        self.parser.add_argument(
+                '-n', '--dry-run', action='store_true',
+                help='only print the IDs of the instances that would be deleted')
+
+    def parse(self, args=None):
+        super().parse(args)
+        if self.args.select_scenario and not self.args.select_project:
+            self.parser.error('--scenario requires --project')
+        if not self.args.scenario_instance_id and not self.args.select_project:
+            self.parser.error('no scenario instance ID nor project to select instances from')
 
     def execute(self, show_response_content=True):
-        instance_ids = self.args.scenario_instance_id
-        check_status = len(instance_ids) == 1
-        responses = [
-                self.request(
-                    'DELETE', 'scenario_instance/{}/'.format(id),
-                    show_response_content=show_response_content,
-                    check_status=check_status)
-                for id in instance_ids
-        ]
-
-        if show_response_content and not check_status:
-            for response in responses:
-                response.raise_for_status()
+        instance_ids = list(dict.fromkeys(self.args.scenario_instance_id))
+        # Not project_name: frontends sharing their state with this
+        # script may hold one without asking for a whole project purge
+        if getattr(self.args, 'select_project', None):
+            instance_ids.extend(
+                    id for id in self._select_instances()
+                    if id not in instance_ids)
+
+        if getattr(self.args, 'dry_run', False):
+            if show_response_content:
+                print('Would delete {} scenario instance(s):'.format(len(instance_ids)))
+                for id in instance_ids:
+                    print(' ', id)
+            return []
 
+        responses = self.request_all(
+                'DELETE', ('scenario_instance/{}/'.format(id) for id in instance_ids),
+                max_workers=getattr(self.args, 'jobs', MAX_CONCURRENT_REQUESTS))
+
+        if show_response_content:
+            for response in responses:
+                if not isinstance(response, Exception):
+                    pretty_print(response, check_status=False)
+            print('Deleted {} scenario instance(s)'.format(
+                sum(not isinstance(r, Exception) and r.ok for r in responses)),
+                file=sys.stderr)
+        check_responses(responses, ('scenario instance {}'.format(id) for id in instance_ids))
         return responses
 
+    def _select_instances(self):
+        """Retrieve, in a single listing, the IDs of the instances
+        matching the filters; sub-scenario instances whose owner is
+        selected too are left to be deleted with it.
+        """
+        project = self.args.select_project
+        scenario = getattr(self.args, 'select_scenario', None)
+        if scenario is None:
+            route = 'project/{}/scenario_instance/'.format(project)
+        else:
+            route = 'project/{}/scenario/{}/scenario_instance/'.format(project, scenario)
+        response = self.request('GET', route, show_response_content=False)
+        response.raise_for_status()
+
+        older_than = getattr(self.args, 'older_than', None)
+        limit = None if older_than is None else datetime.datetime.now(datetime.timezone.utc) - older_than
+        statuses = getattr(self.args, 'status', None)
+
+        selected = {}
+        for instance in response.json():
+            if statuses and instance.get('status') not in statuses:
+                continue
+            if limit is not None:
+                started = _parse_date(instance.get('start_date'))
+                if started is None or started > limit:
+                    continue
+            selected[instance['scenario_instance_id']] = instance.get('owner_scenario_instance_id')
+
+        return [id for id, owner in selected.items() if owner not in selected or owner == id]
+
+
+def _parse_age(age):
+    match = re.fullmatch(r'\s*(\d+(?:\.\d*)?)\s*([smhdw]?)\s*', age)
+    if match is None:
+        raise ValueError('invalid age: {}'.format(age))
+    value, unit = match.groups()
+    return datetime.timedelta(seconds=float(value) * AGE_UNITS[unit or 's'])
+
+
+def _parse_date(date):
+    """Convert a date from the controller to an aware datetime"""
+    if date is None:
+        return None
+    if isinstance(date, (int, float)):
+        return datetime.datetime.fromtimestamp(date / 1000, datetime.timezone.utc)
+
+    parsed = None
+    with suppress(ValueError):
+        parsed = datetime.datetime.fromisoformat(date.replace('Z', '+00:00'))
+    if parsed is None:
+        with suppress(ValueError):
+            parsed = datetime.datetime.strptime(date, DEFAULT_DATE_FORMAT)
+    if parsed is not None and parsed.tzinfo is None:
+        parsed = parsed.astimezone()
+    return parsed
+
 
 if __name__ == '__main__':
     DeleteScenarioInstances.autorun()
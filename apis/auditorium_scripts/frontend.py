@@ -44,11 +44,14 @@ __credits__ = '''Contributors:
  * Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>
 '''
 
+import io
 import sys
 import json
+import uuid
 import fcntl
 import shlex
 import socket
+import random
 import struct
 import pprint
 import logging
@@ -56,16 +59,23 @@ import getpass
 import datetime
 import argparse
 import warnings
+import importlib
 from copy import copy
-from time import sleep
+from time import sleep, monotonic
 from pathlib import Path
-from contextlib import suppress
+from functools import lru_cache
+from contextlib import suppress, redirect_stdout, redirect_stderr
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 
 
 LOG = logging.getLogger(__name__)
 DEFAULT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # bytes
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes
+MAX_CONCURRENT_POLLS = 8
+MAX_CONCURRENT_REQUESTS = 8
 
 
 def get_interfaces():
@@ -94,6 +104,21 @@ def get_default_ip_address():
             return get_ip_address(iface)
 
 
+def polling_delays(maximum, initial=0.1, factor=1.5, jitter=0.1):
+    """Generate waiting times between two polls of the controller.
+
+    Delays start small so that short actions are noticed quickly
+    and grow exponentially up to `maximum` to avoid hammering the
+    controller on long ones. Each delay is randomly spread by
+    `jitter` (a ratio) so that concurrent pollers do not synchronize.
+    """
+    delay = min(initial, maximum)
+    while True:
+        yield delay * random.uniform(1 - jitter, 1 + jitter)
+        delay = min(delay * factor, maximum)
+
+
+@lru_cache()
 def read_controller_configuration(filename='controller'):
     default_ip = get_default_ip_address()
     try:
@@ -203,6 +228,7 @@ class FrontendBase:
                 '--password', help='OpenBACH password')
         self._default_password = password
         self._default_controller = controller if unspecified else None
+        self._authenticated = False
         self.credentials = {'controller': self._default_controller}
 
         self.session = requests.Session()
@@ -223,6 +249,12 @@ class FrontendBase:
         del self._default_controller
         self.base_url = url = 'http://{}:8000/'.format(args.controller)
 
+        if self._authenticated:
+            # Session already logged in by the frontend sharing it
+            del self.args.login
+            del self.args.password
+            return args
+
         self.credentials = {'controller': args.controller}
         if args.login:
             password = args.password or self._default_password
@@ -245,6 +277,85 @@ class FrontendBase:
         instance.args = copy(self.args)
         return instance
 
+    def run_batch(self, commands, output=None, stop_on_error=False):
+        """Run many auditorium scripts using the session of this
+        frontend, which should already be parsed (and thus logged in).
+
+        Each line of `commands` holds the name of a script followed
+        by its command-line arguments, quoted as in a shell; empty
+        lines and lines starting with '#' are ignored. A JSON object
+        describing the outcome of each command is written as a single
+        line on `output` (defaults to the standard output); anything
+        the scripts print is sent to the standard error instead.
+
+        Return the amount of commands that failed.
+        """
+        if output is None:
+            output = sys.stdout
+
+        failures = 0
+        for line_number, line in enumerate(commands, 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            result = {'line': line_number}
+            try:
+                argv = shlex.split(line)
+                result['script'] = argv[0]
+                with redirect_stdout(sys.stderr):
+                    response = self._run_batch_command(argv[0], argv[1:])
+            except ActionFailedError as error:
+                result.update(ok=False, error=error.message, returncode=error.returncode)
+            except BatchCommandError as error:
+                result.update(ok=False, error=str(error))
+            except Exception as error:
+                result.update(ok=False, error='{}: {}'.format(type(error).__name__, error))
+            else:
+                if isinstance(response, requests.Response):
+                    result.update(_response_content(response))
+                elif isinstance(response, list):
+                    result['responses'] = [_response_content(r) for r in response if r is not None]
+                    result['ok'] = all(r['ok'] for r in result['responses'])
+                else:
+                    result['ok'] = True
+
+            print(json.dumps(result), file=output, flush=True)
+            if not result['ok']:
+                failures += 1
+                if stop_on_error:
+                    break
+        return failures
+
+    def _run_batch_command(self, script_name, argv):
+        frontend = _find_script(script_name)()
+        frontend.session = self.session
+        frontend.credentials = self.credentials
+        frontend._authenticated = True
+
+        errors = io.StringIO()
+        try:
+            with redirect_stderr(errors):
+                frontend.parse(['--controller', self.args.controller] + argv)
+        except SystemExit:
+            lines = errors.getvalue().strip().splitlines()
+            raise BatchCommandError(lines[-1] if lines else 'invalid arguments')
+        frontend.base_url = self.base_url
+
+        # Scripts also bail out through parser.error or sys.exit on
+        # unexpected responses: report them as this command failure
+        errors = io.StringIO()
+        try:
+            with redirect_stderr(errors):
+                return frontend.execute(False)
+        except SystemExit as error:
+            if not error.code:
+                return None
+            if isinstance(error.code, str):
+                raise BatchCommandError(error.code)
+            lines = errors.getvalue().strip().splitlines()
+            raise BatchCommandError(lines[-1] if lines else 'exited with status {}'.format(error.code))
+        finally:
+            sys.stderr.write(errors.getvalue())
+
     def date_to_timestamp(self, fmt=DEFAULT_DATE_FORMAT):
         date = getattr(self.args, 'date', None)
         if date is not None:
@@ -260,19 +371,21 @@ class FrontendBase:
     def execute(self, show_response_content=True):
         pass
 
-    def request(self, verb, route, show_response_content=True, check_status=True, files=None, **kwargs):
+    def request(
+            self, verb, route, show_response_content=True, check_status=True,
+            files=None, stream=False, headers=None, **kwargs):
         verb = verb.upper()
         url = self.base_url + route
         LOG.debug('%s %s %s', verb, url, kwargs)
         for _ in range(3):  # Retry 3 times in case we get disconnected
             try:
                 if verb == 'GET':
-                    response = self.session.get(url, params=kwargs)
+                    response = self.session.get(url, params=kwargs, stream=stream, headers=headers)
                 else:
                     if files is None:
-                        response = self.session.request(verb, url, json=kwargs)
+                        response = self.session.request(verb, url, json=kwargs, stream=stream, headers=headers)
                     else:
-                        response = self.session.request(verb, url, data=kwargs, files=files)
+                        response = self.session.request(verb, url, data=kwargs, files=files, stream=stream, headers=headers)
             except requests.exceptions.ConnectionError as error:
                 last_error = error
                 LOG.warning('Connection error while trying request. Retrying.')
@@ -285,33 +398,384 @@ class FrontendBase:
             pretty_print(response, check_status=check_status)
         return response
 
-    def wait_for_success(self, status=None, valid_statuses=(200, 204), show_response_content=True):
-        while True:
-            sleep(self.WAITING_TIME_BETWEEN_STATES_POLL)
-            response = self.query_state()
-            response.raise_for_status()
+    def request_all(self, verb, routes, max_workers=MAX_CONCURRENT_REQUESTS, **kwargs):
+        """Issue the same request on each of the given routes, at most
+        `max_workers` at a time, using the session of this frontend.
+
+        Return the list of responses in the order of `routes`; requests
+        that could not be performed at all (connection errors) have the
+        raised exception in place of their response. See `check_responses`
+        to report failures at once.
+        """
+        def _request(route):
             try:
-                content = response.json()
-            except ValueError:
-                raise ActionFailedError(
-                        'Server returned non-JSON response: {}'.format(response.text),
-                        response.status_code)
-
-            if status:
-                content = content[status]
-            returncode = content['returncode']
-            if returncode != 202:
-                if show_response_content:
-                    pretty_print(response, content['response'])
-                if returncode not in valid_statuses:
-                    raise ActionFailedError(**content)
+                return self.request(verb, route, show_response_content=False, check_status=False, **kwargs)
+            except requests.RequestException as error:
+                return error
+
+        routes = list(routes)
+        if max_workers <= 1 or len(routes) <= 1:
+            return [_request(route) for route in routes]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_request, routes))
+
+    def download(self, route, filepath, progress=None, chunk_size=DOWNLOAD_CHUNK_SIZE, **kwargs):
+        """Stream the body of a GET request on the given route into the
+        given file, chunk by chunk, instead of holding it in memory.
+
+        Data are written into a '.part' file next to the destination and
+        renamed once complete. If the connection is lost midway, or if a
+        previous download was interrupted, the transfer resumes where it
+        stopped using an HTTP range request; it starts over if the server
+        does not support them.
+
+        `progress`, if provided, is called after each chunk with the amount
+        of bytes received so far and the expected total (None if unknown).
+
+        Return the response of the last request issued.
+        """
+        filepath = Path(filepath)
+        partial = filepath.with_name(filepath.name + '.part')
+        for _ in range(3):  # Resume 3 times in case we get disconnected
+            received = partial.stat().st_size if partial.exists() else 0
+            headers = {'Range': 'bytes={}-'.format(received)} if received else None
+            response = self.request(
+                    'GET', route, show_response_content=False,
+                    check_status=False, stream=True, headers=headers, **kwargs)
+            if response.status_code == 416:
+                # Range not satisfiable, partial file is unusable
+                last_error = requests.HTTPError(
+                        'Range not satisfiable while resuming download of {}'
+                        .format(filepath), response=response)
+                response.close()
+                partial.unlink()
+                continue
+            if response.status_code != 206:
+                received = 0
+                if not response.ok:
+                    return response
+            total = _expected_size(response, received)
+
+            try:
+                with response, partial.open('ab' if received else 'wb') as stream:
+                    for chunk in response.iter_content(chunk_size):
+                        stream.write(chunk)
+                        received += len(chunk)
+                        if progress is not None:
+                            progress(received, total)
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError) as error:
+                last_error = error
+                LOG.warning('Connection lost while downloading %s. Resuming.', filepath)
+            else:
+                partial.replace(filepath)
                 return response
+        else:
+            LOG.error('Retry counter ran out, bailing out.')
+            raise last_error
+
+    def upload(self, route, fileobj, filename=None, progress=None, show_response_content=True, **fields):
+        """POST the content of a binary file object as the 'file' field of
+        a multipart form, along with the other `fields`, without loading
+        it in memory: the body is read from the file while being sent.
+
+        `progress`, if provided, is called after each chunk with the amount
+        of bytes of the file sent so far and its total size.
+
+        Return the response of the request.
+        """
+        url = self.base_url + route
+        if filename is None:
+            filename = Path(getattr(fileobj, 'name', 'file')).name
+        start = fileobj.tell()
+        LOG.debug('POST %s %s (streaming %s)', url, fields, filename)
+        for _ in range(3):  # Retry 3 times in case we get disconnected
+            fileobj.seek(start)
+            body = MultipartBody(fields, 'file', fileobj, filename, progress)
+            try:
+                response = self.session.post(url, data=body, headers={'Content-Type': body.content_type})
+            except requests.exceptions.ConnectionError as error:
+                last_error = error
+                LOG.warning('Connection error while uploading %s. Retrying.', filename)
+            else:
+                break
+        else:
+            LOG.error('Retry counter ran out, bailing out.')
+            raise last_error
+        if show_response_content:
+            pretty_print(response)
+        return response
+
+    def wait_for_success(self, status=None, valid_statuses=(200, 204), show_response_content=True):
+        for delay in polling_delays(self.WAITING_TIME_BETWEEN_STATES_POLL):
+            sleep(delay)
+            response = self.check_state(status, valid_statuses, show_response_content)
+            if response is not None:
+                return response
+
+    def check_state(self, status=None, valid_statuses=(200, 204), show_response_content=True):
+        """Query the state of the action once and return the response
+        if the action completed, None if it is still pending.
+
+        Raise `ActionFailedError` if the action completed with a
+        return code not in `valid_statuses`.
+        """
+        response = self.query_state()
+        response.raise_for_status()
+        try:
+            content = response.json()
+        except ValueError:
+            raise ActionFailedError(
+                    'Server returned non-JSON response: {}'.format(response.text),
+                    response.status_code)
+
+        if status:
+            content = content[status]
+        returncode = content['returncode']
+        if returncode != 202:
+            if show_response_content:
+                pretty_print(response, content['response'])
+            if returncode not in valid_statuses:
+                raise ActionFailedError(**content)
+            return response
 
     def query_state(self):
         return self.session.get(self.base_url)
 
 
+def _expected_size(response, offset=0):
+    """Compute the total size of a (possibly partial) content
+    from the headers of a response; None if it is unknown.
+    """
+    with suppress(KeyError, ValueError):
+        if response.status_code == 206:
+            return int(response.headers['Content-Range'].rsplit('/', 1)[1])
+        return offset + int(response.headers['Content-Length'])
+
+
+def check_responses(responses, labels):
+    """Raise a single `ActionFailedError` describing every failed
+    response (or exception) in `responses`, each one being identified
+    by the corresponding item in `labels`.
+    """
+    failures = []
+    for label, response in zip(labels, responses):
+        if isinstance(response, Exception):
+            failures.append('{}: {}'.format(label, response))
+        elif not response.ok:
+            try:
+                reason = response.json()
+            except ValueError:
+                reason = response.text or response.reason
+            failures.append('{}: {} {}'.format(label, response.status_code, reason))
+
+    if failures:
+        raise ActionFailedError(
+                '{} of {} requests failed:\n{}'.format(
+                    len(failures), len(responses), '\n'.join(failures)),
+                None)
+
+
+class MultipartBody:
+    """File-like multipart/form-data body whose file part is read
+    lazily from a binary file object, so that requests streams it
+    (with a proper Content-Length) instead of buffering it.
+
+    Fields are encoded the same way requests does: lists produce
+    several fields of the same name and None values are skipped.
+    """
+
+    def __init__(self, fields, name, fileobj, filename, progress=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(boundary)
+        head = io.BytesIO()
+        for field, values in fields.items():
+            if isinstance(values, (str, bytes)) or not hasattr(values, '__iter__'):
+                values = [values]
+            for value in values:
+                if value is None:
+                    continue
+                if not isinstance(value, bytes):
+                    value = str(value).encode()
+                head.write('--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n'.format(boundary, field).encode())
+                head.write(value)
+                head.write(b'\r\n')
+        head.write((
+            '--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        ).format(boundary, name, filename.replace('"', '%22')).encode())
+
+        self._head = head.getvalue()
+        self._tail = '\r\n--{}--\r\n'.format(boundary).encode()
+        self._file = fileobj
+        start = fileobj.tell()
+        self._file_size = fileobj.seek(0, io.SEEK_END) - start
+        fileobj.seek(start)
+        self._sent = 0
+        self._progress = progress
+        self._chunk_size = chunk_size
+        self._state = 0
+
+    def __len__(self):
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def __iter__(self):
+        chunk = self.read(self._chunk_size)
+        while chunk:
+            yield chunk
+            chunk = self.read(self._chunk_size)
+
+    def read(self, size=-1):
+        if size == 0:
+            return b''
+        if self._state == 0:
+            self._state = 1
+            return self._head
+        if self._state == 1:
+            chunk = self._file.read(self._chunk_size if size is None or size < 0 else size)
+            if chunk:
+                self._sent += len(chunk)
+                if self._progress is not None:
+                    self._progress(self._sent, self._file_size)
+                return chunk
+            self._state = 2
+        if self._state == 2:
+            self._state = 3
+            return self._tail
+        return b''
+
+
+class ProgressReport:
+    """Progress callback for transfers, printing at most a line per
+    `INTERVAL` seconds on the standard error.
+    """
+
+    INTERVAL = 1  # seconds between reports
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.last_report = None
+
+    def __call__(self, received, total):
+        now = monotonic()
+        if received != total and self.last_report is not None and now - self.last_report < self.INTERVAL:
+            return
+        self.last_report = now
+
+        if total:
+            print('{}: {:.1f} / {:.1f} MiB ({:.0%})'.format(
+                self.filename, received / 2**20, total / 2**20, received / total),
+                file=sys.stderr)
+        else:
+            print('{}: {:.1f} MiB'.format(self.filename, received / 2**20), file=sys.stderr)
+
+
+def wait_for_all_success(
+        frontends, status=None, valid_statuses=(200, 204),
+        show_response_content=True, progress=None,
+        max_workers=MAX_CONCURRENT_POLLS):
+    """Wait for the actions monitored by each frontend (through their
+    `query_state` method) to complete, the same way `wait_for_success`
+    does for a single one.
+
+    Instead of a thread per frontend, due states are queried each round
+    by a pool of at most `max_workers` threads, each frontend backing off
+    on its own (see `polling_delays`). Frontends are expected to share
+    their session (see `FrontendBase.share_state`) so that the same
+    connection pool is used for every query.
+
+    `progress`, if provided, is called with the frontend, the amount of
+    completed actions and the total amount of actions each time an action
+    completes (successfully or not).
+
+    Return the list of final responses, in the order of `frontends`; if
+    any action failed, the first error is raised once every action is over.
+    """
+    frontends = list(frontends)
+    results = [None] * len(frontends)
+    errors = [None] * len(frontends)
+    pending = {}
+    for index, frontend in enumerate(frontends):
+        delays = polling_delays(frontend.WAITING_TIME_BETWEEN_STATES_POLL)
+        pending[index] = (delays, monotonic() + next(delays))
+
+    completed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending:
+            now = monotonic()
+            due = [index for index, (_, deadline) in pending.items() if deadline <= now]
+            if not due:
+                sleep(min(deadline for _, deadline in pending.values()) - now)
+                continue
+
+            futures = {
+                    executor.submit(
+                        frontends[index].check_state, status,
+                        valid_statuses, show_response_content): index
+                    for index in due
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    response = future.result()
+                except Exception as error:
+                    errors[index] = error
+                else:
+                    if response is None:
+                        delays, _ = pending[index]
+                        pending[index] = (delays, monotonic() + next(delays))
+                        continue
+                    results[index] = response
+                del pending[index]
+                completed += 1
+                if progress is not None:
+                    progress(frontends[index], completed, len(frontends))
+
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
+
+
+@lru_cache()
+def _find_script(name):
+    """Retrieve the frontend class defined in the auditorium script
+    of the given name (with or without the '.py' extension).
+    """
+    if name.endswith('.py'):
+        name = name[:-3]
+    try:
+        module = importlib.import_module('auditorium_scripts.' + name)
+    except ImportError:
+        raise BatchCommandError('unknown script \'{}\''.format(name))
+
+    for value in vars(module).values():
+        if (isinstance(value, type) and issubclass(value, FrontendBase)
+                and value.__module__ == module.__name__):
+            return value
+    raise BatchCommandError('script \'{}\' does not define a frontend'.format(name))
+
+
+def _response_content(response):
+    """Summarize a response into a JSON-serializable dictionary"""
+    result = {'ok': response.ok, 'status_code': response.status_code}
+    if response.status_code != 204:
+        try:
+            result['content'] = response.json()
+        except ValueError:
+            result['content'] = response.text
+        except RuntimeError:
+            # Streamed content already consumed (downloads)
+            pass
+    return result
+
+
+class BatchCommandError(Exception):
+    pass
+
+
 class ActionFailedError(Exception):
     def __init__(self, response, returncode, **kwargs):
         super().__init__(response)
         self.message = response
+        self.returncode = returncode
@@ -36,14 +36,18 @@ __credits__ = '''Contributors:
 '''
 
 from pathlib import Path
-from auditorium_scripts.frontend import FrontendBase
+from concurrent.futures import ThreadPoolExecutor
+
+from auditorium_scripts.frontend import (
+        FrontendBase, ProgressReport, MAX_CONCURRENT_REQUESTS, pretty_print,
+)
 
 
 class GetScenarioInstanceData(FrontendBase):
     def __init__(self):
         super().__init__('OpenBACH — Get the Data Generated by a Scenario Instance')
         self.parser.add_argument(
-                'scenario_instance_id', type=int,
+                'scenario_instance_id', nargs='+', type=int,
                 help='scenario instance ID to retrieve')
         self.parser.add_argument(
                 '-f', '--file', '--add-file', action='append', default=[],
@@ -53,22 +57,43 @@ class GetScenarioInstanceData(FrontendBase):
         self.parser.add_argument(
                 '--path', type=Path, default=Path(),
                 help='Path wherein storing the obtained data')
+        self.parser.add_argument(
+                '-j', '--jobs', '--concurrency', type=int, default=MAX_CONCURRENT_REQUESTS, metavar='N',
+                help='amount of scenario instances data to download concurrently')
+        self.parser.add_argument(
+                '-p', '--progress', action='store_true',
+                help='report the progress of the downloads on stderr')
 
     def execute(self, show_response_content=True):
-        instance_id = self.args.scenario_instance_id
+        instance_ids = self.args.scenario_instance_id
+        self.args.path.mkdir(parents=True, exist_ok=True)
+
+        check_status = len(instance_ids) == 1
+        with ThreadPoolExecutor(max_workers=max(getattr(self.args, 'jobs', MAX_CONCURRENT_REQUESTS), 1)) as executor:
+            downloads = [
+                    executor.submit(self._download, id, show_response_content, check_status)
+                    for id in instance_ids
+            ]
+            responses = [download.result() for download in downloads]
+
+        if show_response_content and not check_status:
+            for response in responses:
+                response.raise_for_status()
+
+        return responses
+
+    def _download(self, instance_id, show_response_content=True, check_status=True):
         files = dict(self.args.file)
         route = 'scenario_instance/{}/archive'.format(instance_id)
-
-        response = self.request(
-                'GET', route, **files,
-                show_response_content=show_response_content)
         filename = 'scenario_instance_{}'.format(instance_id)
         filename += '.tar.gz' if files else '.csv'
-        self.args.path.mkdir(parents=True, exist_ok=True)
-        filepath = str(Path(self.args.path, filename))
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
+        filepath = Path(self.args.path, filename)
 
+        progress = ProgressReport(filename) if getattr(self.args, 'progress', False) else None
+        response = self.download(route, filepath, progress, **files)
+        if show_response_content:
+            content = str(filepath) if response.ok else None
+            pretty_print(response, content, check_status)
         return response
 
 
@@ -39,7 +39,10 @@ __credits__ = '''Contributors:
 
 import getpass
 
-from auditorium_scripts.frontend import FrontendBase
+from auditorium_scripts.frontend import (
+        FrontendBase, check_responses,
+        pretty_print, wait_for_all_success,
+)
 
 
 class InstallAgent(FrontendBase):
@@ -64,6 +67,10 @@ class InstallAgent(FrontendBase):
                 action='store_true',
                 help='re-attach an existing (autonomous) agent '
                 'instead of performing a full-blown installation.')
+        self.parser.add_argument(
+                '-l', '--launch', '--launch-only', action='store_true',
+                help='do not wait until installation of the agent completes; '
+                'return as soon as the order has been sent.')
 
     def parse(self, args=None):
         super().parse(args)
@@ -84,10 +91,16 @@ class InstallAgent(FrontendBase):
 
         route = 'agent?reattach' if self.args.reattach else 'agent'
 
-        self.request(
+        response = self.request(
                 'POST', route, show_response_content=False,
                 address=agent, name=name, username=username,
                 password=password, collector_ip=collector)
+        if getattr(self.args, 'launch', False):
+            # Several agents can then be monitored at once
+            # using wait_for_all_success, see install_agents
+            if show_response_content:
+                pretty_print(response)
+            return response
         return self.wait_for_success('install', show_response_content=show_response_content)
 
     def query_state(self):
@@ -97,5 +110,40 @@ class InstallAgent(FrontendBase):
                 show_response_content=False)
 
 
+def install_agents(
+        frontend, agents, user=None, password=None, reattach=False,
+        show_response_content=True, progress=None):
+    """Install several agents at once using the session of `frontend`.
+
+    `agents` is an iterable of (agent address, collector address, agent
+    name) triplets. Every installation order is sent first, then the
+    completion of the accepted ones is monitored together using
+    `wait_for_all_success`; `progress` is forwarded to it. Refused orders
+    are reported at once afterwards (see `check_responses`).
+
+    Return the list of final responses, in the order of `agents`.
+    """
+    installers = []
+    for address, collector, name in agents:
+        installer = frontend.share_state(InstallAgent)
+        installer.args.agent_address = address
+        installer.args.collector_address = collector
+        installer.args.agent_name = name
+        installer.args.user = user
+        installer.args.password = password
+        installer.args.reattach = reattach
+        installer.args.launch = True
+        installers.append(installer)
+
+    responses = [installer.execute(False) for installer in installers]
+    launched = [installer for installer, response in zip(installers, responses) if response.ok]
+    results = wait_for_all_success(
+            launched, 'install',
+            show_response_content=show_response_content,
+            progress=progress)
+    check_responses(responses, [installer.args.agent_address for installer in installers])
+    return results
+
+
 if __name__ == '__main__':
     InstallAgent.autorun()
@@ -37,44 +37,13 @@ __credits__ = '''Contributors:
 '''
 
 
-import inspect
+import sys
 import itertools
-import threading
 
-from auditorium_scripts.frontend import FrontendBase
+from auditorium_scripts.frontend import FrontendBase, wait_for_all_success
 from auditorium_scripts.state_job import StateJob
 
 
-class WaitForInstall(threading.Thread):
-    def run(self):
-        try:
-            result = self._run()
-        except Exception as e:
-            self._exception = e
-        else:
-            self._exception = None
-            self._result = result
-
-
-    def _run(self):
-        signature = inspect.signature(lambda state_job, show_response_content=None: None)
-        arguments = signature.bind(*self._args, **self._kwargs)
-        arguments.apply_defaults()
-
-        state_job = arguments.arguments['state_job']
-        show = arguments.arguments['show_response_content']
-        if show is None:
-            return state_job.wait_for_success('install')
-        else:
-            return state_job.wait_for_success('install', show_response_content=show)
-
-    def join(self, timeout=None):
-        super().join(timeout)
-        if self._exception is not None:
-            raise self._exception
-        return self._result
-
-
 class InstallJobs(FrontendBase):
     def __init__(self):
         super().__init__('OpenBACH — Install Jobs on agents')
@@ -93,6 +62,9 @@ class InstallJobs(FrontendBase):
                 '-l', '--launch', '--launch-only', action='store_true',
                 help='do not wait until installation of the jobs completes '
                 'on each agent; return as soon as orders have been sent.')
+        self.parser.add_argument(
+                '-p', '--progress', action='store_true',
+                help='report on stderr each job whose installation completed')
 
     def parse(self, args=None):
         super().parse(args)
@@ -122,20 +94,26 @@ class InstallJobs(FrontendBase):
                 for response in responses:
                     response.raise_for_status()
         else:
-            threads = list(self._start_monitoring(show_response_content))
-            responses = [thread.join() for thread in threads]
+            responses = wait_for_all_success(
+                    self._start_monitoring(), 'install',
+                    show_response_content=show_response_content,
+                    progress=self._report_progress if getattr(self.args, 'progress', False) else None)
 
         return responses
 
-    def _start_monitoring(self, show_response_content=True):
+    def _start_monitoring(self):
         for agents, jobs in zip(self.args.agent_address, self.args.job_name):
             for agent, job in itertools.product(agents, jobs):
                 state_job = self.share_state(StateJob)
                 state_job.args.job_name = job
                 state_job.args.agent_address = agent
-                thread = WaitForInstall(args=(state_job, show_response_content))
-                thread.start()
-                yield thread
+                yield state_job
+
+    @staticmethod
+    def _report_progress(state_job, completed, total):
+        print('[{}/{}] {} on {}'.format(
+            completed, total, state_job.args.job_name,
+            state_job.args.agent_address), file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -37,9 +37,21 @@ __credits__ = '''Contributors:
 '''
 
 
+import json
+import hashlib
+import threading
+from pathlib import Path
 from argparse import FileType
+from concurrent.futures import ThreadPoolExecutor
 
-from auditorium_scripts.frontend import FrontendBase, pretty_print
+from auditorium_scripts.frontend import (
+        FrontendBase, ActionFailedError, ProgressReport,
+        UPLOAD_CHUNK_SIZE, pretty_print,
+)
+
+
+CHECKSUMS_CACHE = Path.home() / '.cache' / 'openbach' / 'pushed_files.json'
+_CHECKSUMS_LOCK = threading.Lock()
 
 
 class PushFile(FrontendBase):
@@ -54,19 +66,56 @@ class PushFile(FrontendBase):
         group = send.add_mutually_exclusive_group(required=True)
         group.add_argument('--path', nargs='+', help='path of the file on the controller')
         group.add_argument(
-                '--local-file', type=FileType('r'),
+                '--local-file', type=FileType('rb'),
                 help='path of a file on the current '
                 'computer to be sent to the agent')
         send.add_argument('--user', nargs='+', help='owner under which to push the file on the agent')
         send.add_argument('--group', nargs='+', help='group name under which to push the file on the agent')
-        send.set_defaults(keep=False)
+        send.add_argument(
+                '-p', '--progress', action='store_true',
+                help='report upload progress of the local file on stderr')
+        send.set_defaults(keep=False, distribute=False)
 
         keep = subparsers.add_parser('store', help='store file on the controller for future use')
-        keep.add_argument('local_file', type=FileType('r'), help='path of the file to send to the controller')
+        keep.add_argument('local_file', type=FileType('rb'), help='path of the file to send to the controller')
         keep.add_argument('remote_path', help='path where the file should be stored')
-        keep.set_defaults(keep=True)
+        keep.add_argument(
+                '-p', '--progress', action='store_true',
+                help='report upload progress on stderr')
+        keep.set_defaults(keep=True, distribute=False)
+
+        distribute = subparsers.add_parser(
+                'distribute', help='store file on the controller once '
+                'and push it onto several agents concurrently')
+        distribute.add_argument('local_file', type=FileType('rb'), help='path of the file to distribute')
+        distribute.add_argument('remote_path', help='path where the file should be pushed on the agents')
+        distribute.add_argument(
+                '-a', '--agent', '--agent-address', dest='agents', metavar='ADDRESS',
+                nargs='+', action='extend', required=True,
+                help='IP address of the agents to push the file onto')
+        distribute.add_argument(
+                '-s', '--stored-path',
+                help='path where the file should be stored on the controller '
+                '(defaults to the name of the file in a distribute/ folder)')
+        distribute.add_argument('--user', help='owner under which to push the file on the agents')
+        distribute.add_argument('--group', help='group name under which to push the file on the agents')
+        distribute.add_argument(
+                '-j', '--jobs', '--concurrency', type=int, default=8,
+                help='amount of agents the file is pushed onto at the same time')
+        distribute.add_argument(
+                '-S', '--skip-pushed', action='store_true',
+                help='do not push the file onto agents where the same content was '
+                'already pushed to the same path from this computer; the file being '
+                'changed on these agents since then, or by other computers, is not detected')
+        distribute.add_argument(
+                '-p', '--progress', action='store_true',
+                help='report upload progress on stderr')
+        distribute.set_defaults(keep=False, distribute=True)
 
     def execute(self, show_response_content=True):
+        if getattr(self.args, 'distribute', False):
+            return self._distribute(show_response_content)
+
         keep = self.args.keep
         form_data = {
                 'path': self.args.remote_path,
@@ -92,10 +141,107 @@ class PushFile(FrontendBase):
             if len(self.args.remote_path) != len(path):
                 self.parser.error('local and remote paths length mismatch')
             form_data['local_path'] = path
-        else:
-            form_data['files'] = {'file': local_file}
-
-        return self.request('POST', 'file', show_response_content, **form_data)
+            return self.request('POST', 'file', show_response_content, **form_data)
+
+        # Text files are accepted too, but sent as raw bytes
+        local_file = getattr(local_file, 'buffer', local_file)
+        progress = None
+        if getattr(self.args, 'progress', False):
+            progress = ProgressReport(Path(local_file.name).name)
+        return self.upload(
+                'file', local_file, progress=progress,
+                show_response_content=show_response_content,
+                **form_data)
+
+    def _distribute(self, show_response_content=True):
+        local_file = self.args.local_file
+        filename = Path(local_file.name).name
+        stored_path = self.args.stored_path or 'distribute/{}'.format(filename)
+        remote_path = self.args.remote_path
+        checksum = file_checksum(local_file)
+
+        agents = list(dict.fromkeys(self.args.agents))
+        if getattr(self.args, 'skip_pushed', False):
+            with _CHECKSUMS_LOCK:
+                checksums = _read_checksums().get(self.base_url, {})
+            skipped = [
+                    agent for agent in agents
+                    if checksums.get('{} {}'.format(agent, remote_path)) == checksum
+            ]
+            agents = [agent for agent in agents if agent not in skipped]
+            if skipped and show_response_content:
+                print('File already pushed from this computer on', ', '.join(skipped))
+            if not agents:
+                return []
+
+        # Always store the file: the copy stored by a previous run
+        # may have been removed or replaced since then
+        store = self.share_state(PushFile)
+        store.args.keep = True
+        store.args.distribute = False
+        store.args.local_file = local_file
+        store.args.remote_path = stored_path
+        response = store.execute(False)
+        response.raise_for_status()
+
+        def push(agent):
+            pusher = self.share_state(PushFile)
+            pusher.args.keep = False
+            pusher.args.distribute = False
+            pusher.args.agent_address = agent
+            pusher.args.remote_path = [remote_path]
+            pusher.args.path = [stored_path]
+            pusher.args.local_file = None
+            pusher.args.user = None if self.args.user is None else [self.args.user]
+            pusher.args.group = None if self.args.group is None else [self.args.group]
+            response = pusher.execute(False)
+            if response.ok:
+                _store_checksums(self.base_url, {'{} {}'.format(agent, remote_path): checksum})
+            return response
+
+        with ThreadPoolExecutor(max_workers=max(1, self.args.jobs)) as executor:
+            responses = list(executor.map(push, agents))
+
+        failed = [agent for agent, response in zip(agents, responses) if not response.ok]
+        if show_response_content:
+            for agent, response in zip(agents, responses):
+                print('Agent', agent)
+                pretty_print(response, check_status=False)
+        if failed:
+            raise ActionFailedError('pushing the file failed on {}'.format(', '.join(failed)), None)
+        return responses
+
+
+def file_checksum(fileobj, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Compute the SHA-256 of the remaining content of a binary
+    file object, then rewind it to its current position.
+    """
+    position = fileobj.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        digest.update(chunk)
+    fileobj.seek(position)
+    return digest.hexdigest()
+
+
+def _read_checksums():
+    try:
+        with CHECKSUMS_CACHE.open() as cache:
+            return json.load(cache)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_checksums(controller, checksums):
+    with _CHECKSUMS_LOCK:
+        content = _read_checksums()
+        content.setdefault(controller, {}).update(checksums)
+        try:
+            CHECKSUMS_CACHE.parent.mkdir(parents=True, exist_ok=True)
+            with CHECKSUMS_CACHE.open('w') as cache:
+                json.dump(content, cache)
+        except OSError:
+            pass
 
 
 if __name__ == '__main__':
@@ -41,15 +41,19 @@ import json
 import pprint
 import logging
 import datetime
+import threading
 from pathlib import Path
 from sys import exit, stderr
 from contextlib import suppress
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 import requests
 from data_access import CollectorConnection
+from data_access.result_data import Job
 from data_access.elasticsearch_tools import ElasticSearchConnection
+from scenario_builder import content_hash
 
-from auditorium_scripts.frontend import FrontendBase
+from auditorium_scripts.frontend import FrontendBase, ActionFailedError, polling_delays
 from auditorium_scripts.create_scenario import CreateScenario
 from auditorium_scripts.get_scenario import GetScenario
 from auditorium_scripts.list_scenarios import ListScenarios
@@ -60,6 +64,7 @@ from auditorium_scripts.get_scenario_instance_data import GetScenarioInstanceDat
 
 
 MAX_RETRIES_STATUS = 5
+MAX_CONCURRENT_UPLOADS = 8
 
 
 class ScenarioObserver(FrontendBase):
@@ -129,7 +134,9 @@ class ScenarioObserver(FrontendBase):
                 help='Disable log retrieval at the end of a scenario.')
         group.add_argument(
                 '--poll-waiting-time', type=float, default=self.WAITING_TIME_BETWEEN_STATES_POLL,
-                help='Waiting time in seconds between states poll when monitoring scenario completion.')
+                help='Maximal waiting time in seconds between states poll when monitoring '
+                'scenario completion. Polls start more often and slow down up to this value.')
+        self._add_validation_argument(group)
 
         parser = parsers.add_parser(
                 'build', help='write the JSON of the selected '
@@ -143,8 +150,19 @@ class ScenarioObserver(FrontendBase):
                 help='do not try to contact the controller to fetch '
                 'or update information; use the provided scenario '
                 'builder (if any) instead.')
+        self._add_validation_argument(parser)
         parser.set_defaults(_action=self._write_json)
 
+    @staticmethod
+    def _add_validation_argument(parser):
+        parser.add_argument(
+                '--validate-jobs', '--jobs-directory', dest='jobs_directories',
+                metavar='PATH', type=Path, action='append', default=[],
+                help='check the arguments of the jobs started by the scenario '
+                'builder against the descriptions of the jobs found in PATH '
+                'before sending anything to the controller. Can be specified '
+                'several times.')
+
     def add_scenario_argument(
             self, *name_or_flags, action=None, nargs=None,
             const=None, default=None, type=None, choices=None,
@@ -208,64 +226,97 @@ class ScenarioObserver(FrontendBase):
             scenario = scenario_getter.execute(False)
             scenario.raise_for_status()
         else:
+            self._validate_scenarios(builder)
             scenarios_getter = self.share_state(ListScenarios)
             scenarios = scenarios_getter.execute(False)
             scenarios.raise_for_status()
-            scenarios = {scenario['name'] for scenario in scenarios.json()}
+            existing = {scenario['name']: content_hash(scenario) for scenario in scenarios.json()}
 
             self.args.scenario_name = str(builder)
-            scenario_setter = self.share_state(CreateScenario)
-            scenario_modifier = self.share_state(ModifyScenario)
+            # Upload subscenarios before the scenarios starting them,
+            # each batch of independent scenarios concurrently
+            heights = {}
             for scenario in builder.subscenarios:
-                scenario_name = str(scenario)
-                if scenario_name in scenarios:
-                    scenario_modifier.args.scenario_name = scenario_name
-                    scenario_modifier.args.scenario = scenario.build()
-                    scenario = scenario_modifier.execute(False)
-                else:
-                    scenarios.add(scenario_name)
-                    scenario_setter.args.scenario = scenario.build()
-                    scenario = scenario_setter.execute(False)
-                scenario.raise_for_status()
+                heights[scenario] = 1 + max((heights[sub] for sub in scenario.own_subscenarios), default=-1)
+            # Scenarios sharing a name are uploaded in turn, in the same
+            # order than sequentially: created first, then modified
+            batches = [{} for _ in range(heights[builder] + 1)]
+            for scenario, height in heights.items():
+                definition = scenario.build()
+                name = definition['name']
+                digest = content_hash(definition)
+                if existing.get(name) != digest:
+                    batches[height].setdefault(name, []).append((definition, name in existing))
+                    existing[name] = digest
+
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_UPLOADS) as executor:
+                for batch in batches:
+                    uploads = [executor.submit(self._upload_scenarios, uploads) for uploads in batch.values()]
+                    for upload in uploads:
+                        upload.result()
+
+    def _validate_scenarios(self, builder):
+        directories = getattr(self.args, 'jobs_directories', None)
+        if not directories:
+            return
+
+        # Requires pyyaml, only needed when validation is asked for
+        from scenario_builder.validation import JobsSchemas, validate_scenario
+
+        schemas = JobsSchemas(*directories)
+        errors = [
+                error for scenario in builder.subscenarios
+                for error in validate_scenario(scenario.build(), schemas)
+        ]
+        if errors:
+            self.parser.error('invalid job arguments:\n' + '\n'.join(errors))
+
+    def _upload_scenarios(self, uploads):
+        for definition, exists in uploads:
+            if exists:
+                uploader = self.share_state(ModifyScenario)
+                uploader.args.scenario_name = definition['name']
+            else:
+                uploader = self.share_state(CreateScenario)
+            uploader.args.scenario = definition
+            uploader.execute(False).raise_for_status()
 
-    def _run_scenario_to_completion(self):
+    def _start_scenario_instance(self):
         scenario_starter = self.share_state(StartScenarioInstance)
         response = scenario_starter.execute(False)
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError as error:
             self.parser.error('{}:\n{}'.format(error, json.dumps(response.json(), indent=4)))
-        scenario_id = response.json()['scenario_instance_id']
-
-        scenario_waiter = self.share_state(StatusScenarioInstance)
-        scenario_waiter.args.scenario_instance_id = scenario_id
-        retries_left = MAX_RETRIES_STATUS
-        while True:
-            time.sleep(self.args.poll_waiting_time)
-            response = scenario_waiter.execute(False).json()
-            status = response.get('status')
-            if status is None:
-                retries_left -= 1
-                if not retries_left:
-                    self.parser.error('scenario instance status could not be fetched')
-                logging.getLogger(__name__).warning(
-                        'Error while fetching scenario status:\n%s\n\n%d retries left',
-                        PprintFormatter(response), retries_left)
-            elif status in ('Finished Ko',):
-                self.parser.error('scenario instance failed (status is \'{}\')'.format(status))
-            elif status in ('Finished', 'Finished Ok', 'Stopped'):
-                break
-            else:
-                retries_left = MAX_RETRIES_STATUS
+        return response.json()['scenario_instance_id']
 
+    def _fetch_scenario_instance_data(self, scenario_id):
         if self.args.path is not None:
             data_fetcher = self.share_state(GetScenarioInstanceData)
-            data_fetcher.args.scenario_instance_id = scenario_id
+            data_fetcher.args.scenario_instance_id = [scenario_id]
             data_fetcher.execute(False)
 
+    def _run_scenario_to_completion(self):
+        scenario_id = self._start_scenario_instance()
+
+        try:
+            response = self.poller.watch(scenario_id).result()
+        except ActionFailedError as error:
+            self.parser.error(error.message)
+
+        self._fetch_scenario_instance_data(scenario_id)
         return response
 
-    def _launch_and_wait(self, builder=None):
+    @property
+    def poller(self):
+        """Shared monitor of the scenario instances launched by this observer"""
+        try:
+            return self._poller
+        except AttributeError:
+            self._poller = ScenarioInstancesPoller(self, self.args.poll_waiting_time)
+            return self._poller
+
+    def _prepare_run_arguments(self):
         if self.args.collector_address is None:
             self.args.collector_address = self.args.controller
 
@@ -275,6 +326,9 @@ class ScenarioObserver(FrontendBase):
                 for name, value in self._default_arguments.items()
             }
 
+    def _launch_and_wait(self, builder=None):
+        self._prepare_run_arguments()
+
         begin_date = int(time.time()) * 1000  # Flooring to the last second
         try:
             self._send_scenario_to_controller(builder)
@@ -315,6 +369,7 @@ class ScenarioObserver(FrontendBase):
                 with open(str(path / name), 'w') as fp:
                     json.dump(content, fp, indent=4)
         elif builder:
+            self._validate_scenarios(builder)
             for scenario in builder.subscenarios:
                 name = '{}.json'.format(scenario)
                 scenario.write(str(path / name))
@@ -330,6 +385,104 @@ class ScenarioObserver(FrontendBase):
         self.args._action(builder)
 
 
+class _WatchedInstance:
+    def __init__(self, delays):
+        self.future = Future()
+        self.delays = delays
+        self.deadline = time.monotonic() + next(delays)
+        self.retries_left = MAX_RETRIES_STATUS
+
+
+class ScenarioInstancesPoller:
+    """Helper class that monitors the status of many scenario
+    instances at once from a single background thread.
+
+    Each watched scenario instance is polled with its own adaptive
+    delay (see `polling_delays`) using the session of the frontend
+    the poller is created from; so that launching lots of scenarios
+    concurrently does not multiply threads and connections.
+    """
+
+    def __init__(self, frontend, maximal_waiting_time=FrontendBase.WAITING_TIME_BETWEEN_STATES_POLL):
+        self._status = frontend.share_state(StatusScenarioInstance)
+        self._maximal_waiting_time = maximal_waiting_time
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def watch(self, scenario_instance_id):
+        """Start monitoring the given scenario instance and return a
+        `concurrent.futures.Future` holding its final status.
+
+        The future raises `ActionFailedError` if the scenario instance
+        fails or if its status can not be fetched anymore.
+        """
+        with self._lock:
+            try:
+                watched = self._watched[scenario_instance_id]
+            except KeyError:
+                watched = _WatchedInstance(polling_delays(self._maximal_waiting_time))
+                self._watched[scenario_instance_id] = watched
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return watched.future
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._watched:
+                    self._thread = None
+                    return
+                now = time.monotonic()
+                due = [id for id, watched in self._watched.items() if watched.deadline <= now]
+                next_deadline = min(watched.deadline for watched in self._watched.values())
+
+            if not due:
+                self._wakeup.wait(next_deadline - now)
+                self._wakeup.clear()
+                continue
+
+            for scenario_instance_id in due:
+                self._poll(scenario_instance_id)
+
+    def _poll(self, scenario_instance_id):
+        watched = self._watched[scenario_instance_id]
+        try:
+            response = self._check_status(scenario_instance_id, watched)
+        except Exception as error:
+            with self._lock:
+                del self._watched[scenario_instance_id]
+            watched.future.set_exception(error)
+        else:
+            if response is None:
+                watched.deadline = time.monotonic() + next(watched.delays)
+            else:
+                with self._lock:
+                    del self._watched[scenario_instance_id]
+                watched.future.set_result(response)
+
+    def _check_status(self, scenario_instance_id, watched):
+        self._status.args.scenario_instance_id = scenario_instance_id
+        response = self._status.execute(False).json()
+        status = response.get('status')
+        if status is None:
+            watched.retries_left -= 1
+            if not watched.retries_left:
+                raise ActionFailedError('scenario instance status could not be fetched', None)
+            logging.getLogger(__name__).warning(
+                    'Error while fetching scenario status:\n%s\n\n%d retries left',
+                    PprintFormatter(response), watched.retries_left)
+        elif status in ('Finished Ko',):
+            raise ActionFailedError('scenario instance failed (status is \'{}\')'.format(status), None)
+        elif status in ('Finished', 'Finished Ok', 'Stopped'):
+            return response
+        else:
+            watched.retries_left = MAX_RETRIES_STATUS
+
+
 class DataProcessor:
     """Helper class that retrieves data from scenario instances
     and ease information extraction.
@@ -362,7 +515,7 @@ class DataProcessor:
                 raise TypeError('instance is expected to be an OpenBach scenario instance')
         self._instance = _instance
 
-    def add_callback(self, label, callback, openbach_functions):
+    def add_callback(self, label, callback, openbach_functions, fields=None, logs=False):
         """Register a callback to be run on the data gathered from the collector.
 
         The data returned from the callback will be accessible under the provided
@@ -373,8 +526,12 @@ class DataProcessor:
         target start_job_instance openbach_function that the callback should
         operate on. This is meant to accept an entry from a call to the scenario
         builder's `Scenario.extract_function_id` call.
+
+        Only the data of the job instances targeted by a callback are fetched
+        from the collector. Use `fields` to restrict the statistics retrieved
+        for this job instance and `logs` to also retrieve its logs.
         """
-        self._post_processing[tuple(openbach_functions)] = (label, callback)
+        self._post_processing[tuple(openbach_functions)] = (label, callback, fields, logs)
 
     def _extract_callback(self, scenario_instance, parent_scenarios=()):
         for function in scenario_instance['openbach_functions']:
@@ -384,21 +541,65 @@ class DataProcessor:
             with suppress(KeyError):
                 yield function['job']['id'], self._post_processing[parents]
 
-    def post_processing(self):
-        """Actually fetches the raw data from the collector and run callbacks on them"""
+    def _fetch_jobs(self, callbacks):
+        """Retrieve the data of the job instances referenced by the
+        registered callbacks, grouping them by requested fields so
+        that a minimal amount of queries are issued.
+        """
+        queries = {}
+        for job_instance_id, (_, _, fields, logs) in callbacks.items():
+            fields = None if fields is None else tuple(sorted(fields))
+            queries.setdefault((fields, logs), []).append(job_instance_id)
+
+        jobs = {}
+        for (fields, logs), job_instance_ids in queries.items():
+            fields = None if fields is None else list(fields)
+            jobs.update(self._collector.jobs(job_instance_ids, fields, logs))
+        return jobs
+
+    def post_processing(self, workers=None):
+        """Actually fetches the raw data from the collector and run callbacks on them.
+
+        Callbacks are run one after the other by default. Use `workers` to
+        dispatch them to a pool of processes instead (0 meaning one process
+        per CPU); callbacks must then be picklable, module-level, functions.
+        """
+        return dict(self.iter_post_processing(workers))
+
+    def iter_post_processing(self, workers=None):
+        """Same as `post_processing` but generate (label, result) pairs
+        as soon as each callback is done instead of a dictionary.
+        """
         callbacks = dict(self._extract_callback(self._instance))
+        if not callbacks:
+            self._post_processing.clear()
+            return
 
-        try:
-            scenario, = self._collector.scenarios(scenario_instance_id=self._instance['scenario_instance_id'])
-        except ValueError:
+        jobs = self._fetch_jobs(callbacks)
+        if not jobs:
             exit('cannot retrieve scenario instance data from database')
         self._post_processing.clear()
 
-        return {
-                callbacks[job.instance_id][0]: callbacks[job.instance_id][1](job)
-                for job in scenario.jobs if job.instance_id in callbacks
+        jobs = {
+                job_instance_id: job
+                for job_instance_id, job in jobs.items()
+                if job_instance_id in callbacks
         }
 
+        if workers is None:
+            for job_instance_id, job in jobs.items():
+                label, callback, *_ = callbacks[job_instance_id]
+                yield label, callback(job)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers or None) as executor:
+            futures = {}
+            for job_instance_id, job in jobs.items():
+                label, callback, *_ = callbacks[job_instance_id]
+                futures[executor.submit(_run_callback, callback, job.columns)] = label
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
 
 class PprintFormatter:
     def __init__(self, obj, width=300):
@@ -409,6 +610,10 @@ class PprintFormatter:
         return pprint.pformat(self.obj, width=self.width)
 
 
+def _run_callback(callback, job_columns):
+    return callback(Job.load_columns(job_columns))
+
+
 def _convert_time(duration):
     amount, unit = re.match('(\d+)(d$|h$|m$|s$|ms$)', duration).groups()
     unit = {'s': 'seconds', 'm': 'minutes', 'd': 'days', 'h': 'hours', 'ms': 'milliseconds'}[unit]
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+__author__ = 'Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>'
+
+
+import io
+import sys
+import json
+import tempfile
+import unittest
+import contextlib
+import warnings
+from pathlib import Path
+from unittest import mock
+
+import requests
+from scenario_builder import Scenario
+
+from auditorium_scripts import add_job, push_file
+from auditorium_scripts.frontend import FrontendBase, MultipartBody, ActionFailedError
+from auditorium_scripts.install_agent import InstallAgent, install_agents
+from auditorium_scripts.campaign_runner import CampaignRunner
+from auditorium_scripts.create_scenario import CreateScenario
+from auditorium_scripts.modify_scenario import ModifyScenario
+from auditorium_scripts.scenario_observer import ScenarioObserver
+from auditorium_scripts.get_scenario_instance_data import GetScenarioInstanceData
+from auditorium_scripts.delete_scenario_instances import DeleteScenarioInstances
+
+
+def parsed_frontend():
+    frontend = FrontendBase('OpenBACH — Tests')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        frontend.parse(['--controller', '127.0.0.1'])
+    return frontend
+
+
+def response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO()
+    return response
+
+
+class TestSharedState(unittest.TestCase):
+    def test_get_scenario_instance_data(self):
+        frontend = parsed_frontend()
+        with tempfile.TemporaryDirectory() as directory:
+            # Mimic ScenarioObserver._fetch_scenario_instance_data
+            frontend.args.path = Path(directory)
+            frontend.args.file = [('fping', 'rtt')]
+            fetcher = frontend.share_state(GetScenarioInstanceData)
+            fetcher.args.scenario_instance_id = [42]
+            self.assertFalse(hasattr(fetcher.args, 'jobs'))
+            self.assertFalse(hasattr(fetcher.args, 'progress'))
+
+            with mock.patch.object(fetcher, 'download', return_value=response(200)) as download:
+                responses = fetcher.execute(False)
+
+        self.assertEqual([response.status_code for response in responses], [200])
+        download.assert_called_once_with(
+                'scenario_instance/42/archive',
+                Path(directory, 'scenario_instance_42.tar.gz'),
+                None, fping='rtt')
+
+
+    def test_delete_scenario_instances(self):
+        frontend = parsed_frontend()
+        frontend.args.project_name = 'Project'
+        frontend.args.scenario_name = 'Scenario'
+        deleter = frontend.share_state(DeleteScenarioInstances)
+        deleter.args.scenario_instance_id = [3]
+
+        with mock.patch.object(deleter, 'request', return_value=response(204)) as request:
+            deleter.execute(False)
+        request.assert_called_once_with(
+                'DELETE', 'scenario_instance/3/',
+                show_response_content=False, check_status=False)
+
+
+class TestDownload(unittest.TestCase):
+    def test_unsatisfiable_ranges_exhaust_retries(self):
+        frontend = parsed_frontend()
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = Path(directory, 'data.csv')
+            partial = filepath.with_name('data.csv.part')
+
+            def request(*args, **kwargs):
+                partial.write_bytes(b'stale')
+                return response(416)
+
+            partial.write_bytes(b'stale')
+            with mock.patch.object(frontend, 'request', side_effect=request):
+                with self.assertRaises(requests.HTTPError):
+                    frontend.download('scenario_instance/42/archive', filepath)
+            self.assertFalse(filepath.exists())
+
+
+class ExitingScript(FrontendBase):
+    def __init__(self):
+        super().__init__('OpenBACH — Tests')
+        self.parser.add_argument('how', choices=['error', 'exit', 'success'])
+
+    def execute(self, show_response_content=True):
+        if self.args.how == 'error':
+            self.parser.error('unexpected response')
+        if self.args.how == 'exit':
+            sys.exit('controller went away')
+
+
+class TestRunBatch(unittest.TestCase):
+    def test_exits_during_execution(self):
+        frontend = parsed_frontend()
+        output = io.StringIO()
+        commands = ['exiting error', 'exiting exit', 'exiting success']
+        with mock.patch('auditorium_scripts.frontend._find_script', return_value=ExitingScript):
+            with contextlib.redirect_stderr(io.StringIO()):
+                failures = frontend.run_batch(commands, output)
+
+        self.assertEqual(failures, 2)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([result['line'] for result in results], [1, 2, 3])
+        self.assertEqual([result['ok'] for result in results], [False, False, True])
+        self.assertIn('unexpected response', results[0]['error'])
+        self.assertEqual(results[1]['error'], 'controller went away')
+
+
+class TestAddJob(unittest.TestCase):
+    def test_upload_skipped_only_if_unchanged_on_controller(self):
+        frontend = parsed_frontend()
+        description = {'general': {'name': 'fping', 'job_version': '1.0'}}
+        uploads = []
+
+        def request(verb, route, **kwargs):
+            content = response(200 if description else 404)
+            content._content = json.dumps(description).encode()
+            return content
+
+        def upload(route, fileobj, filename, **kwargs):
+            uploads.append((filename, fileobj.read()))
+            return response(200)
+
+        def add(folder):
+            adder = frontend.share_state(add_job.AddJob)
+            adder.args.job_name = 'fping'
+            adder.args.path = adder.args.tarball = None
+            adder.args.files = str(folder)
+            with mock.patch.object(adder, 'request', side_effect=request):
+                with mock.patch.object(adder, 'upload', side_effect=upload):
+                    adder.execute(False)
+            return len(uploads)
+
+        with tempfile.TemporaryDirectory() as directory:
+            folder = Path(directory, 'fping')
+            folder.mkdir()
+            Path(folder, 'install_fping.yml').write_text('---\n')
+            with mock.patch.object(add_job, 'DIGESTS_CACHE', Path(directory, 'jobs_digests.json')):
+                self.assertEqual(add(folder), 1)
+                self.assertEqual(add(folder), 1)
+                # Modified by another client
+                description['general']['job_version'] = '1.1'
+                self.assertEqual(add(folder), 2)
+                self.assertEqual(add(folder), 2)
+                # Deleted by another client
+                description.clear()
+                self.assertEqual(add(folder), 3)
+
+        filename, content = uploads[0]
+        self.assertEqual(filename, 'fping.tar.gz')
+        self.assertEqual(content[:2], b'\x1f\x8b')
+
+
+class TestPushFile(unittest.TestCase):
+    def test_distribute_stores_the_file_on_every_run(self):
+        frontend = parsed_frontend()
+        uploads = []
+        pushes = []
+
+        def upload(route, fileobj, **kwargs):
+            uploads.append((kwargs['path'], fileobj.read()))
+            return response(200)
+
+        def request(verb, route, show_response_content, **kwargs):
+            pushes.append((kwargs['agent_ip'], kwargs['local_path']))
+            return response(200)
+
+        def distribute(agents, skip_pushed=False):
+            pusher = frontend.share_state(push_file.PushFile)
+            pusher.args.keep = False
+            pusher.args.distribute = True
+            pusher.args.local_file = io.BytesIO(b'content')
+            pusher.args.local_file.name = 'video.mp4'
+            pusher.args.remote_path = '/tmp/video.mp4'
+            pusher.args.stored_path = None
+            pusher.args.agents = agents
+            pusher.args.user = pusher.args.group = None
+            pusher.args.jobs = 2
+            pusher.args.skip_pushed = skip_pushed
+            with mock.patch.object(push_file.PushFile, 'upload', side_effect=upload):
+                with mock.patch.object(push_file.PushFile, 'request', side_effect=request):
+                    pusher.execute(False)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(push_file, 'CHECKSUMS_CACHE', Path(directory, 'pushed_files.json')):
+                distribute(['10.0.0.1', '10.0.0.2'])
+                distribute(['10.0.0.1', '10.0.0.2'])
+                self.assertEqual(len(uploads), 2)
+                self.assertEqual(len(pushes), 4)
+                distribute(['10.0.0.1', '10.0.0.2'], skip_pushed=True)
+                self.assertEqual(len(uploads), 2)
+                distribute(['10.0.0.1', '10.0.0.3'], skip_pushed=True)
+
+        self.assertEqual(uploads, [('distribute/video.mp4', b'content')] * 3)
+        self.assertEqual(pushes[-1], ('10.0.0.3', ['distribute/video.mp4']))
+        self.assertEqual(len(pushes), 5)
+
+
+EXECUTOR = '''
+from scenario_builder import Scenario
+from auditorium_scripts.scenario_observer import ScenarioObserver
+
+
+def main(argv=None):
+    observer = ScenarioObserver()
+    observer.add_scenario_argument('--duration', type=int, default=10)
+    args = observer.parse(argv, 'Campaign')
+    observer.launch_and_wait(Scenario(args.scenario_name, str(args.duration)))
+'''
+
+
+class TestCampaignRunner(unittest.TestCase):
+    def test_scenarios_are_captured_without_patching(self):
+        frontend = parsed_frontend()
+        launch_and_wait = ScenarioObserver._launch_and_wait
+        with tempfile.TemporaryDirectory() as directory:
+            executor = Path(directory, 'executor_campaign.py')
+            executor.write_text(EXECUTOR)
+            runner = frontend.share_state(CampaignRunner)
+            runner.args.executor = executor
+            runner.args.executor_arguments = ['Project']
+            runner.args.matrix = None
+            runner.args.vary = [['duration', '1', '2']]
+            runs = runner._capture_runs()
+
+        self.assertIs(ScenarioObserver._launch_and_wait, launch_and_wait)
+        self.assertEqual([run.builder.description for run in runs], ['1', '2'])
+        for run in runs:
+            self.assertIsInstance(run.observer, ScenarioObserver)
+            self.assertEqual(run.observer.args.project_name, 'Project')
+
+
+class TestInstallAgents(unittest.TestCase):
+    def test_orders_are_monitored_together(self):
+        frontend = parsed_frontend()
+        orders = []
+
+        def request(installer, verb, route, **kwargs):
+            orders.append(kwargs['address'])
+            return response(400 if kwargs['address'] == '10.0.0.3' else 200)
+
+        state = mock.Mock()
+        state.json.return_value = {'install': {'returncode': 200, 'response': None}}
+
+        agents = [('10.0.0.{}'.format(i), '10.0.0.1', 'Agent{}'.format(i)) for i in range(1, 4)]
+        with mock.patch.object(InstallAgent, 'request', autospec=True, side_effect=request):
+            with mock.patch.object(InstallAgent, 'query_state', return_value=state) as query_state:
+                with self.assertRaises(ActionFailedError) as error:
+                    install_agents(frontend, agents, show_response_content=False)
+
+        self.assertEqual(orders, ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        self.assertEqual(query_state.call_count, 2)
+        self.assertIn('10.0.0.3', error.exception.message)
+
+
+class TestMultipartBody(unittest.TestCase):
+    def test_in_memory_file(self):
+        fileobj = io.BytesIO(b'skipped content')
+        fileobj.seek(8)
+        body = MultipartBody({'name': 'fping'}, 'file', fileobj, 'fping.tar.gz', chunk_size=4)
+
+        content = b''
+        while True:
+            chunk = body.read(8192)
+            if not chunk:
+                break
+            content += chunk
+        self.assertEqual(len(body), len(content))
+        self.assertIn(b'name="name"\r\n\r\nfping\r\n', content)
+        self.assertIn(b'\r\n\r\ncontent\r\n--', content)
+        self.assertNotIn(b'skipped', content)
+
+
+class TestScenarioObserverUpload(unittest.TestCase):
+    def test_scenarios_sharing_a_name(self):
+        main = Scenario('main')
+        for description in ('First definition', 'Second definition'):
+            sub = Scenario('sub', description)
+            main.add_function('start_scenario_instance').configure(sub)
+
+        observer = ScenarioObserver()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            observer.parse(['--controller', '127.0.0.1', 'run'])
+
+        uploads = []
+
+        def share_state(other_cls):
+            instance = mock.Mock()
+            instance.args = mock.Mock()
+            if other_cls in (CreateScenario, ModifyScenario):
+                def execute(show_response_content=True):
+                    uploads.append((other_cls, instance.args.scenario['name']))
+                    return response(200)
+                instance.execute.side_effect = execute
+            else:
+                instance.execute.return_value.json.return_value = []
+            return instance
+
+        with mock.patch.object(observer, 'share_state', side_effect=share_state):
+            observer._send_scenario_to_controller(main)
+
+        self.assertEqual(uploads, [
+            (CreateScenario, 'sub'),
+            (ModifyScenario, 'sub'),
+            (CreateScenario, 'main'),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
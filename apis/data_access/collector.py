@@ -30,6 +30,7 @@ __author__ = 'Adrien THIBAUD <adrien.thibaud@toulouse.viveris.com>'
 __credits__ = 'contributions: Mathias ETTINGER'
 __all__ = ['CollectorConnection']
 
+import itertools
 from contextlib import suppress
 
 from .influxdb_tools import InfluxDBConnection
@@ -37,6 +38,9 @@ from .elasticsearch_tools import ElasticSearchConnection
 from .result_data import extract_jobs, get_or_create_scenario
 
 
+JOB_INSTANCES_BATCH_SIZE = 50  # Job instance IDs per query
+
+
 class CollectorConnection:
     """Wrapper around the two supported databases: InfluxDB and ElasticSearch.
 
@@ -163,6 +167,41 @@ class CollectorConnection:
             with suppress(KeyError):
                 yield scenarios[(scenario_instance_id,)]
 
+    def jobs(
+            self, job_instance_ids, fields=None, logs=True,
+            condition=None, timestamps=None,
+            batch_size=JOB_INSTANCES_BATCH_SIZE):
+        """Fetch data from InfluxDB and, optionally, ElasticSearch for
+        the given job instance IDs only and return the according `Job`s
+        instances in a dictionary indexed by job instance ID.
+
+        IDs are grouped into batches so that a single query per batch
+        and per database is issued, instead of fetching the whole
+        scenario instance they belong to.
+        """
+        jobs = {}
+        job_instance_ids = iter(sorted(set(job_instance_ids)))
+        while True:
+            batch = list(itertools.islice(job_instance_ids, batch_size))
+            if not batch:
+                break
+
+            response = self.influxdb.statistics(
+                    job_instance=batch, fields=fields,
+                    condition=condition, timestamps=timestamps)
+            for scenario in response:
+                for job in scenario.own_jobs:
+                    jobs[job.instance_id] = job
+
+            if logs:
+                response = self.elasticsearch.logs(job_instance=batch, timestamps=timestamps)
+                for scenario in response:
+                    for job in scenario.jobs:
+                        existing_job = jobs.setdefault(job.instance_id, job)
+                        existing_job.logs_data = job.logs_data
+
+        return jobs
+
     def import_scenario(self, scenario_instance):
         """Import the results of the `Scenario` instance in
         InfluxDB and ElasticSearch"""
@@ -92,7 +92,7 @@ def tags_to_query(scenario, job, agent, job_instance, timestamps):
         'job_instance_id:{}': job_instance,
     }
     query = ' && '.join(
-            pattern.format(value)
+            pattern.format(_query_value(value))
             for pattern, value in fields.items()
             if value is not None)
     if query:
@@ -103,6 +103,15 @@ def tags_to_query(scenario, job, agent, job_instance, timestamps):
     return {'query': {'bool': filter_query}}
 
 
+def _query_value(value):
+    """Format a value for a query string, allowing a
+    collection of values to match any of them.
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return '({})'.format(' OR '.join(map(str, value)))
+    return value
+
+
 def extract_field_or_None(record, field_name, converter=str):
     """Helper function to easily convert a result from
     ElasticSearch into a meaningful data.
@@ -146,6 +155,7 @@ def parse_logs(elasticsearch_result):
             owner = get_or_create_scenario(owner, scenarios)
             if owner is not scenario:
                 scenario.owner = owner
+                owner.sub_scenarios[(scenario.instance_id,)] = scenario
             job = scenario.get_or_create_job(job, job_id, agent)
 
             _id = record['_id']
@@ -213,7 +213,11 @@ def escape_field(name, value):
 
 
 def tags_to_condition(scenario, agent, job_instance, suffix, extra_condition=None, *, subscenarios=False):
-    """Concatenate the given tags values into a single condition"""
+    """Concatenate the given tags values into a single condition.
+
+    Agent, job instance and suffix can also be given as a collection
+    of values to match any of them in a single query.
+    """
 
     tags = {
         '@agent_name': agent,
@@ -221,7 +225,7 @@ def tags_to_condition(scenario, agent, job_instance, suffix, extra_condition=Non
         '@suffix': suffix,
     }
     conditions = [
-            ConditionTag(name, Operator.Equal, value)
+            _tag_condition(name, value)
             for name, value in tags.items()
             if value is not None
     ]
@@ -241,6 +245,15 @@ def tags_to_condition(scenario, agent, job_instance, suffix, extra_condition=Non
     return ConditionAnd(*conditions)
 
 
+def _tag_condition(name, value):
+    """Build a condition matching a single tag value or, if a
+    collection of values is provided, any of them.
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return ConditionOr(*(ConditionTag(name, Operator.Equal, v) for v in value))
+    return ConditionTag(name, Operator.Equal, value)
+
+
 def select_query(job_name=None, field_names=None, condition=None):
     """Build a SELECT query"""
     quote_it = '"{}"'.format
@@ -292,6 +292,27 @@ class Job:
             'statistics': self.stats,
         }
 
+    @property
+    def columns(self):
+        """Build a compact, columnar representation of this Job
+        instance, cheap to transfer between processes.
+        """
+        return (
+            self.name, self.instance_id, self.agent,
+            {suffix: stats.columns for (suffix,), stats in self.statistics_data.items()},
+            self.logs,
+        )
+
+    @classmethod
+    def load_columns(cls, job_columns):
+        """Generate a Job instance from a columnar representation"""
+        name, instance_id, agent, statistics, logs = job_columns
+        job_instance = cls(name, instance_id, agent)
+        job_instance.logs_data = Log.load(logs)
+        for suffix, columns in statistics.items():
+            job_instance.statistics_data[(suffix,)] = Statistic.load_columns(columns)
+        return job_instance
+
     @classmethod
     def load(cls, job_data):
         """Generate a Job instance from a JSON representation"""
@@ -339,6 +360,32 @@ class Statistic:
             for timestamp, stats in self.dated_data.items()
         ]
 
+    @property
+    def columns(self):
+        """Build a columnar representation of this Statistic instance:
+        a list of timestamps and a list of values for each field name,
+        using None where a field is missing for a given timestamp.
+        """
+        timestamps = list(self.dated_data)
+        names = {name for stats in self.dated_data.values() for name in stats}
+        return timestamps, {
+            name: [stats.get(name) for stats in self.dated_data.values()]
+            for name in names
+        }
+
+    @classmethod
+    def load_columns(cls, statistics_columns):
+        """Generate a Statistic instance from a columnar representation"""
+        timestamps, columns = statistics_columns
+        statistic_instance = cls()
+        for index, timestamp in enumerate(timestamps):
+            statistic_instance.add_statistic(timestamp, **{
+                name: values[index]
+                for name, values in columns.items()
+                if values[index] is not None
+            })
+        return statistic_instance
+
     @classmethod
     def load(cls, statistics_data):
         """Generate a Statistic instance from a JSON representation"""
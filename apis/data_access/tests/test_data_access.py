@@ -38,6 +38,7 @@ from data_access.influxdb_tools import (Operator,
         escape_names, escape_field, tags_to_condition,
         select_query, measurement_query, delete_query, tag_query,
         parse_influx, parse_statistics, parse_orphans, line_protocol)
+from data_access.result_data import Job
 
 
 class TestDataAccessInfluxDB(unittest.TestCase):
@@ -121,6 +122,12 @@ class TestDataAccessInfluxDB(unittest.TestCase):
                 ' AND ("@agent_name" = \'lulu\') AND ("@scenario_instance_id" = \'2\')'
                 ' AND ("@job_instance_id" = \'3\') AND ("@suffix" = \'Test\')')
 
+    def test_tags_to_condition_with_many_values(self):
+        condition = tags_to_condition(None, None, [3, 4], None)
+        self.assertEqual(
+                str(condition),
+                '(("@job_instance_id" = \'3\') OR ("@job_instance_id" = \'4\'))')
+
     def test_queries(self):
         simple_condition = ConditionField('field_name', Operator.Equal, 42)
         select_all = select_query('job_name', [], simple_condition)
@@ -251,5 +258,21 @@ class TestDataAccessInfluxDB(unittest.TestCase):
     # TODO test_orphans_parse, test_line_protocol / test_f
 
 
+class TestDataAccessResultData(unittest.TestCase):
+    def test_job_columns(self):
+        job = Job('Debug', 12, 'Controller')
+        statistics = job.get_or_create_statistics('Flow1')
+        statistics.add_statistic(1495094155683, field=1, other='a')
+        statistics.add_statistic(1495094163291, field=2)
+        job.get_or_create_statistics().add_statistic(1495094165203, field=3)
+
+        name, instance_id, agent, columns, logs = job.columns
+        self.assertEqual((name, instance_id, agent, logs), ('Debug', 12, 'Controller', []))
+        self.assertEqual(columns['Flow1'], (
+                [1495094155683, 1495094163291],
+                {'field': [1, 2], 'other': ['a', None]}))
+        self.assertEqual(Job.load_columns(job.columns), job)
+
+
 if __name__ == '__main__':
     unittest.main()
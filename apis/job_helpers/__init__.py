@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""OpenBach's Jobs helpers
+
+This package gathers building blocks shared by the jobs themselves,
+on the agents where the OpenBACH API is installed, so that they need
+not ship their own copy of them.
+"""
+
+
+__author__ = 'Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>'
+__all__ = ['PeriodicSampler', 'ProcFile', 'StatisticsAggregator']
+
+
+from .sampling import PeriodicSampler
+from .procfs import ProcFile
+from .aggregation import StatisticsAggregator
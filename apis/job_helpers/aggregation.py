@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""Windowed aggregation of the statistics of high-rate jobs"""
+
+
+__author__ = 'Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>'
+
+
+import math
+import numbers
+from collections import defaultdict
+
+
+PERCENTILES = (50, 90, 99)
+
+
+class StatisticsAggregator:
+    """Stand-in for collect_agent.send_stat that summarizes numerical
+    statistics over time windows of `window` seconds instead of sending
+    each of them.
+
+    For each statistic `name` received during a window, a single batch
+    holds `name_count`, `name_min`, `name_max`, `name_mean` and
+    `name_pXX` for each of the `percentiles`, timestamped at the end
+    of the window. Statistics sent with a suffix are aggregated apart
+    and non numerical values are sent as is.
+
+    A window of 0 (or None) sends every statistic as is. Statistics are
+    sent using `send_stat`, collect_agent.send_stat by default.
+    """
+
+    def __init__(self, window, percentiles=PERCENTILES, send_stat=None):
+        self.window = int(window * 1000) if window else 0
+        self.percentiles = percentiles
+        if send_stat is None:
+            # Only available on agents
+            import collect_agent
+            send_stat = collect_agent.send_stat
+        self.send_stat = send_stat
+        self.current = None
+        self.values = defaultdict(lambda: defaultdict(list))
+
+    def __call__(self, timestamp, suffix=None, **statistics):
+        if not self.window:
+            self._send(timestamp, suffix, statistics)
+            return
+
+        window = timestamp // self.window
+        if window != self.current:
+            self.flush()
+            self.current = window
+
+        values = self.values[suffix]
+        passthrough = {}
+        for name, value in statistics.items():
+            if isinstance(value, numbers.Real) and not isinstance(value, bool):
+                values[name].append(value)
+            else:
+                passthrough[name] = value
+        if passthrough:
+            self._send(timestamp, suffix, passthrough)
+
+    def expire(self, timestamp):
+        """Flush the current window if `timestamp` is past its end; to
+        be called periodically by jobs whose events can stop arriving.
+        """
+        if self.window and self.current is not None and timestamp // self.window != self.current:
+            self.flush()
+
+    def flush(self):
+        """Send the summary of the current window, if any"""
+        if self.current is None:
+            return
+
+        timestamp = (self.current + 1) * self.window
+        for suffix, values in self.values.items():
+            summary = {}
+            for name, samples in values.items():
+                summary.update(self.summarize(name, samples))
+            if summary:
+                self._send(timestamp, suffix, summary)
+        self.values.clear()
+        self.current = None
+
+    def summarize(self, name, samples):
+        samples.sort()
+        count = len(samples)
+        summary = {
+                name + '_count': count,
+                name + '_min': samples[0],
+                name + '_max': samples[-1],
+                name + '_mean': math.fsum(samples) / count,
+        }
+        for percentile in self.percentiles:
+            # Nearest-rank method
+            rank = max(math.ceil(percentile * count / 100), 1)
+            summary['{}_p{:g}'.format(name, percentile)] = samples[rank - 1]
+        return summary
+
+    def _send(self, timestamp, suffix, statistics):
+        if suffix is None:
+            self.send_stat(timestamp, **statistics)
+        else:
+            self.send_stat(timestamp, suffix=suffix, **statistics)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+"""Reading of procfs files by monitoring jobs"""
+
+
+__author__ = 'Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>'
+
+
+import os
+
+
+PROC_READ_SIZE = 65536
+
+
+class ProcFile:
+    """A file of procfs opened once and read again from its beginning
+    on each sample, which makes the kernel generate it anew.
+
+    Files are read in a single call of at most `size` bytes, doubled
+    each time the content fills it as it may have been truncated.
+    """
+
+    def __init__(self, path, size=PROC_READ_SIZE):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.size = size
+
+    def read(self):
+        content = os.pread(self.fd, self.size, 0)
+        while len(content) == self.size:
+            # Content may have been truncated, read it again
+            self.size *= 2
+            content = os.pread(self.fd, self.size, 0)
+        return content
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""Periodic sampling loop of monitoring jobs"""
+
+
+__author__ = 'Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>'
+
+
+import time
+
+
+class PeriodicSampler:
+    """Iterate at a fixed period on deadlines of the monotonic clock.
+
+    Deadlines are computed from the start of the iteration rather than
+    from the end of the previous sample, so the period does not drift
+    with the time spent processing samples. When processing overruns
+    one or several deadlines, they are skipped and the next sample is
+    taken on the next deadline to come, instead of taking late samples
+    in a row to catch up.
+
+    Unless `align` is False, deadlines are aligned on multiples of the
+    interval since the epoch so samples of several agents with synced
+    clocks are taken at the same times.
+
+    Each iteration yields the time actually elapsed since the previous
+    sample, to be used instead of the interval to compute rates, and
+    the amount of deadlines skipped since then.
+    """
+
+    def __init__(self, interval, align=True):
+        if interval <= 0:
+            raise ValueError('sampling interval must be positive')
+        self.interval = interval
+        self.align = align
+        self.missed_deadlines = 0
+
+    def __iter__(self):
+        interval = self.interval
+        deadline = time.monotonic()
+        if self.align:
+            deadline += -time.time() % interval
+            _sleep_until(deadline)
+        previous = time.monotonic()
+
+        while True:
+            deadline += interval
+            now = time.monotonic()
+            missed = 0
+            if now > deadline:
+                missed = int((now - deadline) // interval) + 1
+                deadline += missed * interval
+                self.missed_deadlines += missed
+            _sleep_until(deadline)
+
+            now = time.monotonic()
+            yield now - previous, missed
+            previous = now
+
+
+def _sleep_until(deadline):
+    delay = deadline - time.monotonic()
+    while delay > 0:
+        time.sleep(delay)
+        delay = deadline - time.monotonic()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+__author__ = 'Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>'
+
+
+import tempfile
+import unittest
+import itertools
+from unittest import mock
+
+from job_helpers import PeriodicSampler, ProcFile, StatisticsAggregator
+
+
+class FakeClock:
+    """Stand-in for the time module where sleeping advances the clocks
+    instead of waiting, so deadlines are computed deterministically.
+    """
+
+    def __init__(self, monotonic=100.0, epoch=1000.125):
+        self.now = monotonic
+        self.offset = epoch - monotonic
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now + self.offset
+
+    def sleep(self, delay):
+        self.now += delay
+
+
+class TestPeriodicSampler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('job_helpers.sampling.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_invalid_interval(self):
+        with self.assertRaises(ValueError):
+            PeriodicSampler(0)
+
+    def test_deadlines(self):
+        sampler = PeriodicSampler(0.25, align=False)
+        samples = list(itertools.islice(sampler, 5))
+
+        self.assertEqual(self.clock.monotonic(), 101.25)
+        self.assertEqual(samples, [(0.25, 0)] * 5)
+        self.assertEqual(sampler.missed_deadlines, 0)
+
+    def test_aligned_deadlines(self):
+        sampler = PeriodicSampler(0.25)
+        samples = iter(sampler)
+        next(samples)
+        self.assertEqual(self.clock.time(), 1000.5)
+        next(samples)
+        self.assertEqual(self.clock.time(), 1000.75)
+
+    def test_overrun_deadlines_are_skipped(self):
+        sampler = PeriodicSampler(0.25, align=False)
+        samples = iter(sampler)
+        next(samples)
+        self.clock.sleep(0.625)
+        elapsed, missed = next(samples)
+
+        self.assertEqual(missed, 2)
+        self.assertEqual(sampler.missed_deadlines, 2)
+        self.assertEqual(elapsed, 0.75)
+        self.assertEqual(self.clock.monotonic(), 101.0)
+
+
+class TestProcFile(unittest.TestCase):
+    def test_read_again(self):
+        with tempfile.NamedTemporaryFile() as content:
+            content.write(b'cpu 1 2 3\n')
+            content.flush()
+            procfile = ProcFile(content.name, size=4)
+            self.assertEqual(procfile.read(), b'cpu 1 2 3\n')
+            self.assertEqual(procfile.size, 16)
+
+            content.seek(0)
+            content.write(b'cpu 4 5 6\n')
+            content.flush()
+            self.assertEqual(procfile.read(), b'cpu 4 5 6\n')
+            procfile.close()
+
+
+class TestStatisticsAggregator(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.send_stat = lambda timestamp, **statistics: self.sent.append((timestamp, statistics))
+
+    def test_passthrough(self):
+        aggregator = StatisticsAggregator(0, send_stat=self.send_stat)
+        aggregator(1000, rtt=1.5)
+        aggregator(1001, suffix='eth0', rtt=2)
+        aggregator.flush()
+        self.assertEqual(self.sent, [(1000, {'rtt': 1.5}), (1001, {'suffix': 'eth0', 'rtt': 2})])
+
+    def test_windows(self):
+        aggregator = StatisticsAggregator(1, send_stat=self.send_stat)
+        for index, rtt in enumerate(range(1, 11)):
+            aggregator(1000 + index, rtt=rtt, status='ok')
+        aggregator(1500, suffix='eth0', rtt=42)
+        aggregator.expire(1999)
+        self.assertEqual(len(self.sent), 10)
+        aggregator.expire(2000)
+        aggregator(2100, rtt=3)
+        aggregator.flush()
+
+        self.assertEqual(self.sent[0], (1000, {'status': 'ok'}))
+        self.assertEqual(self.sent[10], (2000, {
+            'rtt_count': 10, 'rtt_min': 1, 'rtt_max': 10, 'rtt_mean': 5.5,
+            'rtt_p50': 5, 'rtt_p90': 9, 'rtt_p99': 10,
+        }))
+        timestamp, statistics = self.sent[11]
+        self.assertEqual((timestamp, statistics['suffix'], statistics['rtt_count']), (2000, 'eth0', 1))
+        timestamp, statistics = self.sent[12]
+        self.assertEqual((timestamp, statistics['rtt_mean']), (3000, 3))
+        self.assertEqual(len(self.sent), 13)
+
+
+if __name__ == '__main__':
+    unittest.main()
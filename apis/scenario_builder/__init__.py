@@ -41,11 +41,11 @@ through objects references rather than manual edition and indexing.
 __author__ = 'Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>'
 __version__ = 'v0.6.2'
 __all__ = [
-    'Scenario', 'Condition', 'Operand',
-    'ImproperlyConfiguredFunction',
+    'Scenario', 'ScenarioTemplate', 'Condition', 'Operand',
+    'ImproperlyConfiguredFunction', 'content_hash',
 ]
 
 
-from .core import Scenario
+from .core import Scenario, ScenarioTemplate, content_hash
 from .openbach_functions import ImproperlyConfiguredFunction
 from .conditions import Condition, Operand
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""Offline analysis of the schedule of built scenarios.
+
+Given the JSON of a scenario, as returned by `Scenario.build`, rebuild
+the dependency graph of its openbach functions (`wait_delay`,
+`wait_launched` and `wait_finished`) and estimate when each of them
+is launched and finished, without running anything on a platform.
+
+Jobs durations are taken from their `duration`-like arguments or from
+the `stop_job_instances` functions targeting them; sub-scenarios are
+analyzed recursively when their definition is provided.
+
+Run `python3 -m scenario_builder.analysis SCENARIO.json [SUBSCENARIO.json ...]`
+to get a report on the command line.
+"""
+
+import sys
+import json
+import argparse
+from collections import defaultdict
+
+
+DURATION_ARGUMENTS = ('duration', 'duration_time', 'call_duration')
+
+
+class ScheduleAnalysis:
+    """Result of the analysis of a built scenario.
+
+    Times are expressed in seconds relative to the start of the scenario.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.schedule = {}
+        self.total_duration = 0
+        self.critical_path = []
+        self.cycles = []
+        self.unreachable = set()
+        self.unbounded = set()
+        self.activity = []
+        self.idle_gaps = []
+
+    def launch(self, function_id):
+        """Estimated time at which the given function is launched"""
+        return self.schedule[function_id][0]
+
+    def finish(self, function_id):
+        """Estimated time at which the given function is finished"""
+        return self.schedule[function_id][1]
+
+    @property
+    def idle_time(self):
+        return sum(end - begin for begin, end in self.idle_gaps)
+
+    @property
+    def json(self):
+        """Build a JSON representation of this analysis"""
+        return {
+            'scenario_name': self.name,
+            'total_duration': self.total_duration,
+            'idle_time': self.idle_time,
+            'critical_path': [list(path) for path in self.critical_path],
+            'cycles': self.cycles,
+            'unreachable': sorted(self.unreachable),
+            'unbounded': sorted(self.unbounded),
+            'idle_gaps': self.idle_gaps,
+            'schedule': [
+                {'id': function_id, 'launch': launch, 'finish': finish}
+                for function_id, (launch, finish) in sorted(self.schedule.items())
+            ],
+        }
+
+    def __str__(self):
+        lines = [
+            'Scenario {}: estimated duration {:g}s, idle {:g}s'.format(
+                self.name, self.total_duration, self.idle_time),
+            'Critical path: {}'.format(' -> '.join('/'.join(map(str, path)) for path in self.critical_path)),
+        ]
+        lines.extend('Idle from {:g}s to {:g}s'.format(*gap) for gap in self.idle_gaps)
+        lines.extend('Cycle between functions {}'.format(cycle) for cycle in self.cycles)
+        if self.unreachable:
+            lines.append('Unreachable functions: {}'.format(sorted(self.unreachable)))
+        if self.unbounded:
+            lines.append('Functions without known duration: {}'.format(sorted(self.unbounded)))
+        return '\n'.join(lines)
+
+
+def analyze(scenario, scenarios=None, arguments=None, min_gap=0):
+    """Analyze the schedule of a built scenario.
+
+    `scenarios` maps names to built scenarios so that the ones started
+    through `start_scenario_instance` are analyzed too; `arguments` gives
+    values to the arguments of the scenario. Idle gaps shorter than
+    `min_gap` seconds are not reported.
+
+    Return a `ScheduleAnalysis` instance.
+    """
+    return _Analyzer(scenario, scenarios or {}, arguments or {}, min_gap).analyze()
+
+
+class _Analyzer:
+    def __init__(self, scenario, scenarios, arguments, min_gap, parents=()):
+        self.scenario = scenario
+        self.scenarios = scenarios
+        self.values = {**scenario.get('constants', {}), **arguments}
+        self.min_gap = min_gap
+        self.parents = parents + (scenario['name'],)
+        self.functions = {function['id']: function for function in scenario['openbach_functions']}
+        self.result = ScheduleAnalysis(scenario['name'])
+        self.subscenarios = {}
+
+    def resolve(self, value):
+        if isinstance(value, str) and value.startswith('$'):
+            value = self.values.get(value[1:], value)
+        return value
+
+    def number(self, value):
+        try:
+            return float(self.resolve(value))
+        except (TypeError, ValueError):
+            return None
+
+    def own_duration(self, function_id, function):
+        """Duration of the function itself, None if unknown"""
+        if 'start_job_instance' in function:
+            start = function['start_job_instance']
+            offset = self.number(start.get('offset', 0)) or 0
+            for name, job_arguments in start.items():
+                if name not in ('entity_name', 'offset', 'interval'):
+                    duration = _find_duration(job_arguments, self.number)
+                    return None if duration is None else offset + duration
+            return None
+
+        if 'start_scenario_instance' in function:
+            start = function['start_scenario_instance']
+            name = self.resolve(start['scenario_name'])
+            if name in self.parents or name not in self.scenarios:
+                return None
+            arguments = {key: self.resolve(value) for key, value in start.get('arguments', {}).items()}
+            analyzer = _Analyzer(self.scenarios[name], self.scenarios, arguments, self.min_gap, self.parents)
+            subscenario = self.subscenarios[function_id] = analyzer.analyze()
+            return subscenario.total_duration
+
+        return 0
+
+    def analyze(self):
+        result = self.result
+        dependencies = {}
+        for function_id, function in self.functions.items():
+            wait = function.get('wait', {})
+            dependencies[('L', function_id)] = (
+                    [('L', id) for id in wait.get('launched_ids', [])] +
+                    [('F', id) for id in wait.get('finished_ids', [])])
+            dependencies[('F', function_id)] = [('L', function_id)]
+
+        for function_id, function in self.functions.items():
+            stopped = function.get('stop_job_instances', {}).get('openbach_function_ids', [])
+            if 'stop_scenario_instance' in function:
+                stopped = [function['stop_scenario_instance']['openbach_function_id']]
+            for id in stopped:
+                if ('F', id) in dependencies:
+                    dependencies[('F', id)].append(('L', function_id))
+            for name, branches in (('if', ('openbach_functions_true', 'openbach_functions_false')),
+                                   ('while', ('openbach_functions_while', 'openbach_functions_end'))):
+                for branch in branches:
+                    for id in function.get(name, {}).get(branch, []):
+                        if ('L', id) in dependencies:
+                            dependencies[('L', id)].append(('L', function_id))
+
+        missing = {
+                node for node, requirements in dependencies.items()
+                if any(requirement not in dependencies for requirement in requirements)
+        }
+        durations = {id: self.own_duration(id, function) for id, function in self.functions.items()}
+        values, predecessors = self.propagate(dependencies, missing, durations)
+
+        for function_id in self.functions:
+            launch = values.get(('L', function_id))
+            finish = values.get(('F', function_id))
+            if launch is not None and finish is not None:
+                result.schedule[function_id] = (launch, finish)
+        result.total_duration = max((finish for _, finish in result.schedule.values()), default=0)
+
+        self.find_cycles(dependencies, values)
+        unresolved = {function_id for node, function_id in dependencies if node == 'L' and (node, function_id) not in values}
+        in_cycles = {function_id for cycle in result.cycles for function_id in cycle}
+        result.unreachable = unresolved - in_cycles
+
+        if result.schedule:
+            last = max(result.schedule, key=result.finish)
+            result.critical_path = self.critical_path(('F', last), predecessors, durations)
+        self.find_idle_gaps()
+        return result
+
+    def propagate(self, dependencies, missing, durations):
+        values = {}
+        predecessors = {}
+        remaining = {node: len(requirements) for node, requirements in dependencies.items()}
+        dependents = defaultdict(list)
+        for node, requirements in dependencies.items():
+            for requirement in requirements:
+                dependents[requirement].append(node)
+
+        def compute(node):
+            kind, function_id = node
+            if kind == 'L':
+                wait = self.number(self.functions[function_id].get('wait', {}).get('time', 0)) or 0
+                requirements = dependencies[node]
+                predecessor = max(requirements, key=values.get, default=None)
+                base = 0 if predecessor is None else values[predecessor]
+                return base + wait, predecessor
+
+            launch_node = ('L', function_id)
+            duration = durations[function_id]
+            candidates = [(values[stop], stop) for stop in dependencies[node][1:] if stop in values]
+            if duration is not None:
+                candidates.append((values[launch_node] + duration, launch_node))
+            elif not candidates:
+                self.result.unbounded.add(function_id)
+                candidates.append((values[launch_node], launch_node))
+            return min(candidates, key=lambda candidate: candidate[0])
+
+        queue = [node for node, count in remaining.items() if not count and node not in missing]
+        while True:
+            while queue:
+                node = queue.pop()
+                values[node], predecessors[node] = compute(node)
+                for dependent in dependents[node]:
+                    remaining[dependent] -= 1
+                    if not remaining[dependent] and dependent not in missing and dependent not in values:
+                        queue.append(dependent)
+
+            # Stalled: finish jobs whose duration is known, or which
+            # have been stopped already, even if some of their stops
+            # can not be resolved (they wait on a cycle, for instance)
+            queue = [
+                    node for node in dependencies
+                    if node[0] == 'F' and node not in values and ('L', node[1]) in values and
+                    (durations[node[1]] is not None or any(stop in values for stop in dependencies[node][1:]))
+            ]
+            if not queue:
+                return values, predecessors
+
+    def find_cycles(self, dependencies, values):
+        """Tarjan's strongly connected components on unresolved nodes"""
+        graph = {
+                node: [requirement for requirement in requirements if requirement in dependencies and requirement not in values]
+                for node, requirements in dependencies.items() if node not in values
+        }
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        counter = 0
+        for root in graph:
+            if root in index:
+                continue
+            work = [(root, iter(graph[root]))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(graph[child])))
+                        break
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in graph[node]:
+                            self.result.cycles.append(sorted({function_id for _, function_id in component}))
+
+    def critical_path(self, node, predecessors, durations):
+        path = []
+        while node is not None:
+            kind, function_id = node
+            predecessor = predecessors.get(node)
+            if kind == 'F' and predecessor == ('L', function_id) and function_id in self.subscenarios:
+                subpath = self.subscenarios[function_id].critical_path
+                path.extend(reversed([(function_id,) + tuple(sub) for sub in subpath]))
+            if not path or path[-1] != (function_id,):
+                path.append((function_id,))
+            node = predecessor
+        path.reverse()
+
+        # A function reached both on launch and on finish (stopped by a
+        # function waiting on its launch) is kept on its launch only
+        seen = set()
+        return [step for step in path if not (step in seen or seen.add(step))]
+
+    def find_idle_gaps(self):
+        result = self.result
+        activity = []
+        for function_id, (launch, finish) in result.schedule.items():
+            function = self.functions[function_id]
+            if function_id in self.subscenarios:
+                activity.extend((launch + begin, launch + end) for begin, end in self.subscenarios[function_id].activity)
+            elif 'start_job_instance' in function:
+                offset = self.number(function['start_job_instance'].get('offset', 0)) or 0
+                activity.append((min(launch + offset, finish), finish))
+
+        merged = []
+        for begin, end in sorted(activity):
+            if merged and begin <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([begin, end])
+        result.activity = [tuple(interval) for interval in merged]
+
+        previous_end = 0
+        for begin, end in merged + [[result.total_duration, result.total_duration]]:
+            if begin - previous_end > self.min_gap:
+                result.idle_gaps.append((previous_end, begin))
+            previous_end = max(previous_end, end)
+
+
+def _find_duration(arguments, converter):
+    """Search job arguments, including sub-commands, for a duration"""
+    if isinstance(arguments, dict):
+        for name in DURATION_ARGUMENTS:
+            if name in arguments:
+                duration = converter(arguments[name])
+                if duration is not None:
+                    return duration
+        for value in arguments.values():
+            duration = _find_duration(value, converter)
+            if duration is not None:
+                return duration
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Estimate the schedule of built OpenBACH scenarios')
+    parser.add_argument('scenario', type=argparse.FileType('r'), help='JSON file of the scenario to analyze')
+    parser.add_argument(
+            'subscenarios', type=argparse.FileType('r'), nargs='*',
+            help='JSON files of the scenarios started by the analyzed one')
+    parser.add_argument(
+            '-a', '--argument', nargs=2, action='append', default=[],
+            metavar=('NAME', 'VALUE'), help='value of an argument of the scenario')
+    parser.add_argument(
+            '-g', '--min-gap', type=float, default=0,
+            help='minimal duration, in seconds, of the idle gaps to report')
+    parser.add_argument('--json', action='store_true', help='output the analysis as JSON')
+    args = parser.parse_args(argv)
+
+    with args.scenario:
+        scenario = json.load(args.scenario)
+    scenarios = {}
+    for subscenario in args.subscenarios:
+        with subscenario:
+            content = json.load(subscenario)
+        scenarios[content['name']] = content
+
+    analysis = analyze(scenario, scenarios, dict(args.argument), args.min_gap)
+    if args.json:
+        json.dump(analysis.json, sys.stdout, indent=4)
+    else:
+        print(analysis)
+    return 1 if analysis.cycles or analysis.unreachable else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
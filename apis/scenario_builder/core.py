@@ -27,12 +27,19 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see http://www.gnu.org/licenses/.
 
+import re
 import json
+import hashlib
+import itertools
 from types import SimpleNamespace
+from contextlib import suppress
 
 from . import openbach_functions
 
 
+SCENARIO_FIELDS = ('name', 'description', 'arguments', 'constants', 'openbach_functions')
+
+
 class Scenario:
     """Interface between Python code and JSON scenario definition.
 
@@ -132,13 +139,14 @@ class Scenario:
         This dictionary is suitable to be written in a file as
         JSON data.
         """
+        functions = openbach_functions.FunctionsIndex(self.openbach_functions)
         return {
             'name': self.name,
             'description': self.description,
             'arguments': self.arguments.copy(),
             'constants': self.constants.copy(),
             'openbach_functions': [
-                f.build(self.openbach_functions, id)
+                f.build(functions, id)
                 for id, f in enumerate(self.openbach_functions)
             ],
         }
@@ -156,13 +164,42 @@ class Scenario:
 
     @property
     def subscenarios(self):
+        """Generate the scenarios started by this scenario, recursively,
+        and then this scenario. Each scenario is generated only once,
+        after every scenario it starts.
+        """
+        yield from self._subscenarios(set())
+
+    def _subscenarios(self, seen):
+        for scenario in self.own_subscenarios:
+            if id(scenario) not in seen:
+                yield from scenario._subscenarios(seen)
+        if id(self) not in seen:
+            seen.add(id(self))
+            yield self
+
+    @property
+    def own_subscenarios(self):
+        """Generate the scenarios directly started by this scenario"""
         for function in self.openbach_functions:
             if isinstance(function, openbach_functions.StartScenarioInstance):
                 scenario = function.scenario_name
                 if isinstance(scenario, Scenario):
-                    yield from scenario.subscenarios
                     yield scenario
-        yield self
+
+    @property
+    def entities(self):
+        """Set of the names of the entities this scenario, and
+        its subscenarios, run openbach functions on.
+        """
+        entities = set()
+        for scenario in self.subscenarios:
+            for function in scenario.openbach_functions:
+                with suppress(AttributeError, KeyError, TypeError):
+                    entities.add(function.start_job_instance['entity_name'])
+                with suppress(AttributeError, KeyError, TypeError):
+                    entities.add(function.arguments['entity_name'])
+        return entities
 
     def extract_function_id(self, *job_names, include_subscenarios=False, **filtered_jobs):
         def _unfiltered(openbach_function):
@@ -187,6 +224,106 @@ class Scenario:
         return function
 
 
+def content_hash(scenario):
+    """Compute a stable hash of the definition of a built scenario, as
+    returned by `Scenario.build`; extra fields are ignored so that
+    scenarios retrieved from a controller can be compared too.
+    """
+    definition = {field: scenario.get(field) for field in SCENARIO_FIELDS}
+    serialized = json.dumps(definition, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class ScenarioTemplate:
+    """Scenario built once and expanded into many JSON definitions.
+
+    Parameters are scenario placeholders (values written as `'$name'`
+    when configuring openbach functions) whose value is provided at
+    expansion time instead of at launch time. The scenario is built
+    and serialized only once; expanding it only substitutes values in
+    the serialized text so that large parameters sweeps do not need
+    to rebuild the whole Python object graph of each scenario.
+
+    Parameters are removed from the arguments and constants of the
+    expanded scenarios. The `name` and `description` of the expanded
+    scenarios are format strings receiving the parameters values;
+    the default name being the one of the template scenario followed
+    by these values. Sub-scenarios are left untouched.
+    """
+
+    def __init__(self, scenario, *parameters, name=None, description=None):
+        definition = scenario.build() if isinstance(scenario, Scenario) else dict(scenario)
+        definition['arguments'] = dict(definition.get('arguments', {}))
+        definition['constants'] = dict(definition.get('constants', {}))
+        for parameter in parameters:
+            definition['arguments'].pop(parameter, None)
+            definition['constants'].pop(parameter, None)
+
+        if name is None:
+            name = '{} ({})'.format(
+                    _escape_format(definition['name']),
+                    ', '.join('{0}={{{0}}}'.format(parameter) for parameter in parameters))
+        if description is None:
+            description = _escape_format(definition.get('description') or definition['name'])
+
+        self.parameters = frozenset(parameters)
+        self.name = name
+        self.description = description
+
+        body = {key: value for key, value in definition.items() if key not in ('name', 'description')}
+        serialized = json.dumps(body)
+        if not parameters:
+            self._segments = [serialized[1:]]
+        else:
+            # Placeholders are whole JSON strings that are not mapping keys
+            placeholders = '|'.join(re.escape(parameter) for parameter in sorted(parameters, key=len, reverse=True))
+            pattern = re.compile(r'"\$({})"(?!\s*:)'.format(placeholders))
+            self._segments = pattern.split(serialized[1:])
+
+    def expand_json(self, **values):
+        """Return the JSON text of the scenario using the given
+        parameters values; suitable to be written in a file or
+        sent to the controller as-is.
+        """
+        missing = self.parameters.difference(values)
+        if missing:
+            raise TypeError('missing value for parameters: {}'.format(', '.join(sorted(missing))))
+        unknown = set(values).difference(self.parameters)
+        if unknown:
+            raise TypeError('unknown parameters: {}'.format(', '.join(sorted(unknown))))
+
+        segments = self._segments
+        substituted = [json.dumps(values[name]) for name in segments[1::2]]
+        parts = ['{"name": ', json.dumps(self.name.format(**values)),
+                 ', "description": ', json.dumps(self.description.format(**values)), ', ']
+        parts.append(segments[0])
+        for value, segment in zip(substituted, segments[2::2]):
+            parts.append(value)
+            parts.append(segment)
+        return ''.join(parts)
+
+    def expand(self, **values):
+        """Return the definition of the scenario using the given
+        parameters values, as `Scenario.build` would.
+        """
+        return json.loads(self.expand_json(**values))
+
+    def sweep(self, **ranges):
+        """Lazily generate the definitions of the scenarios for each
+        combination of the values provided for each parameter.
+
+        Yield pairs of (parameters values, scenario definition).
+        """
+        names = list(ranges)
+        for combination in itertools.product(*(ranges[name] for name in names)):
+            values = dict(zip(names, combination))
+            yield values, self.expand(**values)
+
+
+def _escape_format(text):
+    return text.replace('{', '{{').replace('}', '}}')
+
+
 def check_and_build_waiting_list(wait_on=None):
     """Check that each element container in the `wait_on` iterable
     is a proper openbach function. Raise `TypeError` otherwise.
@@ -474,9 +474,38 @@ class PullFile(OpenBachFunction):
         return context
 
 
+class FunctionsIndex:
+    """Identity-keyed index of the openbach functions of a scenario.
+
+    Built once per `Scenario.build` and shared by every
+    `OpenBachFunction.build` call so that references to other
+    functions are resolved in constant time. Behaves as the
+    underlying list for indexing, iteration and `index` lookups.
+    """
+
+    def __init__(self, functions):
+        self._functions = functions
+        self._ids = {id(function): index for index, function in reversed(list(enumerate(functions)))}
+
+    def index(self, function):
+        try:
+            return self._ids[id(function)]
+        except KeyError:
+            raise ValueError('{!r} is not in the scenario'.format(function)) from None
+
+    def __getitem__(self, index):
+        return self._functions[index]
+
+    def __iter__(self):
+        return iter(self._functions)
+
+    def __len__(self):
+        return len(self._functions)
+
+
 def safe_indexor(reference, lookup):
     """Generate the index of each element of `lookup` in the
-    `reference` array.
+    `reference` array or `FunctionsIndex`.
 
     Skip missing elements.
     """
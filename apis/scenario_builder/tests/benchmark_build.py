@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""Benchmark of Scenario.build on large synthetic scenarios.
+
+Run it with `python3 -m scenario_builder.tests.benchmark_build` from the
+`apis` folder; build time should grow linearly with the amount of functions.
+Expansion time of the same scenario used as a `ScenarioTemplate` is shown
+for comparison.
+"""
+
+__author__ = 'Mathias ETTINGER <mathias.ettinger@toulouse.viveris.com>'
+
+
+import sys
+import timeit
+
+import scenario_builder as sb
+
+
+def synthetic_scenario(size):
+    """Build a scenario of `size` openbach functions where each job
+    waits for the previous one and is stopped by a dedicated function.
+    """
+    scenario = sb.Scenario('Benchmark', 'Synthetic scenario of {} functions'.format(size))
+    previous = []
+    for _ in range(size // 2):
+        job = scenario.add_function('start_job_instance', wait_launched=previous, wait_delay=1)
+        job.configure('fping', 'entity', destination_ip='127.0.0.1')
+        stop = scenario.add_function('stop_job_instance', wait_launched=[job], wait_delay=10)
+        stop.configure(job)
+        previous = [job]
+    return scenario
+
+
+def main(sizes=(10000, 20000, 40000), repeat=3):
+    for size in sizes:
+        scenario = synthetic_scenario(size)
+        duration = min(timeit.repeat(scenario.build, number=1, repeat=repeat))
+        print('{:>7} functions: {:.3f}s ({:.2f}µs per function)'.format(
+            size, duration, duration / size * 1e6))
+        template = sb.ScenarioTemplate(scenario)
+        for method in (template.expand, template.expand_json):
+            duration = min(timeit.repeat(method, number=1, repeat=repeat))
+            print('{:>7} {}: {:.4f}s'.format('', method.__name__, duration))
+
+
+if __name__ == '__main__':
+    main(tuple(map(int, sys.argv[1:])) or (10000, 20000, 40000))
@@ -74,6 +74,189 @@ class TestScenarioBuilder(unittest.TestCase):
 
         self.assertEqual(cond.build([]), expected_results)
 
+    def test_scenario_entities(self):
+        subscenario = sb.Scenario('Sub')
+        job = subscenario.add_function('start_job_instance')
+        job.configure('fping', 'client', destination_ip='127.0.0.1')
+        scenario = sb.Scenario('Main')
+        job = scenario.add_function('start_job_instance')
+        job.configure('hping', 'server', destination_ip='127.0.0.1')
+        push = scenario.add_function('push_file')
+        push.configure('middlebox', '/tmp/a', '/tmp/b')
+        sub = scenario.add_function('start_scenario_instance')
+        sub.configure(subscenario)
+
+        self.assertEqual(scenario.entities, {'client', 'server', 'middlebox'})
+        self.assertEqual(subscenario.entities, {'client'})
+
+    def test_subscenarios_deduplication(self):
+        leaf = sb.Scenario('Leaf')
+        middle = sb.Scenario('Middle')
+        for _ in range(3):
+            middle.add_function('start_scenario_instance').configure(leaf)
+        scenario = sb.Scenario('Main')
+        scenario.add_function('start_scenario_instance').configure(middle)
+        scenario.add_function('start_scenario_instance').configure(leaf)
+
+        self.assertEqual(list(map(str, scenario.subscenarios)), ['Leaf', 'Middle', 'Main'])
+
+    def test_content_hash(self):
+        scenario = sb.Scenario('Main', 'Description')
+        scenario.add_constant('a', 1)
+        definition = scenario.build()
+        stored = dict(reversed(list(definition.items())), id=42, project='Project')
+        self.assertEqual(sb.content_hash(definition), sb.content_hash(stored))
+        scenario.add_constant('a', 2)
+        self.assertNotEqual(sb.content_hash(definition), sb.content_hash(scenario.build()))
+
+    def test_large_scenario_build(self):
+        from scenario_builder.tests.benchmark_build import synthetic_scenario
+
+        functions = synthetic_scenario(10000).build()['openbach_functions']
+        self.assertEqual(len(functions), 10000)
+        for job, stop in zip(functions[::2], functions[1::2]):
+            self.assertEqual(stop['wait']['launched_ids'], [job['id']])
+            self.assertEqual(stop['stop_job_instances']['openbach_function_ids'], [job['id']])
+        self.assertEqual(functions[4]['wait']['launched_ids'], [2])
+
+    def test_scenario_template(self):
+        scenario = sb.Scenario('Rate', 'Rate of a {flow}')
+        scenario.add_argument('rate', 'rate of the flow')
+        scenario.add_constant('destination', '192.168.1.1')
+        job = scenario.add_function('start_job_instance', wait_delay='$delay')
+        job.configure('iperf3', 'client', duration='$duration', client={'rate': '$rate', 'dest': '$destination'})
+        template = sb.ScenarioTemplate(scenario, 'rate', 'duration', 'delay')
+        self.assertEqual(template.expand(rate='1M', duration=1, delay=0)['description'], 'Rate of a {flow}')
+        template = sb.ScenarioTemplate(scenario, 'rate', 'duration', 'delay', description='Rate {rate}')
+
+        expanded = template.expand(rate='10M', duration=30, delay=5)
+        self.assertEqual(expanded['name'], 'Rate (rate=10M, duration=30, delay=5)')
+        self.assertEqual(expanded['description'], 'Rate 10M')
+        self.assertEqual(expanded['arguments'], {})
+        self.assertEqual(expanded['constants'], {'destination': '192.168.1.1'})
+        function, = expanded['openbach_functions']
+        self.assertEqual(function['wait']['time'], 5)
+        self.assertEqual(function['start_job_instance']['iperf3'], {
+            'duration': 30,
+            'client': {'rate': '10M', 'dest': '$destination'},
+        })
+
+        sweep = template.sweep(rate=['1M', '2M'], duration=[10, 20], delay=[0])
+        self.assertEqual(next(sweep)[0], {'rate': '1M', 'duration': 10, 'delay': 0})
+        self.assertEqual(len(list(sweep)), 3)
+        with self.assertRaises(TypeError):
+            template.expand(rate='1M', duration=10)
+
+    def test_schedule_analysis(self):
+        from scenario_builder.analysis import analyze
+
+        subscenario = sb.Scenario('Sub')
+        subscenario.add_function('start_job_instance', 1).configure('fping', 'client', duration=4)
+        scenario = sb.Scenario('Main')
+        scenario.add_constant('duration', 10)
+        ping = scenario.add_function('start_job_instance', 2)
+        ping.configure('fping', 'client', duration='$duration')
+        iperf = scenario.add_function('start_job_instance', wait_finished=[ping])
+        iperf.configure('iperf3', 'server', server={'duration': 5})
+        daemon = scenario.add_function('start_job_instance', wait_launched=[ping])
+        daemon.configure('tcpdump', 'server', interface='eth0')
+        scenario.add_function('stop_job_instance', 3, [daemon]).configure(daemon)
+        scenario.add_function('start_scenario_instance', wait_finished=[iperf]).configure(subscenario)
+
+        analysis = analyze(scenario.build(), {'Sub': subscenario.build()})
+        self.assertEqual(analysis.total_duration, 22)
+        self.assertEqual(analysis.schedule[2], (2, 5))
+        self.assertEqual(analysis.critical_path, [(0,), (1,), (4,), (4, 0)])
+        self.assertEqual(analysis.idle_gaps, [(0, 2), (17, 18)])
+        self.assertFalse(analysis.cycles or analysis.unreachable or analysis.unbounded)
+
+        definition = scenario.build()
+        definition['openbach_functions'][0]['wait']['finished_ids'] = [1]
+        analysis = analyze(definition)
+        self.assertEqual(analysis.cycles, [[0, 1]])
+        self.assertEqual(analysis.unreachable, {2, 3, 4})
+
+    def test_schedule_analysis_diamond(self):
+        from scenario_builder.analysis import analyze
+
+        scenario = sb.Scenario('Diamond')
+        server = scenario.add_function('start_job_instance')
+        server.configure('iperf3', 'server', server={'duration': 10})
+        client = scenario.add_function('start_job_instance', 1, [server])
+        client.configure('fping', 'client', duration=2)
+        scenario.add_function('stop_job_instance', 5, [server]).configure(server)
+        report = scenario.add_function('start_job_instance', wait_launched=[client], wait_finished=[server])
+        report.configure('fping', 'client', duration=3)
+
+        analysis = analyze(scenario.build())
+        self.assertEqual(analysis.total_duration, 8)
+        self.assertEqual(analysis.schedule[0], (0, 5))
+        self.assertEqual(analysis.critical_path, [(0,), (2,), (3,)])
+
+    def test_jobs_arguments_validation(self):
+        import os
+        import tempfile
+        from pathlib import Path
+        from scenario_builder.validation import JobsSchemas, validate_scenario
+
+        description = '\n'.join([
+            'general:',
+            '  name: {}',
+            'arguments:',
+            '  required:',
+            '    - {{name: port, type: int, count: 1}}',
+            '  optional:',
+            '    - {{name: mode, type: str, count: 1, choices: [fast, slow]}}',
+            '    - {{name: verbose, type: None, count: 0}}',
+            '  subcommand:',
+            '    - group_name: role',
+            '      optional: no',
+            '      choices:',
+            '        - name: client',
+            '          required:',
+            '            - {{name: dest, type: ip, count: 1}}',
+            '        - name: server',
+        ])
+
+        with tempfile.TemporaryDirectory() as directory:
+            files = Path(directory, 'jobs', 'transfer', 'files')
+            files.mkdir(parents=True)
+            job = files / 'transfer.yml'
+            job.write_text(description.format('transfer'))
+            cache = Path(directory, 'cache.json')
+
+            schemas = JobsSchemas(Path(directory, 'jobs'), cache_path=cache)
+            self.assertIn('transfer', schemas)
+            self.assertTrue(cache.exists())
+
+            scenario = sb.Scenario('Validation')
+            scenario.add_constant('port', 'http')
+            scenario.add_function('start_job_instance').configure(
+                    'transfer', 'client', port=5000, mode='fast', verbose=True, client={'dest': '192.168.1.1'})
+            scenario.add_function('start_job_instance').configure(
+                    'transfer', 'server', port='$port', mode='fats', server={}, client={'dest': 'nowhere'})
+            scenario.add_function('start_job_instance').configure(
+                    'transfer', 'server', prot=5000)
+            scenario.add_function('start_job_instance').configure('unknown', 'server', anything=1)
+
+            errors = validate_scenario(scenario.build(), schemas)
+            self.assertEqual(errors, [
+                "Scenario Validation, openbach function 1 (transfer): argument 'port': expected a value of type int, got 'http'",
+                "Scenario Validation, openbach function 1 (transfer): argument 'mode': 'fats' is not one of fast, slow",
+                "Scenario Validation, openbach function 1 (transfer): subcommands 'client', 'server' are mutually exclusive",
+                "Scenario Validation, openbach function 1 (transfer): subcommand 'client': argument 'dest': expected a value of type ip, got 'nowhere'",
+                "Scenario Validation, openbach function 2 (transfer): unknown argument 'prot' (did you mean 'port'?)",
+                "Scenario Validation, openbach function 2 (transfer): missing required argument 'port'",
+                "Scenario Validation, openbach function 2 (transfer): missing subcommand, expected one of 'client', 'server'",
+            ])
+            self.assertEqual(len(validate_scenario(scenario.build(), schemas, ignore_unknown_jobs=False)), 8)
+
+            job.write_text(description.format('renamed'))
+            os.utime(str(job), ns=(0, 0))
+            schemas = JobsSchemas(Path(directory, 'jobs'), cache_path=cache)
+            self.assertNotIn('transfer', schemas)
+            self.assertIn('renamed', schemas)
+
     def test_scenario_if(self):
         expected_results = {
             "name": "If",
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them.
+# It is composed of an Auditorium (HMIs), a Controller, a Collector
+# and multiple Agents (one for each network entity that wants to be
+# tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY, without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/.
+
+"""Pre-flight validation of the arguments of the jobs started by scenarios.
+
+Jobs describe their arguments in their `files/<job_name>.yml` file; a
+`JobsSchemas` index gathers these descriptions from one or several
+directories (such as the `externals_jobs` folder of this repository) and
+caches them on disk so that subsequent validations only need to check the
+modification time of each description file.
+
+Use `validate_scenario` on the JSON of a built scenario to get a list of
+problems (unknown or missing arguments, bad types or choices, badly
+selected subcommands...) before sending it to the controller.
+"""
+
+import os
+import json
+import difflib
+import ipaddress
+from pathlib import Path
+
+import yaml
+
+try:
+    _Loader = yaml.CSafeLoader
+except AttributeError:
+    _Loader = yaml.SafeLoader
+
+
+DEFAULT_CACHE = Path.home() / '.cache' / 'openbach' / 'jobs_schemas.json'
+START_JOB_INSTANCE_FIELDS = ('entity_name', 'offset', 'interval')
+
+
+class JobsSchemas:
+    """Index of the arguments description of every job found in
+    the given directories, keyed by job name.
+
+    Descriptions are read from `files/*.yml` files and stored in the
+    JSON file at `cache_path`; they are parsed again only when their
+    modification time changes. Use `cache_path=None` to disable the
+    on-disk cache.
+    """
+
+    def __init__(self, *directories, cache_path=DEFAULT_CACHE):
+        self.directories = [Path(directory) for directory in directories]
+        self.cache_path = None if cache_path is None else Path(cache_path)
+        self.schemas = {}
+        self.refresh()
+
+    def refresh(self):
+        cache = self._read_cache()
+        updated = {}
+        schemas = {}
+        for directory in self.directories:
+            for path in sorted(directory.glob('**/files/*.yml')):
+                key = str(path.resolve())
+                mtime = path.stat().st_mtime_ns
+                entry = cache.get(key)
+                if entry is None or entry['mtime'] != mtime:
+                    entry = {'mtime': mtime, 'schema': _load_schema(path)}
+                updated[key] = entry
+                schema = entry['schema']
+                if schema is not None:
+                    schemas.setdefault(schema['name'], schema)
+
+        if updated != cache:
+            self._write_cache(updated)
+        self.schemas = schemas
+
+    def _read_cache(self):
+        if self.cache_path is None:
+            return {}
+        try:
+            with self.cache_path.open() as cache:
+                return json.load(cache)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, content):
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.cache_path.with_name(self.cache_path.name + '.tmp')
+            with temporary.open('w') as cache:
+                json.dump(content, cache)
+            os.replace(str(temporary), str(self.cache_path))
+        except OSError:
+            pass
+
+    def __contains__(self, job_name):
+        return job_name in self.schemas
+
+    def __getitem__(self, job_name):
+        return self.schemas[job_name]
+
+    def __len__(self):
+        return len(self.schemas)
+
+    def validate(self, job_name, arguments, constants=None):
+        """Check the arguments of a single job and return a list of
+        error messages; an empty list meaning everything seems fine.
+        """
+        try:
+            schema = self.schemas[job_name]
+        except KeyError:
+            return ['unknown job \'{}\''.format(job_name)]
+        return _validate_arguments(schema, arguments, constants or {})
+
+
+def validate_scenario(scenario, schemas, ignore_unknown_jobs=True):
+    """Check the arguments of every job started by a built scenario.
+
+    Return a list of error messages, each one mentioning the scenario
+    name, the openbach function id and the job it applies to. Jobs
+    that are not found in the `schemas` index are silently skipped
+    unless `ignore_unknown_jobs` is False.
+    """
+    errors = []
+    constants = scenario.get('constants', {})
+    for function in scenario.get('openbach_functions', []):
+        try:
+            start = function['start_job_instance']
+        except KeyError:
+            continue
+        for job_name, arguments in start.items():
+            if job_name in START_JOB_INSTANCE_FIELDS:
+                continue
+            if job_name not in schemas and ignore_unknown_jobs:
+                continue
+            for error in schemas.validate(job_name, arguments, constants):
+                errors.append('Scenario {}, openbach function {} ({}): {}'.format(
+                    scenario.get('name'), function.get('id'), job_name, error))
+    return errors
+
+
+def _load_schema(path):
+    with path.open() as description:
+        try:
+            content = yaml.load(description, Loader=_Loader)
+        except yaml.YAMLError:
+            return None
+    try:
+        name = content['general']['name']
+    except (TypeError, KeyError):
+        return None
+    schema = _build_arguments(content.get('arguments'))
+    schema['name'] = name
+    return schema
+
+
+def _build_arguments(description):
+    description = description or {}
+    return {
+            'required': [_build_argument(argument) for argument in description.get('required') or []],
+            'optional': [_build_argument(argument) for argument in description.get('optional') or []],
+            'subcommands': [
+                {
+                    'group': group.get('group_name'),
+                    'optional': bool(group.get('optional', False)),
+                    'choices': {
+                        str(choice['name']): _build_arguments(choice)
+                        for choice in group.get('choices') or []
+                    },
+                } for group in description.get('subcommand') or []
+            ],
+    }
+
+
+def _build_argument(argument):
+    choices = argument.get('choices')
+    return {
+            'name': str(argument['name']),
+            'type': str(argument.get('type')),
+            'count': str(argument.get('count', 1)),
+            'choices': None if choices is None else [str(choice) for choice in choices],
+    }
+
+
+def _validate_arguments(schema, arguments, constants, prefix=''):
+    if not isinstance(arguments, dict):
+        return ['{}expected a mapping of arguments, got {!r}'.format(prefix, arguments)]
+
+    errors = []
+    known = {argument['name']: argument for argument in schema['required'] + schema['optional']}
+    subcommands = {name: group for group in schema['subcommands'] for name in group['choices']}
+
+    for name in arguments:
+        if name not in known and name not in subcommands:
+            message = '{}unknown argument \'{}\''.format(prefix, name)
+            suggestions = difflib.get_close_matches(name, list(known) + list(subcommands), n=1)
+            if suggestions:
+                message += ' (did you mean \'{}\'?)'.format(suggestions[0])
+            errors.append(message)
+
+    for argument in schema['required']:
+        if argument['name'] not in arguments:
+            errors.append('{}missing required argument \'{}\''.format(prefix, argument['name']))
+
+    for name, value in arguments.items():
+        with_prefix = '{}argument \'{}\': '.format(prefix, name)
+        if name in known:
+            errors.extend(with_prefix + error for error in _validate_value(known[name], value, constants))
+
+    for group in schema['subcommands']:
+        selected = [name for name in group['choices'] if name in arguments]
+        if len(selected) > 1:
+            errors.append('{}subcommands {} are mutually exclusive'.format(prefix, ', '.join(map(repr, selected))))
+        elif not selected and not group['optional']:
+            errors.append('{}missing subcommand, expected one of {}'.format(
+                prefix, ', '.join(map(repr, group['choices']))))
+        for name in selected:
+            errors.extend(_validate_arguments(
+                group['choices'][name], arguments[name], constants,
+                '{}subcommand \'{}\': '.format(prefix, name)))
+
+    return errors
+
+
+def _validate_value(argument, value, constants):
+    value = _resolve(value, constants)
+    count = argument['count']
+    if count == '0' or argument['type'] == 'None':
+        if not isinstance(value, bool) and value not in (0, 1):
+            return ['expected a boolean flag, got {!r}'.format(value)]
+        return []
+
+    values = value if isinstance(value, (list, tuple)) else [value]
+    values = [_resolve(value, constants) for value in values]
+
+    errors = []
+    if count == '+':
+        if not values:
+            errors.append('expected at least one value')
+    elif count != '*':
+        low, _, high = count.partition('-')
+        try:
+            low = int(low)
+            high = int(high) if high else low
+        except ValueError:
+            pass
+        else:
+            if not low <= len(values) <= high:
+                errors.append('expected {} value(s), got {}'.format(count, len(values)))
+
+    for value in values:
+        if _is_placeholder(value):
+            continue
+        if not _check_type(argument['type'], value):
+            errors.append('expected a value of type {}, got {!r}'.format(argument['type'], value))
+        elif argument['choices'] is not None and str(value) not in argument['choices']:
+            errors.append('{!r} is not one of {}'.format(value, ', '.join(argument['choices'])))
+    return errors
+
+
+def _resolve(value, constants):
+    if _is_placeholder(value):
+        return constants.get(value[1:], value)
+    return value
+
+
+def _is_placeholder(value):
+    return isinstance(value, str) and value.startswith('$')
+
+
+def _check_type(kind, value):
+    if isinstance(value, (dict, list, tuple)):
+        return False
+    if kind == 'int':
+        if isinstance(value, bool):
+            return False
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            return False
+    elif kind == 'float':
+        if isinstance(value, bool):
+            return False
+        try:
+            float(value)
+        except (TypeError, ValueError):
+            return False
+    elif kind == 'ip':
+        try:
+            ipaddress.ip_interface(str(value))
+        except ValueError:
+            return False
+    return True
@@ -36,80 +36,111 @@ __credits__ = '''Contributors:
 '''
 
 
-import re
+import sys
+import time
 import syslog
 import argparse
-import subprocess
-from threading import Thread
-from apscheduler.schedulers.blocking import BlockingScheduler
 
 import collect_agent
-
-
-BRACKETS = re.compile(r'[\[\]]')
-
-
-def cpu_reports(sampling_interval):
-    cmd = ['stdbuf', '-oL', 'mpstat', str(sampling_interval)]
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-
-    while True:
-        line = p.stdout.readline().decode()
-        tokens = BRACKETS.sub('', line).split()
-        if not tokens:
-            if p.poll() is not None:
-                break
-            continue
-        line = line.strip()
-        if 'all' in line:
-            elts = line.split()
-            o = elts.index('all')
-            cpu_user, cpu_sys, cpu_iowait, cpu_idle = map(float, [elts[o + 1], elts[o + 3], elts[o + 4], elts[o + 10]])
-            statistics = {}
-            timestamp = collect_agent.now()
-            statistics['cpu_user'] = cpu_user
-            statistics['cpu_sys'] = cpu_sys
-            statistics['cpu_iowait'] = cpu_iowait
-            statistics['cpu_idle'] = cpu_idle
-            collect_agent.send_stat(timestamp, **statistics)
-
-
-def mem_report():
-    statistics = {}
-    timestamp = collect_agent.now()
-
-    cmd = ['stdbuf', '-oL', 'free', '-b']
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    while True:
-        line = p.stdout.readline()
-        if not line:
+from job_helpers import PeriodicSampler, ProcFile
+
+
+# Fields of the cpu lines of /proc/stat, in clock ticks
+CPU_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal', 'guest', 'guest_nice')
+CPU_STATISTICS = {
+        'cpu_user': 'user',
+        'cpu_nice': 'nice',
+        'cpu_sys': 'system',
+        'cpu_iowait': 'iowait',
+        'cpu_irq': 'irq',
+        'cpu_softirq': 'softirq',
+        'cpu_steal': 'steal',
+        'cpu_idle': 'idle',
+}
+
+
+def parse_cpu_times(content):
+    """Map each CPU line of /proc/stat ('cpu' being the aggregate of all
+    cores) to the time spent in each state.
+    """
+    cpus = {}
+    for line in content.splitlines():
+        if not line.startswith(b'cpu'):
             break
-        line = line.decode().strip()
-        if 'Mem:' in line:
-            ram_used = int(line.split()[2])
-            statistics['ram_used'] = ram_used
-        if 'Swap:' in line:
-            swap_used = int(line.split()[2])
-            statistics['swap_used'] = swap_used
-
-    collect_agent.send_stat(timestamp, **statistics)
-
-
-def main(sampling_interval):
+        name, *times = line.split()
+        cpus[name.decode()] = dict(zip(CPU_FIELDS, map(int, times)))
+    return cpus
+
+
+def cpu_usage(times, last_times):
+    """Percentage of time spent in each state between two readings.
+
+    As for mpstat, guest time (already accounted as user or nice time)
+    is removed from the user and nice times.
+    """
+    delta = {field: times.get(field, 0) - last_times.get(field, 0) for field in CPU_FIELDS}
+    delta['user'] -= delta['guest']
+    delta['nice'] -= delta['guest_nice']
+    total = sum(delta[field] for field in CPU_STATISTICS.values()) + delta['guest'] + delta['guest_nice']
+    if total <= 0:
+        return {}
+    return {
+            name: 100 * delta[field] / total
+            for name, field in CPU_STATISTICS.items()
+    }
+
+
+def parse_memory(content):
+    """Memory figures of /proc/meminfo, in bytes, as computed by free"""
+    memory = {}
+    for line in content.splitlines():
+        name, value, *unit = line.split()
+        memory[name.rstrip(b':').decode()] = int(value) * (1024 if unit else 1)
+
+    cached = memory.get('Cached', 0) + memory.get('SReclaimable', 0)
+    buffers = memory.get('Buffers', 0)
+    return {
+            'ram_used': memory['MemTotal'] - memory['MemFree'] - buffers - cached,
+            'ram_available': memory.get('MemAvailable', memory['MemFree']),
+            'ram_buffers_cached': buffers + cached,
+            'swap_used': memory.get('SwapTotal', 0) - memory.get('SwapFree', 0),
+    }
+
+
+def main(sampling_interval, per_core):
     collect_agent.send_log(syslog.LOG_DEBUG, 'Starting cpu_monitoring job')
 
-    # Collect CPU reports
-    thread = Thread(target=cpu_reports, args=(sampling_interval, ))
-    thread.start()
-
-    # Collect memory reports
-    sched = BlockingScheduler()
-    sched.add_job(
-            mem_report, 'interval',
-            seconds=sampling_interval)
-    sched.start()
-
-    thread.join()
+    try:
+        stat = ProcFile('/proc/stat')
+        meminfo = ProcFile('/proc/meminfo')
+    except OSError as error:
+        message = 'Cannot read system statistics: {}'.format(error)
+        collect_agent.send_log(syslog.LOG_ERR, message)
+        sys.exit(message)
+
+    last_cpus = parse_cpu_times(stat.read())
+    last_cpu_time = time.process_time()
+    for elapsed, missed_deadlines in PeriodicSampler(sampling_interval):
+        timestamp = collect_agent.now()
+        cpus = parse_cpu_times(stat.read())
+        statistics = parse_memory(meminfo.read())
+        statistics.update(cpu_usage(cpus['cpu'], last_cpus['cpu']))
+
+        # Overhead of the monitoring itself, in percent of a core
+        cpu_time = time.process_time()
+        statistics['monitor_cpu'] = 100 * (cpu_time - last_cpu_time) / elapsed
+        if missed_deadlines:
+            statistics['missed_deadlines'] = missed_deadlines
+        last_cpu_time = cpu_time
+        collect_agent.send_stat(timestamp, **statistics)
+
+        if per_core:
+            for name, times in cpus.items():
+                if name != 'cpu' and name in last_cpus:
+                    usage = cpu_usage(times, last_cpus[name])
+                    if usage:
+                        collect_agent.send_stat(timestamp, suffix=name, **usage)
+        last_cpus = cpus
 
 
 if __name__ == '__main__':
@@ -120,8 +151,11 @@ if __name__ == '__main__':
                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
         parser.add_argument(
                 '--sampling-interval', '-i',
-                type=int, default=1,
+                type=float, default=1,
                 help='Interval between two measurements in seconds')
+        parser.add_argument(
+                '--per-core', '-c', action='store_true',
+                help='Also report the usage of each CPU core')
 
         args = vars(parser.parse_args())
         main(**args)
@@ -35,33 +35,291 @@ __credits__ = '''Contributors:
 '''
 
 
+import os
 import time
 import psutil
 import argparse
 
 import collect_agent
+from job_helpers import PeriodicSampler, ProcFile
+
+
+JOBS_DIRECTORY = '/opt/openbach/agent/jobs/'
+PROCESSES_RESCAN_INTERVAL = 2  # seconds
+SOFTIRQS = {b'NET_RX:': 'net_rx_softirqs', b'NET_TX:': 'net_tx_softirqs'}
+SECTOR_SIZE = 512
+
+
+def cpu_times(content):
+    """Times spent by each CPU core in each state (user, nice, system,
+    idle, iowait, irq, softirq, steal), from the content of /proc/stat.
+    """
+    cores = []
+    for line in content.splitlines()[1:]:
+        if not line.startswith(b'cpu'):
+            break
+        cores.append(tuple(map(int, line.split()[1:9])))
+    return cores
+
+
+def busy_percent(times, last_times):
+    """CPU usage between two readings of cpu_times, the same way
+    psutil.cpu_percent computes it, along with the time spent waiting
+    for I/O and servicing interrupts.
+    """
+    user, nice, system, idle, iowait, irq, softirq, steal = (
+            new - old for new, old in zip(times, last_times))
+    total = user + nice + system + idle + iowait + irq + softirq + steal
+    if total <= 0:
+        return {}
+    return {
+            'cpu_percent': 100 * (total - idle - iowait) / total,
+            'cpu_iowait_percent': 100 * iowait / total,
+            'cpu_irq_percent': 100 * irq / total,
+            'cpu_softirq_percent': 100 * softirq / total,
+    }
+
+
+def memory_percents(content):
+    """Virtual and swap memory utilization, the same way psutil
+    computes them, from the content of /proc/meminfo.
+    """
+    memory = {}
+    for line in content.splitlines():
+        name, value, *_ = line.split()
+        memory[name] = int(value)
+    total = memory[b'MemTotal:']
+    available = memory.get(b'MemAvailable:', memory[b'MemFree:'])
+    swap_total = memory.get(b'SwapTotal:', 0)
+    swap_used = swap_total - memory.get(b'SwapFree:', 0)
+    return {
+            'virtual_memory_percent': 100 * (total - available) / total,
+            'swap_memory_percent': 100 * swap_used / swap_total if swap_total else 0.0,
+    }
+
+
+def softirqs(content):
+    """Per-CPU counters of network software interrupts, from the
+    content of /proc/softirqs.
+    """
+    counters = {}
+    for line in content.splitlines():
+        name, *values = line.split()
+        if name in SOFTIRQS:
+            counters[SOFTIRQS[name]] = list(map(int, values))
+    return counters
+
+
+def disks_io(content, devices):
+    """Cumulated bytes and requests read and written, and time spent
+    doing I/O (in ms) of the given block devices, from the content of
+    /proc/diskstats.
+    """
+    totals = [0, 0, 0, 0, 0]
+    for line in content.splitlines():
+        fields = line.split()
+        if fields[2] in devices:
+            totals[0] += int(fields[5]) * SECTOR_SIZE
+            totals[1] += int(fields[9]) * SECTOR_SIZE
+            totals[2] += int(fields[3])
+            totals[3] += int(fields[7])
+            totals[4] += int(fields[12])
+    return totals
+
+
+def block_devices():
+    """Names of the whole block devices (not their partitions) that are
+    not virtual devices such as loops or RAM disks.
+    """
+    devices = set()
+    for name in os.listdir('/sys/block'):
+        if not name.startswith(('loop', 'ram', 'zram')):
+            devices.add(os.fsencode(name))
+    return devices
+
+
+class JobProcesses:
+    """Follow the processes of an OpenBACH job (those launched from the
+    job folder or named after it) and their children.
+
+    Processes are searched again periodically rather than on each
+    sample, as it requires to walk over every process of the system.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.folder = JOBS_DIRECTORY + name + '/'
+        self.processes = {}
+        self.last_scan = None
+
+    def _matches(self, process):
+        name = process.info['name']
+        cmdline = process.info['cmdline'] or ()
+        return name == self.name or any(self.folder in argument for argument in cmdline)
+
+    def _scan(self):
+        pids = set()
+        for process in psutil.process_iter(['name', 'cmdline']):
+            if self._matches(process):
+                pids.add(process.pid)
+                try:
+                    pids.update(child.pid for child in process.children(recursive=True))
+                except psutil.Error:
+                    pass
+        pids.discard(os.getpid())
+
+        processes = {pid: entry for pid, entry in self.processes.items() if pid in pids}
+        for pid in pids.difference(processes):
+            try:
+                process = psutil.Process(pid)
+                with process.oneshot():
+                    cpu_times = process.cpu_times()
+                processes[pid] = (process, cpu_times.user + cpu_times.system)
+            except psutil.Error:
+                pass
+        self.processes = processes
+
+    def sample(self, elapsed):
+        now = time.monotonic()
+        if self.last_scan is None or now - self.last_scan >= PROCESSES_RESCAN_INTERVAL:
+            self.last_scan = now
+            self._scan()
+
+        cpu = memory = threads = 0
+        for pid, (process, last_cpu_time) in list(self.processes.items()):
+            try:
+                with process.oneshot():
+                    cpu_times = process.cpu_times()
+                    memory += process.memory_info().rss
+                    threads += process.num_threads()
+            except psutil.Error:
+                del self.processes[pid]
+                continue
+            cpu_time = cpu_times.user + cpu_times.system
+            cpu += cpu_time - last_cpu_time
+            self.processes[pid] = (process, cpu_time)
+
+        return {
+                'job_processes': len(self.processes),
+                'job_cpu_percent': 100 * cpu / elapsed,
+                'job_memory_rss': memory,
+                'job_threads': threads,
+        }
+
+
+class SystemSampler:
+    """Collect system resources utilization, computing rates from the
+    deltas of counters between two samples. Files of procfs are opened
+    once and everything that does not change (mount point, block
+    devices) is looked up at startup.
+    """
+
+    def __init__(self, per_core=False, network=False, disk=False, jobs=()):
+        self.per_core = per_core
+        self.mountpoint = psutil.disk_partitions()[0].mountpoint
+        self.stat = ProcFile('/proc/stat')
+        self.meminfo = ProcFile('/proc/meminfo')
+        self.cpu_times = cpu_times(self.stat.read())
+        if network:
+            self.softirqs = ProcFile('/proc/softirqs')
+            self.last_softirqs = softirqs(self.softirqs.read())
+        else:
+            self.softirqs = None
+        if disk:
+            self.devices = block_devices()
+            self.diskstats = ProcFile('/proc/diskstats')
+            self.disks_io = disks_io(self.diskstats.read(), self.devices)
+        else:
+            self.diskstats = None
+        self.jobs = [JobProcesses(name) for name in jobs]
+        self.cpu_time = time.process_time()
+
+    def sample(self, elapsed):
+        """Return the statistics of the whole system and the ones to
+        send with a suffix (CPU cores, followed jobs).
+        """
+        cores = cpu_times(self.stat.read())
+        total = [sum(times) for times in zip(*cores)]
+        last_total = [sum(times) for times in zip(*self.cpu_times)]
+        statistics = busy_percent(total, last_total)
+        statistics.update(memory_percents(self.meminfo.read()))
+        statistics['disk_space_percent'] = psutil.disk_usage(self.mountpoint).percent
+        suffixed = {}
+        if self.per_core:
+            for core, (times, last_times) in enumerate(zip(cores, self.cpu_times)):
+                suffixed['cpu{}'.format(core)] = busy_percent(times, last_times)
+        self.cpu_times = cores
+
+        if self.softirqs is not None:
+            counters = softirqs(self.softirqs.read())
+            for name, values in counters.items():
+                rates = [
+                        (new - old) / elapsed
+                        for new, old in zip(values, self.last_softirqs.get(name, ()))
+                ]
+                statistics[name] = sum(rates)
+                if self.per_core:
+                    for core, rate in enumerate(rates):
+                        suffixed.setdefault('cpu{}'.format(core), {})[name] = rate
+            self.last_softirqs = counters
+
+        if self.diskstats is not None:
+            io = disks_io(self.diskstats.read(), self.devices)
+            read_bytes, write_bytes, read_count, write_count, busy_time = (
+                    (new - old) / elapsed for new, old in zip(io, self.disks_io))
+            statistics.update(
+                    disk_read_rate=read_bytes,
+                    disk_write_rate=write_bytes,
+                    disk_read_iops=read_count,
+                    disk_write_iops=write_count,
+                    disk_busy_percent=busy_time / 10,
+            )
+            self.disks_io = io
+
+        for job in self.jobs:
+            suffixed[job.name] = job.sample(elapsed)
+
+        # Overhead of the monitoring itself, in percent of a core
+        cpu_time = time.process_time()
+        statistics['monitor_cpu'] = 100 * (cpu_time - self.cpu_time) / elapsed
+        self.cpu_time = cpu_time
+
+        return statistics, suffixed
+
+
+def main(interval, per_core, network, disk, jobs):
+    sampler = SystemSampler(per_core, network, disk, jobs)
+    for elapsed, missed_deadlines in PeriodicSampler(interval):
+        timestamp = collect_agent.now()
+        statistics, suffixed = sampler.sample(elapsed)
+        if missed_deadlines:
+            statistics['missed_deadlines'] = missed_deadlines
+        collect_agent.send_stat(timestamp, **statistics)
+        for suffix, suffixed_statistics in suffixed.items():
+            collect_agent.send_stat(timestamp, suffix=suffix, **suffixed_statistics)
 
 
-def main(interval):
-    while True:
-        collect_agent.send_stat(
-                collect_agent.now(),
-                cpu_percent=psutil.cpu_percent(),
-                virtual_memory_percent=psutil.virtual_memory().percent,
-                swap_memory_percent=psutil.swap_memory().percent,
-                disk_space_percent=psutil.disk_usage(psutil.disk_partitions()[0].mountpoint).percent,
-        )
-        time.sleep(interval)
-      
-    
 if __name__ == "__main__":
     with collect_agent.use_configuration('/opt/openbach/agent/jobs/system_utilization/system_utilization_rstats_filter.conf'):
         # Argument parsing
         parser = argparse.ArgumentParser()
         parser.add_argument(
                 '-i', '--interval',
-                type=int, default=1,
+                type=float, default=1,
                 help='The pause *interval* seconds between periodic information retrieval (Default: 1 second)')
+        parser.add_argument(
+                '-c', '--per-core', action='store_true',
+                help='Also report the utilization of each CPU core')
+        parser.add_argument(
+                '-n', '--network', action='store_true',
+                help='Also report the rate of network software interrupts')
+        parser.add_argument(
+                '-d', '--disk', action='store_true',
+                help='Also report disks I/O throughput')
+        parser.add_argument(
+                '-j', '--job', dest='jobs', metavar='JOB_NAME', action='append', default=[],
+                help='Also report the resources used by the processes of the given job; '
+                'can be used several times')
 
         args = parser.parse_args()
-        main(args.interval)
+        main(args.interval, args.per_core, args.network, args.disk, args.jobs)
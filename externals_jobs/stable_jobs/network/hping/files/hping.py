@@ -41,6 +41,11 @@ import os
 import sys
 import time
 import shlex
+import random
+import select
+import signal
+import socket
+import struct
 import syslog
 import argparse
 import traceback
@@ -49,9 +54,189 @@ from subprocess import Popen, PIPE, STDOUT
 from statistics import mean
 
 import collect_agent
+from job_helpers import StatisticsAggregator
 
 
-def main(destination_ip, count, interval, microseconds, n_mean, destport):
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+TIMESPEC = struct.Struct('@ll')
+TCP_HEADER = struct.Struct('!HHIIBBHHH')
+PSEUDO_HEADER = struct.Struct('!4s4sBBH')
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+SEQUENCE_MASK = 0xFFFFFFFF
+PROBE_TIMEOUT = 3
+MAX_PENDING_STATS = 1000
+EMISSION_MARGIN = 1e-3
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack('!{}H'.format(len(data) // 2), data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class SynProber:
+    """Send TCP SYN probes through a raw socket and match them with
+    the SYN/ACK or RST they trigger.
+
+    Replies are timestamped by the kernel upon reception (SO_TIMESTAMPNS)
+    so the RTT does not account for the time spent processing them.
+    Probes are identified by their sequence number, acknowledged + 1 in
+    the replies, and forgotten if unanswered after `timeout` seconds.
+    """
+
+    def __init__(self, destination, port, timeout=PROBE_TIMEOUT):
+        self.destination = socket.gethostbyname(destination)
+        self.port = port
+        self.timeout = timeout
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as route:
+            route.connect((self.destination, port))
+            self.source = route.getsockname()[0]
+
+        # Reserve the source port so no local connection uses it; the
+        # kernel will also reset the half-open connections for us
+        self.reservation = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.reservation.bind((self.source, 0))
+        self.source_port = self.reservation.getsockname()[1]
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        self.socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        self.ancillary_size = socket.CMSG_SPACE(TIMESPEC.size)
+        self.pseudo_header = PSEUDO_HEADER.pack(
+                socket.inet_aton(self.source),
+                socket.inet_aton(self.destination),
+                0, socket.IPPROTO_TCP, TCP_HEADER.size)
+        self.sequence = random.getrandbits(32)
+        self.pending = {}
+        self.sent = 0
+        self.lost = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.socket.close()
+        self.reservation.close()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def probe(self):
+        sequence = (self.sequence + self.sent) & SEQUENCE_MASK
+        header = (
+                self.source_port, self.port, sequence, 0,
+                TCP_HEADER.size << 2, TCP_SYN, 65535)
+        segment = TCP_HEADER.pack(*header, 0, 0)
+        segment = TCP_HEADER.pack(*header, checksum(self.pseudo_header + segment), 0)
+
+        self.pending[sequence] = time.time_ns()
+        self.socket.sendto(segment, (self.destination, 0))
+        self.sent += 1
+
+    def replies(self):
+        """Drain the replies pending on the socket, yielding their
+        reception time and the RTT of the matching probe, in ns.
+        """
+        while True:
+            try:
+                packet, ancillary, _, (address, _) = self.socket.recvmsg(
+                        128, self.ancillary_size, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return
+
+            if address != self.destination:
+                continue
+            try:
+                source, destination, _, ack, _, flags, *_ = TCP_HEADER.unpack_from(
+                        packet, (packet[0] & 0x0F) << 2)
+            except struct.error:
+                continue
+            if source != self.port or destination != self.source_port:
+                continue
+            if not flags & TCP_ACK or not flags & (TCP_SYN | TCP_RST):
+                continue
+            sent = self.pending.pop((ack - 1) & SEQUENCE_MASK, None)
+            if sent is None:
+                continue
+
+            received = None
+            for level, kind, data in ancillary:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+                    seconds, nanoseconds = TIMESPEC.unpack_from(data)
+                    received = seconds * 1000000000 + nanoseconds
+            if received is None:
+                received = time.time_ns()
+            yield received, received - sent
+
+    def expire(self):
+        """Forget about probes unanswered for too long"""
+        limit = time.time_ns() - int(self.timeout * 1e9)
+        pending = self.pending
+        while pending:
+            sequence = next(iter(pending))
+            if pending[sequence] > limit:
+                break
+            del pending[sequence]
+            self.lost += 1
+
+
+def probe_rtt(destination_ip, count, interval, n_mean, destport, window=0):
+    """Measure the RTT using SYN probes sent from this process.
+
+    Probes are sent on deadlines of the monotonic clock every `interval`
+    seconds; statistics are buffered and emitted while waiting for the
+    next deadline so sending them does not delay probes nor replies.
+    """
+    send_stat = StatisticsAggregator(window)
+    measurements = []
+    statistics = []
+
+    def emit():
+        for timestamp, rtt in statistics:
+            send_stat(timestamp, rtt=rtt)
+            send_stat.expire(timestamp)
+        statistics.clear()
+
+    with SynProber(destination_ip, destport) as prober:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            deadline = time.monotonic()
+            while count is None or prober.sent < count or prober.pending:
+                sending = count is None or prober.sent < count
+                now = time.monotonic()
+                if sending and now >= deadline:
+                    prober.probe()
+                    deadline += interval
+                    if deadline <= now:
+                        # Skip overrun deadlines instead of bursting to catch up
+                        deadline += ((now - deadline) // interval + 1) * interval
+
+                for received, rtt in prober.replies():
+                    measurements.append(rtt / 1e6)
+                    if len(measurements) == n_mean:
+                        statistics.append((received // 1000000, mean(measurements)))
+                        measurements = []
+                prober.expire()
+
+                timeout = deadline - time.monotonic() if sending else prober.timeout
+                if statistics and (timeout > EMISSION_MARGIN or len(statistics) >= MAX_PENDING_STATS):
+                    emit()
+                    timeout = deadline - time.monotonic() if sending else prober.timeout
+                select.select([prober], [], [], max(timeout, 0))
+        finally:
+            emit()
+            send_stat.flush()
+            collect_agent.send_stat(
+                    collect_agent.now(),
+                    sent_probes=prober.sent,
+                    lost_probes=prober.lost + len(prober.pending))
+
+
+def main(destination_ip, count, interval, microseconds, n_mean, destport, window=0):
     cmd = ['stdbuf', '-oL']
     cmd += ['hping3', str(destination_ip), '-S']
     if destport:
@@ -65,6 +250,7 @@ def main(destination_ip, count, interval, microseconds, n_mean, destport):
             cmd += ['-i', str(interval)]
 
     measurements = []
+    send_stat = StatisticsAggregator(window)
 
     # launch command
     p = Popen(cmd, stdout=PIPE, stderr=STDOUT)
@@ -96,8 +282,11 @@ def main(destination_ip, count, interval, microseconds, n_mean, destport):
 
         measurements.append(rtt_data)
         if len(measurements) == n_mean:
-            collect_agent.send_stat(timestamp, rtt=mean(measurements))
+            send_stat(timestamp, rtt=mean(measurements))
             measurements = []
+        send_stat.expire(timestamp)
+
+    send_stat.flush()
 
 
 if __name__ == "__main__":
@@ -126,6 +315,14 @@ if __name__ == "__main__":
         parser.add_argument(
                 '-m', '--mean', type=int, 
                 help='Collect the mean RTT of every N packets.', default=1)
+        parser.add_argument(
+                '-w', '--window', type=float, default=0,
+                help='Send, instead of each RTT, their count, min, max, mean and '
+                'percentiles over windows of this duration in seconds (0 to disable)')
+        parser.add_argument(
+                '-e', '--engine', choices=['hping3', 'native'], default='hping3',
+                help='Send probes and parse replies using hping3, or from this job '
+                'using kernel timestamps of the replies for better accuracy')
 
         # get args
         args = parser.parse_args()
@@ -151,4 +348,9 @@ if __name__ == "__main__":
             interval = 0
             microseconds = False
 
-        main(destination_ip, count, interval, microseconds, n_mean, destport)
+        if args.engine == 'native':
+            if microseconds:
+                interval /= 1000000
+            probe_rtt(destination_ip, count, interval or 1, n_mean, destport, args.window)
+        else:
+            main(destination_ip, count, interval, microseconds, n_mean, destport, args.window)
@@ -40,30 +40,47 @@ import time
 import syslog
 import argparse
 import traceback
-import subprocess
 import contextlib
 
 import collect_agent
-
-
-def run_command(*cmd):
-    try:
-        return subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
-    except subprocess.CalledProcessError as err:
-        message = "Error when executing command '{}': '{}'".format(' '.join(cmd), p.stderr)
-        collect_agent.send_log(syslog.LOG_ERR, message)
-        sys.exit(message)
-
-
-def ip_link(interface):
-    lines = run_command('ip', '-s', 'link', 'show', 'dev', interface).splitlines()
-    for i, line in enumerate(lines):
-        if 'TX' in line:
-            tx = map(int, lines[i+1].split())
-        if 'RX' in line:
-            rx = map(int, lines[i+1].split())
-
-    return list(tx)[:4], list(rx)[:4]
+from job_helpers import PeriodicSampler
+
+
+COUNTERS = ('bytes', 'packets', 'errors', 'dropped')
+STATISTICS = '/sys/class/net/{}/statistics/{}_{}'
+
+
+class InterfaceCounters:
+    """Read the counters of an interface from sysfs, without spawning
+    any process: each counter file is opened once and read again from
+    its beginning on each sample, which makes the kernel refresh it.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.descriptors = {
+                direction: [
+                    os.open(STATISTICS.format(interface, direction, counter), os.O_RDONLY)
+                    for counter in COUNTERS
+                ] for direction in ('tx', 'rx')
+        }
+
+    def read(self):
+        """Return the TX and RX counters, in the same order than `ip -s link`,
+        and the time (in ms since the epoch) and monotonic time at which
+        they were read.
+        """
+        timestamp = collect_agent.now()
+        monotonic = time.monotonic()
+        tx = [int(os.pread(fd, 32, 0)) for fd in self.descriptors['tx']]
+        rx = [int(os.pread(fd, 32, 0)) for fd in self.descriptors['rx']]
+        return timestamp, monotonic, tx, rx
+
+    def close(self):
+        for descriptors in self.descriptors.values():
+            for fd in descriptors:
+                os.close(fd)
+        self.descriptors = {'tx': [], 'rx': []}
 
 
 def parse_interval(new_values, old_values, interval):
@@ -73,35 +90,53 @@ def parse_interval(new_values, old_values, interval):
     return diff
 
 
-def main(interface, interval):
-    last_tx, last_rx = ip_link(interface)
-
-    while True:
-        tx, rx = ip_link(interface)
-        tx_stats = parse_interval(tx, last_tx, interval)
-        rx_stats = parse_interval(rx, last_rx, interval)
-
-        collect_agent.send_stat(
-                collect_agent.now(),
-                suffix=interface,
-                tx_bits_in_interval=tx_stats[0] * 8,
-                tx_pkts_in_interval=tx_stats[1],
-                tx_errors_in_interval=tx_stats[2],
-                tx_drops_in_interval=tx_stats[3],
-                tx_rate_bits=tx_stats[4] * 8,
-                tx_rate_pkts=tx_stats[5],
-                rx_bits_in_interval=rx_stats[0] * 8,
-                rx_pkts_in_interval=rx_stats[1],
-                rx_errors_in_interval=rx_stats[2],
-                rx_drops_in_interval=rx_stats[3],
-                rx_rate_bits=rx_stats[4] * 8,
-                rx_rate_pkts=rx_stats[5],
-        )
-
-        last_tx = tx
-        last_rx = rx
-
-        time.sleep(interval)
+def open_counters(interfaces):
+    counters = []
+    for interface in interfaces:
+        try:
+            counters.append(InterfaceCounters(interface))
+        except OSError as error:
+            message = 'Cannot read the counters of interface {}: {}'.format(interface, error)
+            collect_agent.send_log(syslog.LOG_ERR, message)
+            sys.exit(message)
+    return counters
+
+
+def main(interfaces, interval):
+    counters = open_counters(interfaces)
+    last_samples = [interface.read() for interface in counters]
+
+    for _, missed_deadlines in PeriodicSampler(interval):
+        if missed_deadlines:
+            collect_agent.send_stat(collect_agent.now(), missed_deadlines=missed_deadlines)
+
+        for index, interface in enumerate(counters):
+            sample = interface.read()
+            timestamp, monotonic, tx, rx = sample
+            _, last_monotonic, last_tx, last_rx = last_samples[index]
+            last_samples[index] = sample
+
+            # Rates are computed on the time actually elapsed between reads
+            elapsed = monotonic - last_monotonic
+            tx_stats = parse_interval(tx, last_tx, elapsed)
+            rx_stats = parse_interval(rx, last_rx, elapsed)
+
+            collect_agent.send_stat(
+                    timestamp,
+                    suffix=interface.interface,
+                    tx_bits_in_interval=tx_stats[0] * 8,
+                    tx_pkts_in_interval=tx_stats[1],
+                    tx_errors_in_interval=tx_stats[2],
+                    tx_drops_in_interval=tx_stats[3],
+                    tx_rate_bits=tx_stats[4] * 8,
+                    tx_rate_pkts=tx_stats[5],
+                    rx_bits_in_interval=rx_stats[0] * 8,
+                    rx_pkts_in_interval=rx_stats[1],
+                    rx_errors_in_interval=rx_stats[2],
+                    rx_drops_in_interval=rx_stats[3],
+                    rx_rate_bits=rx_stats[4] * 8,
+                    rx_rate_pkts=rx_stats[5],
+            )
 
 
 if __name__ == '__main__':
@@ -111,8 +146,8 @@ if __name__ == '__main__':
                 description=__doc__,
                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-        parser.add_argument('interface', type=str, help='The interface to monitor.')
-        parser.add_argument('-i', '--interval', type=int, default=1, help='Interval for statistics in seconds.')
+        parser.add_argument('interface', type=str, nargs='+', help='The interfaces to monitor.')
+        parser.add_argument('-i', '--interval', type=float, default=1, help='Interval for statistics in seconds.')
 
         args = parser.parse_args()
 
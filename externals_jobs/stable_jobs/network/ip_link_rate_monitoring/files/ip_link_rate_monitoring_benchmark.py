@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them. It is
+# composed of an Auditorium (HMIs), a Controller, a Collector and multiple
+# Agents (one for each network entity that wants to be tested).
+#
+#
+# Copyright © 2022 Eutelsat
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY, without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+
+"""Benchmark of the per-sample overhead of the Job ip_link_rate_monitoring.
+
+Compare reading interface counters by parsing the output of `ip -s link`
+with reading them from sysfs. Run it on an agent, next to the job sources:
+`python3 ip_link_rate_monitoring_benchmark.py eth0 -n 1000`.
+"""
+
+
+import os
+import time
+import argparse
+import subprocess
+
+from ip_link_rate_monitoring import InterfaceCounters
+
+
+def ip_link(interface):
+    """Counters of an interface as parsed from the output of `ip -s link`,
+    as previously done by the job.
+    """
+    lines = subprocess.run(
+            ['ip', '-s', 'link', 'show', 'dev', interface],
+            capture_output=True, text=True, check=True).stdout.splitlines()
+    for i, line in enumerate(lines):
+        if 'TX' in line:
+            tx = map(int, lines[i+1].split())
+        if 'RX' in line:
+            rx = map(int, lines[i+1].split())
+
+    return list(tx)[:4], list(rx)[:4]
+
+
+def measure(sample, count):
+    """Run `sample` `count` times and return the wall-clock time and
+    CPU time (including the one of child processes) per sample, in µs.
+    """
+    start_times = os.times()
+    start = time.perf_counter()
+    for _ in range(count):
+        sample()
+    elapsed = time.perf_counter() - start
+    end_times = os.times()
+    cpu = sum(end_times[:4]) - sum(start_times[:4])
+    return elapsed / count * 1e6, cpu / count * 1e6
+
+
+def main(interface, count):
+    counters = InterfaceCounters(interface)
+    methods = {
+            'ip -s link': lambda: ip_link(interface),
+            'sysfs': counters.read,
+    }
+    print('{:<12} {:>14} {:>14}'.format('method', 'wall (µs)', 'cpu (µs)'))
+    for name, sample in methods.items():
+        wall, cpu = measure(sample, count)
+        print('{:<12} {:>14.1f} {:>14.1f}'.format(name, wall, cpu))
+    counters.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('interface', help='The interface to read counters from.')
+    parser.add_argument('-n', '--count', type=int, default=500, help='Amount of samples per method.')
+    args = parser.parse_args()
+    main(args.interface, args.count)
@@ -37,7 +37,10 @@ __credits__ = '''Contributors:
 
 import sys
 import time
+import errno
+import bisect
 import signal
+import struct
 import syslog
 import socket
 import argparse
@@ -46,6 +49,16 @@ from queue import Queue
 from functools import partial
 
 import collect_agent
+from job_helpers import StatisticsAggregator
+
+
+WINDOW_SIZE = 65536  # Sequence numbers tracked for duplicates and reordering extent
+HEADER = struct.Struct('!4sQQ')  # Magic, sequence number, send timestamp (ns)
+MAGIC = b'OOD1'
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+MAX_SEGMENTS = 64  # Kernel limit of datagrams in a single UDP GSO send
+MAX_BATCH_DURATION = 1e-3  # Longest time, in seconds, a batch can catch up
 
 
 def _parse_to_packets(entry):
@@ -68,12 +81,97 @@ def signal_term_handler(entity, sock, signal, frame):
     sys.exit(message)
 
 
-def timer(duration, q):
-    time.sleep(duration)
-    q.put('stop_transmitting')
+class PacedSender:
+    """Send datagrams carrying a binary sequence number and their send
+    timestamp to a connected UDP socket, at a given packet rate.
+
+    Datagrams are sent in batches of every datagram due since the
+    beginning of the transmission, so pacing never drifts whatever the
+    sleeping accuracy. Batches are handed to the kernel in a single
+    system call using UDP segmentation offload when available, and
+    datagram per datagram otherwise.
+    """
+
+    def __init__(self, sock, packet_size, rate=None):
+        self.socket = sock
+        self.packet_size = max(packet_size, HEADER.size)
+        self.rate = rate
+        self.sent = 0
+        if rate:
+            max_batch = int(rate * MAX_BATCH_DURATION)
+            self.max_batch = min(max(max_batch, 1), MAX_SEGMENTS)
+        else:
+            self.max_batch = MAX_SEGMENTS
+        self.max_batch = min(self.max_batch, 65000 // self.packet_size) or 1
+        self.buffer = bytearray(self.packet_size * self.max_batch)
+        self.segmentation = self.max_batch > 1 and self._enable_segmentation()
 
+    def _enable_segmentation(self):
+        try:
+            self.socket.setsockopt(SOL_UDP, UDP_SEGMENT, self.packet_size)
+        except OSError:
+            return False
+        return True
 
-def client(server_ip, server_port, signal_port, duration, transmitted_packets):
+    def _send(self, count):
+        buffer = self.buffer
+        size = self.packet_size
+        timestamp = time.time_ns()
+        for index in range(count):
+            HEADER.pack_into(buffer, index * size, MAGIC, self.sent + index, timestamp)
+
+        if self.segmentation:
+            try:
+                self.socket.send(memoryview(buffer)[:count * size])
+            except OSError as error:
+                if error.errno not in (errno.EIO, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                # Segmentation offload refused by the output device
+                self.segmentation = False
+                self.socket.setsockopt(SOL_UDP, UDP_SEGMENT, 0)
+            else:
+                self.sent += count
+                return
+
+        send = self.socket.send
+        view = memoryview(buffer)
+        for index in range(count):
+            send(view[index * size:(index + 1) * size])
+        self.sent += count
+
+    def run(self, packets=None, duration=None):
+        """Send datagrams until `packets` are sent or `duration`
+        seconds elapsed, whichever comes first. Return the elapsed time.
+        """
+        rate = self.rate
+        max_batch = self.max_batch
+        start = time.monotonic()
+        deadline = start + duration if duration else None
+        while packets is None or self.sent < packets:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            if rate:
+                due = int((now - start) * rate) + 1 - self.sent
+                if due <= 0:
+                    delay = start + self.sent / rate - now
+                    if delay > MAX_BATCH_DURATION / 2:
+                        time.sleep(delay)
+                    continue
+                count = min(due, max_batch)
+            else:
+                count = max_batch
+            if packets is not None:
+                count = min(count, packets - self.sent)
+            try:
+                self._send(count)
+            except (BlockingIOError, ConnectionRefusedError):
+                # Full socket buffer or no listener (yet): drop the batch
+                self.sent += count
+        return time.monotonic() - start
+
+
+def client(server_ip, server_port, signal_port, duration, transmitted_packets, rate, packet_size):
     # Set signalisation communication to the Server
     signal_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
@@ -84,28 +182,25 @@ def client(server_ip, server_port, signal_port, duration, transmitted_packets):
         sys.exit(message)
 
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client_socket.connect((server_ip, server_port))
 
     # Manage SIGTERM and SIGINT signals behavior
     signal.signal(signal.SIGTERM, partial(signal_term_handler, 'client', signal_socket))
     signal.signal(signal.SIGINT, partial(signal_term_handler, 'client', signal_socket))
 
-    if duration:
-        q = Queue()
-        t_timer = threading.Thread(target=timer, args=(duration, q))
-        t_timer.daemon = True
-        t_timer.start()
-
-    id = 0
-    while True:
-        if ((transmitted_packets is not None and id == _parse_to_packets(transmitted_packets))
-                or (duration and not q.empty())):
-            time.sleep(1) # Wait that all the UDP packets are sent to prevent deordering of the TCP message
-            signal_socket.sendall(b'stop_server')
-            data = signal_socket.recv(1024)
-            signal_socket.close()
-            break
-        client_socket.sendto(str(id).encode(), (server_ip, server_port))
-        id = id + 1
+    packets = None if transmitted_packets is None else _parse_to_packets(transmitted_packets)
+    sender = PacedSender(client_socket, packet_size, rate)
+    elapsed = sender.run(packets, duration)
+    collect_agent.send_stat(
+            collect_agent.now(),
+            sent_packets=sender.sent,
+            send_rate=sender.sent / elapsed if elapsed else 0,
+            send_throughput=sender.sent * sender.packet_size * 8 / elapsed if elapsed else 0)
+
+    time.sleep(1) # Wait that all the UDP packets are sent to prevent deordering of the TCP message
+    signal_socket.sendall(b'stop_server')
+    data = signal_socket.recv(1024)
+    signal_socket.close()
 
 
 def signalisation(address, port, q, exit):
@@ -136,41 +231,188 @@ def signalisation(address, port, q, exit):
                     print(message)
 
 
-def parse_udp(server_socket, q_signal):
-    received = [] # Received UDP packets
-    in_order = [] # In order packets
-    out_of_order = [] # Out of order packets
-    server_socket.settimeout(None)
-    prev_id, _ = server_socket.recvfrom(1024)
-    received.append(int(prev_id))
+class ReorderingAnalyzer:
+    """Online analysis of the sequence numbers of received datagrams,
+    after the metrics of RFC 4737, in bounded memory.
+
+    A datagram is reordered if its sequence number is lower than the
+    next expected one (the highest received so far, plus one), and a
+    duplicate if the same sequence number was already received. Both
+    are only tracked for the last `window` sequence numbers; older
+    datagrams are only counted as late. Sequence discontinuities (gaps)
+    are recorded each time the next expected sequence number jumps.
+    Clients number their datagrams from 0, so this is the first
+    expected sequence number, whatever the first datagram received.
+
+    The reordering extent of a reordered datagram is the amount of
+    datagrams received between the first one with a greater sequence
+    number and itself.
+    """
+
+    COUNTERS = (
+            'received', 'in_order', 'reordered', 'duplicated',
+            'late', 'gaps', 'gaps_size', 'extent_sum',
+    )
+
+    def __init__(self, window=WINDOW_SIZE):
+        self.window = window
+        self.seen = bytearray(window)
+        self.next_expected = 0
+        # Arrival index of datagrams that increased next_expected
+        self.in_order_sequences = []
+        self.in_order_arrivals = []
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        self.max_extent = 0
+        self.max_offset = 0
+
+    def add(self, sequence):
+        arrival = self.received
+        self.received += 1
+        expected = self.next_expected
+
+        if sequence >= expected:
+            if sequence > expected:
+                self.gaps += 1
+                self.gaps_size += sequence - expected
+            self._advance(expected, sequence, arrival)
+            self.in_order += 1
+            return
+
+        offset = expected - sequence
+        if offset > self.window:
+            self.late += 1
+            return
+
+        slot = sequence % self.window
+        if self.seen[slot]:
+            self.duplicated += 1
+            return
+        self.seen[slot] = 1
+
+        self.reordered += 1
+        self.max_offset = max(self.max_offset, offset)
+        index = bisect.bisect_right(self.in_order_sequences, sequence)
+        extent = arrival - self.in_order_arrivals[index]
+        self.extent_sum += extent
+        self.max_extent = max(self.max_extent, extent)
+
+    def _advance(self, expected, sequence, arrival):
+        """Move the window up to `sequence` (included)"""
+        window = self.window
+        seen = self.seen
+        if sequence - expected >= window:
+            seen[:] = bytes(window)
+        else:
+            for missing in range(expected, sequence):
+                seen[missing % window] = 0
+        seen[sequence % window] = 1
+        self.next_expected = sequence + 1
+
+        sequences = self.in_order_sequences
+        sequences.append(sequence)
+        self.in_order_arrivals.append(arrival)
+        if len(sequences) > 2 * window:
+            # Forget datagrams out of the window, amortized
+            # over the last `window` insertions
+            obsolete = bisect.bisect_left(sequences, sequence - window)
+            del sequences[:obsolete]
+            del self.in_order_arrivals[:obsolete]
+
+    @property
+    def lost(self):
+        """Sequence numbers never received, as of now"""
+        unique = self.received - self.duplicated - self.late
+        return max(self.next_expected - unique, 0)
+
+    def snapshot(self):
+        counters = {counter: getattr(self, counter) for counter in self.COUNTERS}
+        counters['lost'] = self.lost
+        return counters
+
+    def statistics(self, previous=None):
+        """Build the statistics of the whole analysis, or of the
+        interval since the `previous` snapshot if provided.
+        """
+        counters = self.snapshot()
+        if previous is not None:
+            counters = {name: value - previous[name] for name, value in counters.items()}
+            # Datagrams of previous intervals can be recovered by reordering
+            counters['lost'] = max(counters['lost'], 0)
+
+        received = counters['received']
+        expected = received - counters['duplicated'] + counters['lost']
+        statistics = {
+                'packets_received': received,
+                'out_of_order_packets': counters['reordered'],
+                'out_of_order_ratio': counters['reordered'] / received if received else 0,
+                'duplicated_packets': counters['duplicated'],
+                'duplicated_ratio': counters['duplicated'] / received if received else 0,
+                'late_packets': counters['late'],
+                'lost_packets': counters['lost'],
+                'lost_ratio': counters['lost'] / expected if expected > 0 else 0,
+                'sequence_gaps': counters['gaps'],
+                'mean_reordering_extent': counters['extent_sum'] / counters['reordered'] if counters['reordered'] else 0,
+        }
+        if previous is None:
+            statistics['total_packets_received'] = statistics.pop('packets_received')
+            statistics['max_reordering_extent'] = self.max_extent
+            statistics['max_reordering_offset'] = self.max_offset
+        else:
+            statistics = {'interval_' + name: value for name, value in statistics.items()}
+        return statistics
+
+
+def _parse_datagram(datagram):
+    """Return the sequence number of a datagram and its send
+    timestamp in ns, if any.
+    """
+    if datagram.startswith(MAGIC):
+        try:
+            _, sequence, timestamp = HEADER.unpack_from(datagram)
+        except struct.error:
+            raise ValueError('truncated datagram')
+        return sequence, timestamp
+    # Textual sequence numbers of previous clients
+    return int(datagram), None
+
+
+def parse_udp(server_socket, q_signal, interval, delays, window):
+    analyzer = ReorderingAnalyzer()
+    previous = analyzer.snapshot()
+    next_report = None
+    recv = server_socket.recv
+    send_delay = StatisticsAggregator(window)
+
     server_socket.settimeout(1)
     while q_signal.empty():
         try:
-            new_id, _ = server_socket.recvfrom(1024)
+            datagram = recv(65536)
         except socket.timeout:
-            continue
+            send_delay.expire(collect_agent.now())
         else:
-            received.append(int(new_id))
-
-    total_received = len(received)
-    in_order.append(received.pop(0))
-
-    while received:
-        if received[0] < in_order[-1]:
-            out_of_order.append(received.pop(0))
-        else:
-            in_order.append(received.pop(0))
-
-    ooo = len(out_of_order),
-    dupes = len(received) - len(set(received))
-    collect_agent.send_stat(
-            collect_agent.now(),
-            total_packets_received=total_received,
-            out_of_order_packets=ooo,
-            out_of_order_ratio=ooo / total_received,
-            duplicated_packets=dupes,
-            duplicated_ratio=dupes / total_received,
-    )
+            try:
+                sequence, sent = _parse_datagram(datagram)
+            except ValueError:
+                continue
+            analyzer.add(sequence)
+            if delays and sent is not None:
+                received = time.time_ns()
+                timestamp = received // 1000000
+                send_delay(timestamp, one_way_delay=(received - sent) / 1e6)
+                send_delay.expire(timestamp)
+
+        if interval and analyzer.received:
+            now = time.monotonic()
+            if next_report is None:
+                next_report = now + interval
+            elif now >= next_report:
+                collect_agent.send_stat(collect_agent.now(), **analyzer.statistics(previous))
+                previous = analyzer.snapshot()
+                next_report += interval * (1 + (now - next_report) // interval)
+
+    send_delay.flush()
+    collect_agent.send_stat(collect_agent.now(), **analyzer.statistics())
     message = q_signal.get_nowait()
     if message == 'stop_server':
         return True
@@ -182,7 +424,7 @@ def parse_udp(server_socket, q_signal):
         sys.exit(log)
 
 
-def server(address, server_port, signal_port, exit):
+def server(address, server_port, signal_port, exit, interval, delays, window):
     # Start TCP socket for signalisation
     q_signal = Queue()
     t_signal = threading.Thread(target=signalisation, args=(address, signal_port, q_signal, exit))
@@ -205,7 +447,7 @@ def server(address, server_port, signal_port, exit):
     # Parse UDP packets coming from the client
     stop_server = None
     while not stop_server:
-        stop_server = parse_udp(server_socket, q_signal)
+        stop_server = parse_udp(server_socket, q_signal, interval, delays, window)
 
 
 if __name__ == "__main__":
@@ -233,6 +475,19 @@ if __name__ == "__main__":
         parser_server.add_argument(
                 '-a', '--address', type=str, default='0.0.0.0',
                 help='The address to bind the server (default = 0.0.0.0)')
+        parser_server.add_argument(
+                '-i', '--interval', type=float, default=1,
+                help='Period, in seconds, of the intermediate statistics '
+                'sent during a test. Set 0 to only get the final ones.')
+        parser_server.add_argument(
+                '-D', '--delays', action='store_true',
+                help='Report the one-way delay of each packet, in ms; '
+                'clocks of the client and the server must be synchronized.')
+        parser_server.add_argument(
+                '-w', '--window', type=float, default=0,
+                help='Send, instead of each one-way delay, their count, min, max, '
+                'mean and percentiles over windows of this duration in seconds '
+                '(0 to disable)')
         # Only client parameters
         parser_client = subparsers.add_parser('client', help='Run in client mode')
         parser_client.add_argument(
@@ -245,6 +500,14 @@ if __name__ == "__main__":
                 '-n', '--transmitted-packets', type=str,
                 help='The number of packets to transmit. It has same priority as duration parameter. You can '
                 'use [K/M/G]: set 100K to send 100.000 packets. (default = None)')
+        parser_client.add_argument(
+                '-r', '--rate', type=float,
+                help='The rate of the transmission in packets per second. '
+                'Leave unset to send as fast as possible.')
+        parser_client.add_argument(
+                '-l', '--packet-size', type=int, default=HEADER.size,
+                help='The size of the UDP payload of each packet in bytes '
+                '(at least {}).'.format(HEADER.size))
 
         # Set subparsers options to automatically call the right
         # function depending on the chosen subcommand
@@ -33,122 +33,370 @@ __credits__ = '''Contributors:
  * Bastien TAURAN <bastien.tauran@toulouse.viveris.com>
 '''
 
-import re
+import os
 import sys
 import time
+import socket
+import struct
 import syslog
 import argparse
-import subprocess
 
 import collect_agent
+from job_helpers import PeriodicSampler
 
 
-def convert(value):
-    match = re.fullmatch(r'(-?\d+\.?\d*)([GMKkmun])?', value)
-    if not match:
-        return 0.0
-
-    base, unit = match.groups()
-    if unit == 'G':
-        return 1000000000 * float(base)
-    elif unit == 'M':
-        return 1000000 * float(base)
-    elif unit in 'kK':
-        return 1000 * float(base)
-    elif unit == 'm':
-        return float(base) / 1000
-    elif unit == 'u':
-        return float(base) / 1000000
-    elif unit == 'n':
-        return float(base) / 1000000000
+# Netlink and rtnetlink constants (see linux/netlink.h and linux/rtnetlink.h)
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_GETQDISC = 38
+RTM_GETTCLASS = 42
+NLA_TYPE_MASK = 0x3fff
+
+NLMSGHDR = struct.Struct('=IHHII')
+NLMSGERR = struct.Struct('=i')
+TCMSG = struct.Struct('=BxxxiIII')
+NLATTR = struct.Struct('=HH')
+
+# Attributes of a tcmsg (see linux/rtnetlink.h)
+TCA_KIND = 1
+TCA_XSTATS = 4
+TCA_STATS2 = 7
+
+# Attributes nested in TCA_STATS2 (see linux/gen_stats.h)
+TCA_STATS_BASIC = 1
+TCA_STATS_QUEUE = 3
+TCA_STATS_APP = 4
+TCA_STATS_PKT64 = 8
+
+GNET_STATS_BASIC = struct.Struct('=QI')
+GNET_STATS_QUEUE = struct.Struct('=IIIII')
+
+RECEIVE_BUFFER_SIZE = 65536
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def parse_attributes(data, offset=0, end=None):
+    """Map the type of each netlink attribute found in `data` to its payload"""
+    if end is None:
+        end = len(data)
+    attributes = {}
+    while offset + NLATTR.size <= end:
+        length, kind = NLATTR.unpack_from(data, offset)
+        if length < NLATTR.size:
+            break
+        attributes[kind & NLA_TYPE_MASK] = data[offset + NLATTR.size:offset + length]
+        offset += _align(length)
+    return attributes
+
+
+def _integer(payload):
+    """Decode an unsigned attribute of 32 or 64 bits"""
+    return int.from_bytes(payload, sys.byteorder)
+
+
+def _fields(names, layout, payload):
+    """Decode the `names` fields of a C structure of the given struct
+    `layout`, keeping only the ones present in `payload` so older
+    kernels with shorter structures are supported as well.
+    """
+    values = {}
+    offset = 0
+    for name, fmt in zip(names, layout.split()):
+        size = struct.calcsize('=' + fmt)
+        if offset + size > len(payload):
+            break
+        if name is not None:
+            values[name], = struct.unpack_from('=' + fmt, payload, offset)
+        offset += size
+    return values
+
+
+def _microseconds(statistics, *names):
+    for name in names:
+        if name in statistics:
+            statistics[name] /= 1000000
+    return statistics
+
+
+def codel_xstats(payload, is_class):
+    # struct tc_codel_xstats
+    statistics = _fields(
+            ('maxpacket', 'count', 'lastcount', 'ldelay', 'drop_next',
+             'drop_overlimit', 'ecn_mark', 'dropping', 'ce_mark'),
+            'I I I I i I I I I', payload)
+    return _microseconds(statistics, 'ldelay', 'drop_next')
+
+
+def fq_codel_xstats(payload, is_class):
+    # struct tc_fq_codel_xstats: a type followed by qdisc or class stats
+    kind, = struct.unpack_from('=I', payload)
+    if kind == 0:
+        return _fields(
+                ('maxpacket', 'drop_overlimit', 'ecn_mark', 'new_flow_count',
+                 'new_flows_len', 'old_flows_len', 'ce_mark', 'memory_usage',
+                 'drop_overmemory'),
+                'I I I I I I I I I', payload[4:])
+    statistics = _fields(
+            ('deficit', 'ldelay', 'count', 'lastcount', 'dropping', 'drop_next'),
+            'i I I I I i', payload[4:])
+    return _microseconds(statistics, 'ldelay', 'drop_next')
+
+
+def fq_xstats(payload, is_class):
+    # struct tc_fq_qd_stats
+    statistics = _fields(
+            ('gc_flows', 'highprio_packets', 'tcp_retrans', 'throttled',
+             'flows_plimit', 'pkts_too_long', 'allocation_errors', None,
+             'flows', 'inactive_flows', 'throttled_flows', 'unthrottle_latency',
+             'ce_mark', 'horizon_drops', 'horizon_caps', 'fastpath_packets'),
+            'Q Q Q Q Q Q Q q I I I I Q Q Q Q', payload)
+    if 'unthrottle_latency' in statistics:
+        statistics['unthrottle_latency'] /= 1000000000
+    return statistics
+
+
+def htb_xstats(payload, is_class):
+    # struct tc_htb_xstats, only provided for classes
+    if not is_class:
+        return {}
+    return _fields(('lends', 'borrows', 'giants', 'tokens', 'ctokens'), 'I I I i i', payload)
+
+
+def pie_xstats(payload, is_class):
+    # struct tc_pie_xstats, whose probability is 64 bits wide since Linux 5.1
+    names = ('prob', 'current_delay', 'avg_dq_rate', 'dq_rate_estimating',
+             'pkts_in', 'dropped', 'overlimit', 'maxq', 'ecn_mark')
+    if len(payload) >= 40:
+        statistics = _fields(names, 'Q I I I I I I I I', payload)
+        statistics['prob'] /= 2**64 - 1
     else:
-        return float(base)
+        statistics = _fields(names[:3] + names[4:], 'I I I I I I I I', payload)
+        statistics['prob'] /= 2**32 - 1
+    return _microseconds(statistics, 'current_delay')
 
 
-BRACKETS = re.compile(r'[\[\]]')
+CAKE_STATISTICS = {
+        # Attributes nested in TCA_STATS_APP (see TCA_CAKE_STATS_* in linux/pkt_sched.h)
+        2: 'capacity_estimate',
+        3: 'memory_limit',
+        4: 'memory_used',
+        5: 'avg_netoff',
+}
+CAKE_TIN_STATISTICS_ID = 10
+CAKE_TIN_STATISTICS = {
+        # Attributes nested in each tin (see TCA_CAKE_TIN_STATS_* in linux/pkt_sched.h)
+        2: 'sent_packets',
+        3: 'sent_bytes',
+        4: 'dropped_packets',
+        5: 'dropped_bytes',
+        6: 'acks_dropped_packets',
+        8: 'ecn_marked_packets',
+        10: 'backlog_packets',
+        11: 'backlog_bytes',
+        12: 'threshold_rate',
+        13: 'target',
+        14: 'interval',
+        18: 'peak_delay',
+        19: 'avg_delay',
+        20: 'base_delay',
+        21: 'sparse_flows',
+        22: 'bulk_flows',
+        23: 'unresponsive_flows',
+}
+CAKE_TIN_DELAYS = ('target', 'interval', 'peak_delay', 'avg_delay', 'base_delay')
 
 
-def send_stats(line, last_sent, current_node, collect_agent, interval_stats):
-    statistics = {}
+def cake_xstats(payload, is_class):
+    attributes = parse_attributes(payload)
+    statistics = {
+            name: _integer(attributes[kind])
+            for kind, name in CAKE_STATISTICS.items()
+            if kind in attributes
+    }
+    tins = parse_attributes(attributes.get(CAKE_TIN_STATISTICS_ID, b''))
+    for index, tin in tins.items():
+        tin_attributes = parse_attributes(tin)
+        tin_statistics = {
+                name: _integer(tin_attributes[kind])
+                for kind, name in CAKE_TIN_STATISTICS.items()
+                if kind in tin_attributes
+        }
+        _microseconds(tin_statistics, *CAKE_TIN_DELAYS)
+        for name, value in tin_statistics.items():
+            statistics['tin{}_{}'.format(index - 1, name)] = value
+    return statistics
 
-    try:
-        #General stats
-        ind = line.index('Sent')
-        statistics['throughput'] = (8*convert(line[ind+1]) - last_sent[current_node])/interval_stats
-        last_sent[current_node] = 8*convert(line[ind+1])
-        statistics['cumulated_sent_bits'] = 8*convert(line[ind+1])
-        statistics['cumulated_sent_packets'] = convert(line[ind+3])
-        ind = line.index('(dropped')
-        statistics['cumulated_dropped_packets'] = convert(line[ind+1][:-1])
-        ind = line.index('backlog')
-        statistics['backlog_bits'] = 8*convert(line[ind+1][:-1])
-        statistics['backlog_pkts'] = 8*convert(line[ind+2][:-1])
-
-        # CoDel stats
-        if "codel" in line:
-            ind = line.index('count')
-            statistics['codel_count'] = convert(line[ind+1])
-            ind = line.index('lastcount')
-            statistics['codel_lastcount'] = convert(line[ind+1])
-            ind = line.index('ldelay')
-            statistics['codel_ldelay'] = convert(line[ind+1][:-1])
-            ind = line.index('drop_next')
-            statistics['codel_drop_next'] = convert(line[ind+1][:-1])
-            ind = line.index('maxpacket')
-            statistics['codel_maxpacket'] = convert(line[ind+1])
-
-        # pie stats
-        if "pie" in line:
-            ind = line.index('prob')
-            statistics['pie_prob'] = convert(line[ind+1])
-            ind = line.index('delay')
-            statistics['pie_current_delay'] = convert(line[ind+1][:-1])
-            if "avg_dq_rate" in line:
-                ind = line.index('avg_dq_rate')
-                statistics['pie_avg_dq_rate'] = convert(line[ind+1])
-            ind = line.index('pkts_in')
-            statistics['pie_pkts_in'] = convert(line[ind+1])
-            ind = line.index('dropped')
-            statistics['pie_dropped'] = convert(line[ind+1])
-            ind = line.index('maxq')
-            statistics['pie_maxq'] = convert(line[ind+1])
 
+# Decoders of the extended statistics of each kind of node, whose
+# results are prefixed by the kind name. tbf and netem (or any other
+# kind) do not provide extended statistics and only get generic ones.
+XSTATS_DECODERS = {
+        'codel': codel_xstats,
+        'fq_codel': fq_codel_xstats,
+        'fq': fq_xstats,
+        'htb': htb_xstats,
+        'pie': pie_xstats,
+        'cake': cake_xstats,
+}
+
+
+def parse_handle(handle):
+    """Convert a tc handle such as '1:' or '1:10' to its numerical value"""
+    major, _, minor = handle.partition(':')
+    return (int(major, 16) << 16) | int(minor or '0', 16)
+
+
+class TrafficControlStatistics:
+    """Dump the statistics of qdiscs and classes of an interface using
+    a rtnetlink socket opened once, and decode them structurally.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.index = socket.if_nametoindex(interface)
+        self.socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self.socket.bind((0, 0))
+        self.buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        self.sequence = 0
+
+    def close(self):
+        self.socket.close()
+
+    def dump(self, message_type):
+        """Yield the payload of the messages answering a dump request of
+        the given type for the interface.
+        """
+        self.sequence += 1
+        request = NLMSGHDR.pack(
+                NLMSGHDR.size + TCMSG.size, message_type,
+                NLM_F_REQUEST | NLM_F_DUMP, self.sequence, 0)
+        request += TCMSG.pack(socket.AF_UNSPEC, self.index, 0, 0, 0)
+        self.socket.send(request)
+
+        buffer = self.buffer
+        view = memoryview(buffer)
+        while True:
+            received = self.socket.recv_into(buffer)
+            offset = 0
+            while offset + NLMSGHDR.size <= received:
+                length, kind, flags, sequence, pid = NLMSGHDR.unpack_from(buffer, offset)
+                if length < NLMSGHDR.size:
+                    return
+                payload = view[offset + NLMSGHDR.size:offset + length]
+                offset += _align(length)
+                if sequence != self.sequence:
+                    continue
+                if kind == NLMSG_DONE:
+                    return
+                if kind == NLMSG_ERROR:
+                    error, = NLMSGERR.unpack_from(payload)
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    continue
+                yield bytes(payload)
+
+    def nodes(self, classes=False):
+        """Yield the handle, kind and statistics of every qdisc (or class)
+        of the interface.
+        """
+        message_type = RTM_GETTCLASS if classes else RTM_GETQDISC
+        for message in self.dump(message_type):
+            family, index, handle, parent, info = TCMSG.unpack_from(message)
+            if index != self.index:
+                # Qdiscs dumps hold every interface
+                continue
+            attributes = parse_attributes(message, TCMSG.size)
+            kind = attributes.get(TCA_KIND, b'').rstrip(b'\0').decode()
+            yield handle, kind, self.decode(kind, attributes, classes)
+
+    @staticmethod
+    def decode(kind, attributes, is_class):
+        statistics = {}
+        stats = parse_attributes(attributes.get(TCA_STATS2, b''))
+
+        basic = stats.get(TCA_STATS_BASIC)
+        if basic is not None:
+            sent_bytes, sent_packets = GNET_STATS_BASIC.unpack_from(basic)
+            if TCA_STATS_PKT64 in stats:
+                sent_packets = _integer(stats[TCA_STATS_PKT64])
+            statistics['cumulated_sent_bits'] = 8 * sent_bytes
+            statistics['cumulated_sent_packets'] = sent_packets
+
+        queue = stats.get(TCA_STATS_QUEUE)
+        if queue is not None:
+            qlen, backlog, drops, requeues, overlimits = GNET_STATS_QUEUE.unpack_from(queue)
+            statistics['cumulated_dropped_packets'] = drops
+            statistics['cumulated_overlimits'] = overlimits
+            statistics['cumulated_requeues'] = requeues
+            statistics['backlog_bits'] = 8 * backlog
+            statistics['backlog_pkts'] = qlen
+
+        decoder = XSTATS_DECODERS.get(kind)
+        xstats = stats.get(TCA_STATS_APP, attributes.get(TCA_XSTATS))
+        if decoder is not None and xstats:
+            try:
+                extended = decoder(xstats, is_class)
+            except struct.error as e:
+                message = 'Cannot parse {} statistics: {}'.format(kind, e)
+                collect_agent.send_log(syslog.LOG_WARNING, message)
+            else:
+                for name, value in extended.items():
+                    statistics['{}_{}'.format(kind, name)] = value
+
+        return statistics
+
+
+def main(interface, qdisc_nodes, interval_stats):
+    try:
+        handles = {parse_handle(node): node for node in qdisc_nodes}
     except ValueError as e:
-        message = "Cannot parse statistics: {}".format(e)
+        message = 'Invalid qdisc node: {}'.format(e)
         collect_agent.send_log(syslog.LOG_ERR, message)
-        print("Cannot parse statistics:", e)
         sys.exit(message)
 
-    collect_agent.send_stat(collect_agent.now(), suffix=current_node, **statistics)
+    try:
+        collector = TrafficControlStatistics(interface)
+    except OSError as e:
+        message = 'Cannot monitor interface {}: {}'.format(interface, e)
+        collect_agent.send_log(syslog.LOG_ERR, message)
+        sys.exit(message)
 
+    # Classes are only dumped if some nodes may be classes
+    dump_classes = any(handle & 0xffff for handle in handles)
+    last_sent = {}
+    for _, missed_deadlines in PeriodicSampler(interval_stats):
+        timestamp = collect_agent.now()
+        monotonic = time.monotonic()
+        try:
+            nodes = list(collector.nodes())
+            if dump_classes:
+                nodes.extend(collector.nodes(classes=True))
+        except OSError as e:
+            message = 'Cannot dump statistics of interface {}: {}'.format(interface, e)
+            collect_agent.send_log(syslog.LOG_ERR, message)
+            sys.exit(message)
 
-def main(interface, qdisc_nodes, interval_stats):
-    cmd = ['stdbuf', '-oL', 'tc', '-s', 'qdisc', 'show', 'dev', interface]
-    last_sent = {qdisc_node:0 for qdisc_node in qdisc_nodes}
-    read_this_line = False
-    while True:
-        line_read = []
-        current_node = -1
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-        for line in p.communicate()[0].decode().split("\n"):
-            tokens = BRACKETS.sub('', line).split()
-            if not tokens:
+        for handle, kind, statistics in nodes:
+            if handle not in handles:
                 continue
-            if tokens[0] == 'qdisc':
-                read_this_line = False
-                if line_read:
-                    send_stats(line_read, last_sent, current_node, collect_agent, interval_stats)
-                    line_read = []
-            if tokens[2] in qdisc_nodes:
-                current_node = tokens[2]
-                read_this_line = True
-            if read_this_line:
-                line_read += tokens
-        if line_read:
-            send_stats(line_read, last_sent, current_node, collect_agent, interval_stats)
-        time.sleep(interval_stats)
-
-    p.wait()
+            node = handles[handle]
+            sent = statistics.get('cumulated_sent_bits', 0)
+            if node in last_sent:
+                last_bits, last_time = last_sent[node]
+                elapsed = monotonic - last_time
+                statistics['throughput'] = (sent - last_bits) / elapsed if elapsed else 0.0
+            else:
+                statistics['throughput'] = sent / interval_stats
+            last_sent[node] = (sent, monotonic)
+            collect_agent.send_stat(timestamp, suffix=node, **statistics)
+
+        if missed_deadlines:
+            collect_agent.send_stat(timestamp, missed_deadlines=missed_deadlines)
 
 
 if __name__ == "__main__":
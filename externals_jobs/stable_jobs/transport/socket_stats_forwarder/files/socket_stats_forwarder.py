@@ -36,25 +36,203 @@ __credits__ = '''Contributors:
 
 import re
 import sys
+import json
 import signal
 import socket
+import select
 import syslog
 import argparse
 from functools import partial
 
 import collect_agent
+from job_helpers import StatisticsAggregator
 
 
-def signal_term_handler(udp_socket, signal, frame):
+BATCH_SIZE = 256  # Maximal amount of pending datagrams processed at once
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024  # Socket buffer requested to absorb bursts
+KEY_VALUE = re.compile(r'([^\s=,;]+)\s*=\s*([^\s,;]+)')
+BACKREFERENCE = re.compile(r'\\[1-9]')
+DEFAULT_FLAGS = re.compile('').flags
+
+
+def signal_term_handler(udp_socket, aggregator, signal, frame):
     message = 'Stoping job socket_stats_forwarder.'
     collect_agent.send_log(syslog.LOG_DEBUG, message)
     udp_socket.close()
+    aggregator.flush()
     sys.exit(message)
 
 
+def _combinable(pattern):
+    """Tell whether a pattern only matches at the start of a payload
+    and keeps its meaning inside an alternation: anchored, without
+    alternatives, backreferences or flags.
+    """
+    regexp = pattern.pattern
+    return (
+            regexp.startswith(('^', r'\A'))
+            and '|' not in regexp
+            and not BACKREFERENCE.search(regexp)
+            and pattern.flags == DEFAULT_FLAGS)
+
+
+class RegexpParser:
+    """Extract statistics from a payload using the first of several
+    regular expressions that matches it.
+
+    Patterns are compiled once and tried in the order they are given.
+    When they are all anchored at the start of the payload, they can
+    only match there, so they are combined into a single alternation
+    that gives the same result while trying them in one pass. Each
+    pattern is wrapped into a group whose index tells which pattern
+    matched and where its own groups are.
+    """
+
+    def __init__(self, stats):
+        self.patterns = []
+        for names, regexp in stats:
+            try:
+                pattern = re.compile(regexp)
+            except re.error as e:
+                raise ValueError('invalid regular expression {!r}: {}'.format(regexp, e))
+            names = tuple(name.strip() for name in names.split(','))
+            if len(names) != pattern.groups:
+                raise ValueError(
+                        'regular expression {!r} does not match '
+                        'with statistics names {}'.format(regexp, names))
+            self.patterns.append((pattern, names))
+
+        self.combined = None
+        if len(self.patterns) > 1 and all(_combinable(pattern) for pattern, _ in self.patterns):
+            offsets = []
+            offset = 1
+            for pattern, names in self.patterns:
+                offsets.append((offset, names))
+                offset += pattern.groups + 1
+            try:
+                combined = re.compile('|'.join('({})'.format(regexp) for _, regexp in stats))
+            except re.error:
+                # Duplicate group names can not be combined
+                pass
+            else:
+                if combined.groups == offset - 1:
+                    self.combined = combined
+                    self.offsets = offsets
+
+    def __call__(self, payload):
+        if self.combined is None:
+            for pattern, names in self.patterns:
+                match = pattern.search(payload)
+                if match:
+                    return dict(zip(names, map(float, match.groups())))
+            return None
+
+        match = self.combined.search(payload)
+        if match is None:
+            return None
+        groups = match.groups()
+        for offset, names in self.offsets:
+            if groups[offset - 1] is not None:
+                return dict(zip(names, map(float, groups[offset:offset + len(names)])))
+
+
+def parse_key_values(payload):
+    """Extract statistics from a payload made of name=value pairs
+    separated by spaces, commas or semicolons; non numerical values
+    are ignored.
+    """
+    statistics = {}
+    for name, value in KEY_VALUE.findall(payload):
+        try:
+            statistics[name] = float(value)
+        except ValueError:
+            pass
+    return statistics or None
+
+
+def parse_json(payload):
+    """Extract statistics from a payload made of a JSON object; non
+    numerical values are ignored.
+    """
+    try:
+        content = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(content, dict):
+        return None
+    statistics = {
+            name: value for name, value in content.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+    return statistics or None
+
+
+def receive_batches(udp_socket, buffersize, timeout=None, batch_size=BATCH_SIZE):
+    """Yield lists of the datagrams pending on the socket, waiting
+    for at least one, so bursts are drained without going through the
+    processing loop for each datagram. An empty list is yielded if
+    nothing was received within `timeout` seconds.
+    """
+    recv = udp_socket.recv
+    while True:
+        if timeout is not None:
+            readable, _, _ = select.select([udp_socket], [], [], timeout)
+            if not readable:
+                yield []
+                continue
+        batch = [recv(buffersize)]
+        try:
+            while len(batch) < batch_size:
+                batch.append(recv(buffersize, socket.MSG_DONTWAIT))
+        except BlockingIOError:
+            pass
+        yield batch
+
+
+def forward(udp_socket, parse, buffersize, aggregator):
+    """Parse each datagram received on the socket and send the
+    statistics it holds through the aggregator.
+    """
+    now = collect_agent.now
+    # Wake up to send the last window when datagrams stop arriving
+    timeout = aggregator.window / 1000 if aggregator.window else None
+
+    for batch in receive_batches(udp_socket, buffersize, timeout):
+        timestamp = now()
+        for data in batch:
+            statistics = parse(data.decode(errors='replace'))
+            if statistics:
+                if not aggregator.window:
+                    # Statistics sent as is must not share the timestamp
+                    # of the batch or the collector keeps only one of them
+                    timestamp = now()
+                aggregator(timestamp, **statistics)
+            else:
+                message = 'WARNING : no one regular expression match with data entry'
+                collect_agent.send_log(syslog.LOG_WARNING, message)
+        aggregator.expire(timestamp)
+
+
 def main(args):
+    if args.format == 'json':
+        parse = parse_json
+    elif args.format == 'keyvalue':
+        parse = parse_key_values
+    else:
+        if not args.stats:
+            message = 'ERROR : at least one pair of statistics names and regular expression is required'
+            collect_agent.send_log(syslog.LOG_ERR, message)
+            sys.exit(message)
+        try:
+            parse = RegexpParser(args.stats)
+        except ValueError as e:
+            message = 'ERROR : {}'.format(e)
+            collect_agent.send_log(syslog.LOG_ERR, message)
+            sys.exit(message)
+
     # Bind UDP socket
     udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
     try:
         udp_socket.bind((args.address, args.port))
     except OSError:
@@ -62,31 +240,13 @@ def main(args):
         collect_agent.send_log(syslog.LOG_ERR, message)
         sys.exit(message)
 
-    signal.signal(signal.SIGTERM, partial(signal_term_handler, udp_socket))
-    signal.signal(signal.SIGINT, partial(signal_term_handler, udp_socket))
+    aggregator = StatisticsAggregator(args.window)
+
+    signal.signal(signal.SIGTERM, partial(signal_term_handler, udp_socket, aggregator))
+    signal.signal(signal.SIGINT, partial(signal_term_handler, udp_socket, aggregator))
 
     # Receive and process data
-    while True:
-        data, _ = udp_socket.recvfrom(args.buffersize)
-        for index, pair in enumerate(args.stats):
-            match = re.search(pair[1], data.decode())
-            if match:
-                stats = dict()
-                stats_names = pair[0].split(',')
-                stats_values = match.groups()
-                if len(stats_names) != len(stats_values):
-                    message = 'ERROR : regular expression {} does not match with statistics names {}'.format(regexp, stats_names)
-                    collect_agent.send_log(syslog.LOG_ERR, message)
-                    sys.exit(message)
- 
-                for index, name in enumerate(stats_names):
-                    stats[name] = float(stats_values[index])
-                collect_agent.send_stat(collect_agent.now(), **stats)
-                break
-
-            if pair == args.stats[-1]:
-                message = 'WARNING : no one regular expression match with data entry'
-                collect_agent.send_log(syslog.LOG_WARNING, message)
+    forward(udp_socket, parse, args.buffersize, aggregator)
 
 
 if __name__ == "__main__":
@@ -105,8 +265,16 @@ if __name__ == "__main__":
             help='Buffer size for data reception')
         parser.add_argument(
             '-s', '--stats', nargs=2, metavar=('NAMES', 'REGEXPS'), type=str,
-            required=True, action='append',
+            action='append', default=[],
             help='A comma-separated list of the stats names followed by the corresponding regexp')
+        parser.add_argument(
+            '-f', '--format', choices=['regexp', 'keyvalue', 'json'], default='regexp',
+            help='Format of the datagrams: parsed using the --stats regexps, or made '
+            'of name=value pairs or of a JSON object whose names are used as stats names')
+        parser.add_argument(
+            '-w', '--window', type=float, default=0,
+            help='Send, instead of each statistic, their count, min, max, mean and '
+            'percentiles over windows of this duration in seconds (0 to disable)')
     
         args = parser.parse_args()
         main(args)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# OpenBACH is a generic testbed able to control/configure multiple
+# network/physical entities (under test) and collect data from them. It is
+# composed of an Auditorium (HMIs), a Controller, a Collector and multiple
+# Agents (one for each network entity that wants to be tested).
+#
+#
+# Copyright © 2016-2023 CNES
+#
+#
+# This file is part of the OpenBACH testbed.
+#
+#
+# OpenBACH is a free software : you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY, without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+
+"""Throughput benchmark of the Job socket_stats_forwarder.
+
+A local generator process sends datagrams as fast as possible to a UDP
+socket whose datagrams are parsed by the job parsers (statistics are
+counted instead of being sent to the collector). The amount of datagrams
+processed per second and the ones lost are shown for the regexp parser,
+the structured formats and the previous implementation, once the regexp
+parser is checked to pick patterns in the same order. Run it on an
+agent, next to the job sources:
+`python3 socket_stats_forwarder_benchmark.py -n 200000`.
+"""
+
+
+import re
+import time
+import socket
+import argparse
+import multiprocessing
+
+from socket_stats_forwarder import (
+        RECEIVE_BUFFER_SIZE, RegexpParser,
+        parse_key_values, parse_json, receive_batches)
+
+
+STATS = [
+        ('id,rtt', r'id : ([0-9]+)  rtt : ([0-9.]+) ms'),
+        ('id,rate', r'id : ([0-9]+)  rate : ([0-9.]+) mbps'),
+        ('id,loss', r'id : ([0-9]+)  loss : ([0-9.]+) %'),
+]
+ORDER_CHECKS = [
+        # The first pattern given wins, wherever the others match
+        ([('a', r'x=(\d+)'), ('b', r'y=(\d+)')], 'y=1 x=2', {'a': 2.0}),
+        ([('a', r'^y=(\d+) z'), ('b', r'^y=(\d+)')], 'y=1 x=2', {'b': 1.0}),
+        ([('a', r'^y=(\d+)'), ('b,c', r'^y=(\d+) x=(\d+)')], 'y=1 x=2', {'a': 1.0}),
+        ([('a', r'^x=(\d+)'), ('b', r'y=(\d+)')], 'y=1 x=2', {'b': 1.0}),
+]
+PAYLOADS = {
+        'regexp': 'id : {}  loss : 0.5 %',
+        'keyvalue': 'id={} rtt=12.5 rate=42',
+        'json': '{{"id": {}, "rtt": 12.5, "rate": 42}}',
+}
+
+
+def generate(address, payload, count):
+    """Send `count` datagrams holding `payload` as fast as possible"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(address)
+    for index in range(count):
+        sock.send(payload.format(index).encode())
+
+
+def legacy(udp_socket, buffersize):
+    """Reception and parsing of the previous implementation"""
+    while True:
+        data, _ = udp_socket.recvfrom(buffersize)
+        for names, regexp in STATS:
+            match = re.search(regexp, data.decode())
+            if match:
+                stats_names = names.split(',')
+                stats_values = match.groups()
+                yield {name: float(value) for name, value in zip(stats_names, stats_values)}
+                break
+
+
+def check():
+    """Make sure the parsers give the results of the previous
+    implementation before comparing their throughput.
+    """
+    for stats, payload, expected in ORDER_CHECKS:
+        statistics = RegexpParser(stats)(payload)
+        if statistics != expected:
+            raise AssertionError(
+                    'patterns {} gave {} instead of {} on {!r}'
+                    .format(stats, statistics, expected, payload))
+
+
+def batched(parse):
+    def process(udp_socket, buffersize):
+        for batch in receive_batches(udp_socket, buffersize):
+            for data in batch:
+                yield parse(data.decode(errors='replace'))
+    return process
+
+
+def measure(process, payload, count):
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+    udp_socket.bind(('127.0.0.1', 0))
+    udp_socket.settimeout(1)
+
+    generator = multiprocessing.Process(
+            target=generate, args=(udp_socket.getsockname(), payload, count))
+    generator.start()
+    processed = 0
+    start = end = time.perf_counter()
+    try:
+        for statistics in process(udp_socket, 1024):
+            if statistics:
+                processed += 1
+            end = time.perf_counter()
+    except socket.timeout:
+        pass
+    generator.join()
+    udp_socket.close()
+    elapsed = end - start
+    return processed, processed / elapsed if elapsed else 0.0
+
+
+def main(count):
+    check()
+    methods = [
+            ('legacy', legacy, 'regexp'),
+            ('regexp', batched(RegexpParser(STATS)), 'regexp'),
+            ('keyvalue', batched(parse_key_values), 'keyvalue'),
+            ('json', batched(parse_json), 'json'),
+    ]
+    print('{:<10} {:>12} {:>12} {:>16}'.format('method', 'processed', 'lost', 'datagrams/s'))
+    for name, process, payload in methods:
+        processed, rate = measure(process, PAYLOADS[payload], count)
+        print('{:<10} {:>12} {:>12} {:>16.0f}'.format(name, processed, count - processed, rate))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--count', type=int, default=100000, help='Amount of datagrams to send per method.')
+    args = parser.parse_args()
+    main(args.count)
@@ -59,6 +59,7 @@ from pathlib import Path
 from random import sample
 from collections import Counter
 
+import requests
 from requests.compat import json
 
 CWD = Path(__file__).resolve().parent
@@ -71,7 +72,7 @@ from auditorium_scripts.list_installed_jobs import ListInstalledJobs
 from auditorium_scripts.list_jobs import ListJobs
 from auditorium_scripts.list_projects import ListProjects
 from auditorium_scripts.list_job_instances import ListJobInstances
-from auditorium_scripts.install_agent import InstallAgent
+from auditorium_scripts.install_agent import InstallAgent, install_agents
 from auditorium_scripts.uninstall_agent import UninstallAgent
 from auditorium_scripts.add_collector import AddCollector
 from auditorium_scripts.assign_collector import AssignCollector
@@ -254,7 +255,7 @@ def setup_logging(
             logger.warning(warning)
 
 
-def _verify_response(response):
+def _verify_response(response, decode=True):
     logger = logging.getLogger(__name__)
     try:
         response.raise_for_status()
@@ -263,13 +264,15 @@ def _verify_response(response):
         return DummyResponse()
     else:
         logger.info('Done')
+        if not decode:
+            return response
         try:
             return response.json()
         except (AttributeError, json.JSONDecodeError):
             return DummyResponse()
 
 
-def execute(openbach_function):
+def execute(openbach_function, decode=True):
     logger = logging.getLogger(__name__)
     logger.info(
             'Starting OpenBACH function %s',
@@ -288,9 +291,9 @@ def execute(openbach_function):
         return DummyResponse()
 
     if isinstance(response, list):
-        return [_verify_response(r) for r in response]
+        return [_verify_response(r, decode) for r in response]
     else:
-        return _verify_response(response)
+        return _verify_response(response, decode)
 
 
 def main(argv=None):
@@ -387,26 +390,30 @@ def main(argv=None):
     install_agent.args.reattach = False
     install_agent.args.user = install_user
     install_agent.args.password = install_password
+
+    agents_to_install = []
     for address, agent in free_agents.items():
-        install_agent.args.agent_address = address
-        install_agent.args.collector_address = agent['collector']
-        install_agent.args.agent_name = agent['name']
-        execute(install_agent)
+        agents_to_install.append((address, agent['collector'], agent['name']))
         installed_agents[address] = agent['name']
 
     index = 0
-    install_agent.args.collector_address = selected_collector
     for address in new_agents:
         while True:
             name = 'ValidationSuite{}'.format(index)
             index += 1
             if name not in existing_names:
                 break
-        install_agent.args.agent_address = address
-        install_agent.args.agent_name = name
-        execute(install_agent)
+        agents_to_install.append((address, selected_collector, name))
         installed_agents[address] = name
 
+    logger.info('Installing %d agents concurrently', len(agents_to_install))
+    try:
+        install_agents(validator, agents_to_install, install_user, install_password, show_response_content=False)
+    except (ActionFailedError, requests.RequestException):
+        logger.critical('Something went wrong', exc_info=True)
+    else:
+        logger.info('Done')
+
     # Find an agent without collector
     collector_candidates = {
             agent
@@ -694,10 +701,11 @@ def main(argv=None):
     # Get scenario instance data
     scenario_data = validator.share_state(GetScenarioInstanceData)
     scenario_data.args.file = []
-    scenario_data.args.scenario_instance_id = stops_itself_id
+    scenario_data.args.scenario_instance_id = [stops_itself_id]
     with tempfile.TemporaryDirectory() as tempdir:
         scenario_data.args.path = Path(tempdir)
-        execute(scenario_data)
+        # Archives are streamed to disk, leaving no content to decode
+        execute(scenario_data, decode=False)
 
     # Remove scenarios
     remove_scenario = validator.share_state(DeleteScenario)
@@ -1007,14 +1015,17 @@ def main(argv=None):
         uninstall.args.agent_address = address
         execute(uninstall)
 
-    # Reinstall existing free agents
-    for address, agent in free_agents.items():
-        install_agent.args.agent_address = address
-        install_agent.args.collector_address = agent['collector']
-        install_agent.args.agent_name = agent['name']
-        execute(install_agent)
-        install_jobs.args.job_name = [agent['jobs']]
-        install_jobs.args.agent_address = [[address]]
+    # Reinstall existing free agents, then their jobs
+    try:
+        install_agents(
+                validator,
+                [(address, agent['collector'], agent['name']) for address, agent in free_agents.items()],
+                install_user, install_password, show_response_content=False)
+    except (ActionFailedError, requests.RequestException):
+        logger.critical('Something went wrong', exc_info=True)
+    if free_agents:
+        install_jobs.args.job_name = [agent['jobs'] for agent in free_agents.values()]
+        install_jobs.args.agent_address = [[address] for address in free_agents]
         execute(install_jobs)
 
 
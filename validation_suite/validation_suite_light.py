@@ -266,7 +266,7 @@ def setup_logging(
             logger.warning(warning)
 
 
-def _verify_response(response):
+def _verify_response(response, decode=True):
     logger = logging.getLogger(__name__)
     try:
         response.raise_for_status()
@@ -275,13 +275,15 @@ def _verify_response(response):
         return DummyResponse()
     else:
         logger.info('Done')
+        if not decode:
+            return response
         try:
             return response.json()
         except (AttributeError, json.JSONDecodeError):
             return DummyResponse()
 
 
-def execute(openbach_function):
+def execute(openbach_function, decode=True):
     logger = logging.getLogger(__name__)
     logger.info(
             'Starting OpenBACH function %s',
@@ -300,9 +302,9 @@ def execute(openbach_function):
         return DummyResponse()
 
     if isinstance(response, list):
-        return [_verify_response(r) for r in response]
+        return [_verify_response(r, decode) for r in response]
     else:
-        return _verify_response(response)
+        return _verify_response(response, decode)
 
 
 def main(argv=None):
@@ -657,10 +659,11 @@ def main(argv=None):
     # Get scenario instance data
     scenario_data = validator.share_state(GetScenarioInstanceData)
     scenario_data.args.file = []
-    scenario_data.args.scenario_instance_id = stops_itself_id
+    scenario_data.args.scenario_instance_id = [stops_itself_id]
     with tempfile.TemporaryDirectory() as tempdir:
         scenario_data.args.path = Path(tempdir)
-        execute(scenario_data)
+        # Archives are streamed to disk, leaving no content to decode
+        execute(scenario_data, decode=False)
 
     # Start job instance times X
     job_name = 'fping'